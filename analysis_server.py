@@ -0,0 +1,532 @@
+import io
+import json
+import os
+import queue
+import socketserver
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+from PIL import Image
+
+import color_batch
+import image_analyzer as ia
+import image_context
+import instrumentation
+from feature_cache import _to_json
+from features import structural_config
+from image_context import ImageContext
+from instrumentation import image_scope
+
+# Helyi elemző szolgáltatás: egy hosszan futó folyamat, amelyben a modell és a nehéz
+# importok (skimage, PIL, NumPy) egyszer töltődnek be. HTTP a localhoston vagy Unix
+# socketen; a kérés képbájtokat vagy útvonalat ad, a válasz a read_exif sora JSON-ként.
+#
+# A képek elemzése (EXIF, szín, strukturális jellemzők) workerekben fut, az RF becslés
+# a szolgáltatás folyamatában: az egyidejű kérések jellemzői egy közös predict_proba
+# hívásba kerülnek (mikroköteg, MicroBatcher). A befogadott, még nem kész kérések száma
+# korlátos (queue_depth); telítettségnél a kérés azonnal 503-at kap (reject) vagy
+# legfeljebb a kérés időkorlátjáig vár a helyre (wait).
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_QUEUE_DEPTH = 64
+DEFAULT_TIMEOUT_S = 30.0
+DEFAULT_BATCH_WAIT_MS = 5.0
+DEFAULT_MAX_UPLOAD_MB = 64
+BACKPRESSURE_MODES = ("reject", "wait")
+# A késleltetés-percentilisek ennyi legutóbbi kérésből számolódnak
+STATS_WINDOW = 10_000
+DISCARD_CHUNK = 64 << 10  # az elutasított kérés törzse ekkora darabokban olvasódik el
+STATS_PERCENTILES = (50, 90, 95, 99)
+
+
+def _upload_name(data, name=None):
+    # Fájlnév a feltöltött bájtokhoz; a kiterjesztés számít (JPEG -> EXIF olvasás)
+    if name:
+        return os.path.basename(name)
+    if data[:2] == b"\xff\xd8":
+        return "upload.jpg"
+    if data[:8] == b"\x89PNG\r\n\x1a\n":
+        return "upload.png"
+    return "upload"
+
+
+def _extract_task(task):
+    # Workerben fut: egy kép sora és RF jellemzői (kategória nélkül), az elemzés idejével
+    path, data, name = task
+    t0 = time.perf_counter()
+    ctx = ImageContext(path) if data is None else ImageContext(name, data=data)
+    with image_scope(ctx.path):
+        info, feats = ia.analyze_image_row(ctx, categorize=False)
+    return info, feats, time.perf_counter() - t0
+
+
+class LatencyStats:
+    # Szakaszonkénti késleltetések (ms) és RF kötegméretek az utolsó STATS_WINDOW
+    # mintából, valamint számlálók
+
+    def __init__(self, window=STATS_WINDOW):
+        self.window = window
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._samples = {}
+        self._batch_sizes = deque(maxlen=window)
+        self._counters = {}
+
+    def record(self, stage, seconds):
+        with self._lock:
+            samples = self._samples.get(stage)
+            if samples is None:
+                samples = self._samples[stage] = deque(maxlen=self.window)
+            samples.append(seconds * 1000.0)
+
+    def record_batch(self, size):
+        with self._lock:
+            self._batch_sizes.append(size)
+
+    def count(self, name, n=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+            self._batch_sizes.clear()
+            self._counters.clear()
+            self.started = time.time()
+
+    def summary(self):
+        with self._lock:
+            samples = {stage: np.array(values) for stage, values in self._samples.items()}
+            sizes = np.array(self._batch_sizes)
+            counters = dict(self._counters)
+        latency = {}
+        for stage, values in samples.items():
+            if not len(values):
+                continue
+            entry = {"count": len(values), "mean": round(float(values.mean()), 3)}
+            for q, value in zip(STATS_PERCENTILES, np.percentile(values, STATS_PERCENTILES)):
+                entry[f"p{q}"] = round(float(value), 3)
+            entry["max"] = round(float(values.max()), 3)
+            latency[stage] = entry
+        batch_size = {}
+        if len(sizes):
+            batch_size = {"count": len(sizes), "mean": round(float(sizes.mean()), 2), "max": int(sizes.max())}
+        return {
+            "uptime_s": round(time.time() - self.started, 1),
+            "counters": counters,
+            "latency_ms": latency,
+            "batch_size": batch_size,
+        }
+
+
+class MicroBatcher:
+    # Az elemzett képek RF becslése közös kötegekben, saját szálon. Egy köteg akkor indul,
+    # ha max_batch kép összegyűlt, ha a legrégebbi kép wait_ms óta vár, vagy ha nincs több
+    # elemzés alatt álló kérés (ilyenkor nem érdemes várni).
+
+    def __init__(self, max_batch=ia.RF_BATCH_SIZE, wait_ms=DEFAULT_BATCH_WAIT_MS, stats=None, pending=None):
+        self.max_batch = max(1, max_batch)
+        self.wait_s = max(0.0, wait_ms) / 1000.0
+        self.stats = stats
+        self._pending = pending or (lambda: 0)
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="rf-microbatch", daemon=True)
+        self._thread.start()
+
+    def submit(self, row, feats, future):
+        # A future a kategóriával kitöltött sort kapja
+        self._queue.put((row, feats, future))
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _collect(self, first):
+        batch = [first]
+        deadline = time.perf_counter() + self.wait_s
+        while len(batch) < self.max_batch:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0 or not self._pending():
+                    break
+                try:
+                    item = self._queue.get(timeout=min(remaining, 0.001))
+                except queue.Empty:
+                    continue
+            if item is None:
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = self._collect(first)
+            t0 = time.perf_counter()
+            ia.fill_rf_categories([(row, feats) for row, feats, _ in batch])
+            if self.stats is not None:
+                self.stats.record("rf_koteg", time.perf_counter() - t0)
+                self.stats.record_batch(len(batch))
+            for row, _, future in batch:
+                if not future.done():
+                    future.set_result(row)
+
+
+class Overloaded(Exception):
+    pass
+
+
+class AnalysisService:
+    # A kérések feldolgozása: befogadás (queue_depth korlát), elemzés a worker
+    # folyamatokban, RF becslés mikrokötegben. workers=0 esetén az elemzés a kérést
+    # kiszolgáló szálon fut (nincs külön folyamat).
+
+    def __init__(self, workers=1, queue_depth=DEFAULT_QUEUE_DEPTH, timeout_s=DEFAULT_TIMEOUT_S,
+                 backpressure="reject", batch_wait_ms=DEFAULT_BATCH_WAIT_MS, max_batch=ia.RF_BATCH_SIZE,
+                 allow_paths=True):
+        if backpressure not in BACKPRESSURE_MODES:
+            raise ValueError(f"Ismeretlen backpressure mód: {backpressure} "
+                             f"(lehetséges: {', '.join(BACKPRESSURE_MODES)})")
+        if queue_depth < 1:
+            raise ValueError(f"Érvénytelen sormélység: {queue_depth}")
+        self.workers = workers
+        self.queue_depth = queue_depth
+        self.timeout_s = timeout_s
+        self.backpressure = backpressure
+        self.allow_paths = allow_paths
+        self.stats = LatencyStats()
+
+        self._slots = threading.BoundedSemaphore(queue_depth)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._extracting = 0
+
+        ia.load_rf_model(ia.MODEL_PATH, verbose=False)
+        self.executor = None
+        if workers > 0:
+            # A workerek csak kinyernek (categorize=False), a kategorizálás a kötegelőben fut:
+            # a modell helyett csak a jellemzőneveit kapják
+            self.executor = ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=ia._init_worker,
+                initargs=(
+                    ia.MODEL_PATH,
+                    instrumentation.config(),
+                    structural_config(),
+                    image_context.exif_mode,
+                    color_batch.color_batch_size,
+                    ia.rf_features,
+                ),
+            )
+        self.batcher = MicroBatcher(max_batch, batch_wait_ms, self.stats, pending=lambda: self._extracting)
+
+    @property
+    def in_flight(self):
+        return self._in_flight
+
+    def warm_up(self):
+        # Egy kis képpel végigfut a teljes út (minden workerben), így az első valódi
+        # kérés már nem fizeti a lusta importok és a modell első használatának árát
+        buffer = io.BytesIO()
+        Image.new("RGB", (64, 64), (90, 140, 200)).save(buffer, format="PNG")
+        data = buffer.getvalue()
+        futures = [self.submit(None, data, "warmup.png") for _ in range(max(1, min(self.workers, self.queue_depth)))]
+        for future in futures:
+            future.result()
+        self.stats.reset()
+
+    def _release(self, _future=None):
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
+
+    def _admit(self, timeout):
+        if self.backpressure == "wait":
+            admitted = self._slots.acquire(timeout=timeout)
+        else:
+            admitted = self._slots.acquire(blocking=False)
+        if not admitted:
+            raise Overloaded(f"Túl sok várakozó kérés (sormélység: {self.queue_depth})")
+        with self._lock:
+            self._in_flight += 1
+
+    def admit(self, timeout=None):
+        # Hely foglalása egy kérésnek, még a törzse beolvasása előtt (Overloaded, ha nincs).
+        # A visszaadott kezdőidőt az analyze(admitted=...) kapja; ha a kérés mégsem kerül
+        # elemzésre (hibás vagy félbeszakadt kérés), a helyet a release() adja vissza.
+        t0 = time.perf_counter()
+        self.stats.count("keresek")
+        try:
+            self._admit(self.timeout_s if timeout is None else timeout)
+        except Overloaded:
+            self.stats.count("elutasitva")
+            raise
+        self.stats.record("befogadas", time.perf_counter() - t0)
+        return t0
+
+    def release(self):
+        self.stats.count("ervenytelen")
+        self._release()
+
+    def submit(self, path=None, data=None, name=None, timeout=None, admitted=False):
+        # Egy kép befogadása; a visszaadott future a kategóriával kitöltött sort adja.
+        # A hely (queue_depth) akkor szabadul fel, amikor a kép ténylegesen elkészült,
+        # akkor is, ha a kérés időközben lejárt. admitted=True: a helyet már az admit() foglalta.
+        if not admitted:
+            self._admit(self.timeout_s if timeout is None else timeout)
+        result = Future()
+        result.add_done_callback(self._release)
+        with self._lock:
+            self._extracting += 1
+
+        def extracted(future):
+            with self._lock:
+                self._extracting -= 1
+            try:
+                info, feats, seconds = future.result()
+            except Exception as e:
+                result.set_exception(e)
+                return
+            self.stats.record("elemzes", seconds)
+            if feats is not None and info.get("Becsült kategoria") is None:
+                self.batcher.submit(info, feats, result)
+            else:
+                result.set_result(info)
+
+        task = (path, data, _upload_name(data, name) if data is not None else None)
+        if self.executor is not None:
+            try:
+                self.executor.submit(_extract_task, task).add_done_callback(extracted)
+            except RuntimeError as e:  # leállítás közben
+                with self._lock:
+                    self._extracting -= 1
+                result.set_exception(e)
+        else:
+            inline = Future()
+            try:
+                inline.set_result(_extract_task(task))
+            except Exception as e:
+                inline.set_exception(e)
+            extracted(inline)
+        return result
+
+    def analyze(self, path=None, data=None, name=None, admitted=None):
+        # Szinkron kiszolgálás: a sor, vagy Overloaded / TimeoutError / a hiba kivétele.
+        # admitted: az admit() által visszaadott kezdőidő, ha a hely már le van foglalva
+        t0 = self.admit() if admitted is None else admitted
+        future = self.submit(path, data, name, admitted=True)
+        remaining = self.timeout_s - (time.perf_counter() - t0)
+        try:
+            row = future.result(timeout=max(remaining, 0.0))
+        except FutureTimeout:
+            self.stats.count("idotullepes")
+            raise TimeoutError(f"A kérés nem készült el {self.timeout_s:g} s alatt")
+        except Exception:
+            self.stats.count("hibak")
+            raise
+        self.stats.count("sikeres")
+        self.stats.record("teljes", time.perf_counter() - t0)
+        return row
+
+    def status(self):
+        summary = self.stats.summary()
+        summary.update({
+            "in_flight": self._in_flight,
+            "queue_depth": self.queue_depth,
+            "backpressure": self.backpressure,
+            "timeout_s": self.timeout_s,
+            "workers": self.workers,
+            "max_batch": self.batcher.max_batch,
+            "batch_wait_ms": self.batcher.wait_s * 1000.0,
+            "model": ia.rf_model is not None,
+        })
+        return summary
+
+    def close(self):
+        self.batcher.close()
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+
+
+class AnalysisHandler(BaseHTTPRequestHandler):
+    # POST /analyze   nyers képbájtok (név: ?name=...), vagy JSON: {"path": "..."}
+    # GET  /stats     számlálók, sorállapot, késleltetés-percentilisek
+    # GET  /health    élő-e a szolgáltatás, van-e modell
+    protocol_version = "HTTP/1.1"
+    server_version = "KepSzinelemzo/1.0"
+
+    @property
+    def service(self):
+        return self.server.service
+
+    def address_string(self):
+        # Unix socketen nincs kliens cím
+        return self.client_address[0] if self.client_address else "unix"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload, default=_to_json, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status, message, headers=None):
+        self._send_json(status, {"error": message}, headers)
+
+    def do_GET(self):
+        route = urlparse(self.path).path
+        if route == "/stats":
+            self._send_json(200, self.service.status())
+        elif route == "/health":
+            self._send_json(200, {"status": "ok", "model": ia.rf_model is not None})
+        else:
+            self._error(404, f"Ismeretlen végpont: {route}")
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/analyze":
+            self._error(404, f"Ismeretlen végpont: {url.path}")
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length", ""))
+        except ValueError:
+            self._error(411, "Content-Length fejléc szükséges")
+            return
+        if length < 0:
+            self.close_connection = True
+            self._error(400, f"Érvénytelen Content-Length: {length}")
+            return
+        if length > self.server.max_upload_bytes:
+            self.close_connection = True
+            self._error(413, f"Túl nagy kérés (legfeljebb {self.server.max_upload_bytes >> 20} MB)")
+            return
+
+        # A helyet (queue_depth) a törzs beolvasása előtt foglaljuk le: egyszerre legfeljebb
+        # queue_depth feltöltés van a memóriában, az elutasított kérés törzse csak
+        # darabonként elolvasva, eldobva (így a kliens a 503-at kapja, nem megszakadt kapcsolatot)
+        try:
+            started = self.service.admit()
+        except Overloaded as e:
+            self._discard_body(length)
+            self._error(503, str(e), {"Retry-After": "1"})
+            return
+        try:
+            request = self._read_request(url, length)
+        except BaseException:
+            self.service.release()
+            raise
+        if request is None:
+            self.service.release()
+            return
+
+        try:
+            row = self.service.analyze(*request, admitted=started)
+        except TimeoutError as e:
+            self._error(504, str(e))
+        except Exception as e:
+            self._error(500, f"Hiba: {e}")
+        else:
+            self._send_json(200, row)
+
+    def _discard_body(self, length):
+        while length > 0:
+            chunk = self.rfile.read(min(length, DISCARD_CHUNK))
+            if not chunk:
+                self.close_connection = True
+                break
+            length -= len(chunk)
+
+    def _read_request(self, url, length):
+        # A kérés törzse: (útvonal, képbájtok, név), vagy None, ha a hibaválasz már elment
+        body = self.rfile.read(length)
+        if len(body) < length:  # a kliens a törzs közben bontotta a kapcsolatot
+            self.close_connection = True
+            return None
+        path = data = None
+        name = parse_qs(url.query).get("name", [None])[0]
+        if self.headers.get("Content-Type", "").startswith("application/json"):
+            try:
+                request = json.loads(body.decode("utf-8"))
+                path = request["path"]
+            except (ValueError, KeyError, TypeError):
+                self._error(400, 'Érvénytelen JSON kérés (várt alak: {"path": "..."})')
+                return None
+            if not self.service.allow_paths:
+                self._error(403, "Útvonal szerinti elemzés kikapcsolva")
+                return None
+            if not os.path.isfile(path):
+                self._error(404, f"A fájl nem létezik: {path}")
+                return None
+        elif body:
+            data = body
+        else:
+            self._error(400, "Üres kérés: képbájtok vagy JSON útvonal szükséges")
+            return None
+        return path, data, name
+
+
+class _ServerMixin:
+    daemon_threads = True
+
+    def configure(self, service, max_upload_mb=DEFAULT_MAX_UPLOAD_MB, verbose=False):
+        self.service = service
+        self.max_upload_bytes = max_upload_mb << 20
+        self.verbose = verbose
+
+
+class AnalysisHTTPServer(_ServerMixin, ThreadingHTTPServer):
+    pass
+
+
+class UnixAnalysisServer(_ServerMixin, socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+        super().server_bind()
+
+
+def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, unix_socket=None, workers=1, queue_depth=DEFAULT_QUEUE_DEPTH,
+          timeout_s=DEFAULT_TIMEOUT_S, backpressure="reject", batch_wait_ms=DEFAULT_BATCH_WAIT_MS,
+          max_batch=ia.RF_BATCH_SIZE, max_upload_mb=DEFAULT_MAX_UPLOAD_MB, allow_paths=True, verbose=False):
+    # A szolgáltatás futtatása Ctrl+C-ig (unix_socket megadásakor azon, különben host:port)
+    service = AnalysisService(workers, queue_depth, timeout_s, backpressure, batch_wait_ms, max_batch, allow_paths)
+    try:
+        service.warm_up()
+        if unix_socket:
+            server = UnixAnalysisServer(unix_socket, AnalysisHandler)
+            where = unix_socket
+        else:
+            server = AnalysisHTTPServer((host, port), AnalysisHandler)
+            where = f"http://{host}:{server.server_address[1]}"
+        server.configure(service, max_upload_mb, verbose)
+        print(f"Elemző szolgáltatás fut: {where} (Ctrl+C = leállítás)", file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print("\nLeállítás...", file=sys.stderr)
+        finally:
+            server.server_close()
+            if unix_socket and os.path.exists(unix_socket):
+                os.remove(unix_socket)
+    finally:
+        service.close()
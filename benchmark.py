@@ -0,0 +1,378 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import statistics
+import numpy as np
+from PIL import Image
+
+import colors
+import color_batch
+import features
+import histogram
+import image_analyzer as ia
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_WORKDIR = "benchmark_images"
+DEFAULT_OUTPUT = "benchmark_results.json"
+DEFAULT_THRESHOLD = 0.20
+DEFAULT_MIN_DELTA_MS = 0.5
+
+# Szintetikus tesztképek: név -> (szélesség, magasság, formátum, PIL mód)
+SYNTHETIC_IMAGES = {
+    "small_png": (640, 480, "PNG", "RGB"),
+    "rgba_png": (1024, 768, "PNG", "RGBA"),
+    "jpeg_12mp": (4000, 3000, "JPEG", "RGB"),
+    "jpeg_50mp": (8660, 5773, "JPEG", "RGB"),
+}
+
+# A golden ellenőrzésnél ezeknél a jellemzőknél nem várunk bitpontos egyezést
+GOLDEN_TOLERANCE = 1e-6
+# A valószínűségi Hough-transzformáció magja a golden jellemzőkhöz (így a Vonalak_szama is összevethető)
+GOLDEN_SEED = 0
+
+
+def synthetic_image(width, height, mode, seed=0):
+    # Determinisztikus, fotószerű tesztkép: színátmenetek + sávok + zaj
+    rng = np.random.default_rng(seed)
+    yy = np.linspace(0.0, 1.0, height, dtype=np.float32)[:, None]
+    xx = np.linspace(0.0, 1.0, width, dtype=np.float32)[None, :]
+
+    r = 200 * (1 - yy) + 40 * np.sin(xx * 12)
+    g = 120 + 80 * np.cos(yy * 9) * xx
+    b = 220 * yy + 30 * np.sin((xx + yy) * 20)
+    rgb = np.stack(np.broadcast_arrays(r, g, b), axis=-1)
+    rgb += rng.normal(0, 12, size=(height, 1, 3)).astype(np.float32)
+    rgb = np.clip(rgb, 0, 255).astype(np.uint8)
+
+    img = Image.fromarray(rgb, "RGB")
+    if mode == "RGBA":
+        img.putalpha(Image.linear_gradient("L").resize((width, height)))
+    return img
+
+
+def generate_images(workdir, names):
+    # Hiányzó tesztképek legenerálása (a meglévőket újrahasználjuk)
+    os.makedirs(workdir, exist_ok=True)
+    paths = {}
+    for name in names:
+        width, height, fmt, mode = SYNTHETIC_IMAGES[name]
+        ext = "jpg" if fmt == "JPEG" else "png"
+        path = os.path.join(workdir, f"{name}.{ext}")
+        if not os.path.exists(path):
+            print(f" Tesztkép generálása: {path}")
+            img = synthetic_image(width, height, mode)
+            if fmt == "JPEG":
+                img.save(path, "JPEG", quality=90)
+            else:
+                img.save(path, "PNG")
+        paths[name] = path
+    return paths
+
+
+def measure(func, repeat):
+    # func futásideje repeat ismétléssel (ms); min / medián / átlag
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        times.append((time.perf_counter() - t0) * 1000.0)
+    return {
+        "min_ms": round(min(times), 3),
+        "median_ms": round(statistics.median(times), 3),
+        "mean_ms": round(statistics.fmean(times), 3),
+        "repeat": repeat,
+    }
+
+
+def fresh_pre(pre):
+    # A pre szótár gyorsítótárazott részeredményei nélkül (minden mérés teljes munkát végez)
+    return {k: v for k, v in pre.items() if k in (
+        "context", "img_small", "rgb_np", "hsv_np", "H_deg", "S_pct", "V_pct", "rgb_mean", "V_hist"
+    )}
+
+
+def bench_image(path, repeat):
+    # Egy kép szakaszonkénti mérése
+    results = {}
+    results["prepare_image"] = measure(lambda: colors.prepare_image(path), repeat)
+
+    pre = colors.prepare_image(path)
+    color_funcs = {
+        "get_average_hsv": lambda p: colors.get_average_hsv(path, pre=p),
+        "get_dominant_hsv": lambda p: colors.get_dominant_hsv(path, pre=p),
+        "get_dominant_colors_hsv": lambda p: colors.get_dominant_colors_hsv(path, top_n=3, pre=p),
+        "estimate_white_balance": lambda p: colors.estimate_white_balance(path, pre=p),
+        "estimate_dynamic_range": lambda p: colors.estimate_dynamic_range(path, pre=p),
+        "get_color_distribution": lambda p: colors.get_color_distribution(path, pre=p),
+    }
+    for name, func in color_funcs.items():
+        results[name] = measure(lambda: func(fresh_pre(pre)), repeat)
+
+    results["estimate_color_depth"] = measure(lambda: colors.estimate_color_depth(path), repeat)
+    results["get_structural_features"] = measure(
+        lambda: features.get_structural_features(pre["img_small"]), repeat
+    )
+    results["extract_features_for_training"] = measure(
+        lambda: features.extract_features_for_training(path, pre=fresh_pre(pre)), repeat
+    )
+    results["read_exif"] = measure(lambda: ia.read_exif(path), repeat)
+
+    out_dir = os.path.join(os.path.dirname(path), "histograms")
+    results["create_hsv_histogram"] = measure(
+        lambda: histogram.create_hsv_histogram(path, output_dir=out_dir), repeat
+    )
+    return results
+
+
+def bench_rf(feature_rows, repeat):
+    # RF becslés: képenkénti és kötegelt (RF_BATCH_SIZE sor)
+    rows = (feature_rows * (ia.RF_BATCH_SIZE // max(len(feature_rows), 1) + 1))[:ia.RF_BATCH_SIZE]
+    return {
+        "rf_single": measure(lambda: ia.predict_categories(rows[:1]), repeat),
+        f"rf_batch_{len(rows)}": measure(lambda: ia.predict_categories(rows), repeat),
+    }
+
+
+def bench_color_batch(paths, repeat, size=color_batch.COLOR_BATCH_SIZE):
+    # Színstatisztikák size bélyegképre: képenként (ImageFeatures) és egy kötegben (ColorBatch)
+    pres = [colors.prepare_image(p) for p in paths]
+    pres = (pres * (size // max(len(pres), 1) + 1))[:size]
+
+    def per_image():
+        for pre in pres:
+            fs = features.ImageFeatures(pre["context"].path, fresh_pre(pre))
+            fs.average_hsv, fs.dominant_hsv, fs.white_balance, fs.dynamic_range
+            fs.color_distribution, fs.hue_ratios, fs.dominant_colors
+
+    def batched():
+        batch = color_batch.ColorBatch([fresh_pre(pre) for pre in pres])
+        batch.prime()
+        for pre in batch.pres:
+            fs = pre["features"]
+            fs.color_distribution, fs.hue_ratios, fs.dominant_colors
+
+    return {
+        f"color_per_image_{size}": measure(per_image, repeat),
+        f"color_batch_{size}": measure(batched, repeat),
+    }
+
+
+def bench_pipeline(paths, workdir, repeat):
+    # save_to_excel és a teljes analyze_folder áteresztése
+    folder = os.path.join(workdir, "pipeline")
+    os.makedirs(folder, exist_ok=True)
+    for path in paths:
+        shutil.copy(path, folder)
+
+    rows = [ia.read_exif(path) for path in paths]
+    excel_rows = (rows * (1000 // len(rows) + 1))[:1000]
+    results = {
+        "save_to_excel_1000": measure(
+            lambda: ia.save_to_excel(excel_rows, os.path.join(workdir, "bench.xlsx")), repeat
+        )
+    }
+
+    summaries = []
+
+    def run():
+        summaries.append(ia.analyze_folder(
+            folder, generate_histograms=False, output_path=os.path.join(workdir, "bench_folder.xlsx"),
+            verbose=False,
+        ))
+
+    results["analyze_folder"] = measure(run, repeat)
+    results["analyze_folder"]["images_per_s"] = round(
+        statistics.median(s["images_per_s"] for s in summaries), 3
+    )
+    return results
+
+
+def bench_structural_tiers(paths, repeat, dataset_dir=None, seed=0):
+    # A strukturális motorok összevetése: késleltetés a tesztképeken, és ha van
+    # címkézett adathalmaz, az RF pontossága / egyezése motoronként.
+    results = {"latency": {}, "seed": seed}
+    for name, path in paths.items():
+        img_small = colors.prepare_image(path)["img_small"]
+        results["latency"][name] = {
+            engine: measure(
+                lambda e=engine: features.get_structural_features(img_small, engine=e, seed=seed), repeat
+            )
+            for engine in features.STRUCTURAL_ENGINES
+        }
+
+    if not dataset_dir or ia.rf_model is None:
+        return results
+
+    # Ugyanaz a bejárás (formátumok, almappák), mint a tanításnál; a train_rf (és az
+    # sklearn) importja csak itt, címkézett adathalmaz esetén történik
+    from train_rf import iter_training_images
+
+    items = list(iter_training_images(dataset_dir))
+    if not items:
+        return results
+
+    # Motoronként átállítjuk a strukturális beállítást, utána visszaáll az előző
+    previous = features.structural_config()
+    predictions = {}
+    try:
+        for engine in features.STRUCTURAL_ENGINES:
+            features.configure_structural(engine, seed)
+            rows = [features.extract_features_for_training(path) for path, _ in items]
+            predictions[engine] = ia.predict_categories(rows)
+    finally:
+        features.configure_structural(**previous)
+
+    labels = [label for _, label in items]
+    full = predictions["full"]
+    results["accuracy"] = {
+        engine: {
+            "images": len(labels),
+            "accuracy": round(sum(p == t for p, t in zip(pred, labels)) / len(labels), 4),
+            "agreement_with_full": round(sum(p == f for p, f in zip(pred, full)) / len(labels), 4),
+        }
+        for engine, pred in predictions.items()
+    }
+    return results
+
+
+def golden_features(paths):
+    # Referencia jellemzőértékek (az optimalizált kódutak helyességének ellenőrzéséhez)
+    # A strukturális motor a rögzített maggal fut, utána visszaáll az előző beállítás
+    previous = features.structural_config()
+    features.configure_structural("full", GOLDEN_SEED)
+    golden = {}
+    try:
+        for name, path in paths.items():
+            feats = features.extract_features_for_training(path)
+            golden[name] = {k: float(v) for k, v in feats.items()}
+    finally:
+        features.configure_structural(**previous)
+    return golden
+
+
+def compare(current, baseline, threshold, min_delta_ms=DEFAULT_MIN_DELTA_MS):
+    # Lassulások (median_ms > baseline * (1 + threshold)) és golden eltérések listája.
+    # A min_delta_ms alatti abszolút különbség mérési zajnak számít.
+    regressions = []
+    for group, timings in current["timings"].items():
+        for stage, value in timings.items():
+            old = baseline.get("timings", {}).get(group, {}).get(stage)
+            if not old or not old.get("median_ms"):
+                continue
+            ratio = value["median_ms"] / old["median_ms"]
+            if ratio > 1 + threshold and value["median_ms"] - old["median_ms"] > min_delta_ms:
+                regressions.append((group, stage, old["median_ms"], value["median_ms"], ratio))
+
+    mismatches = []
+    for name, feats in baseline.get("golden", {}).items():
+        cur = current["golden"].get(name)
+        if cur is None:
+            continue
+        for key, val in feats.items():
+            if key not in cur or abs(cur[key] - val) > GOLDEN_TOLERANCE:
+                mismatches.append((name, key, val, cur.get(key)))
+
+    return regressions, mismatches
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Az elemző és tanító folyamat teljesítménymérése")
+    parser.add_argument("--images", default=",".join(SYNTHETIC_IMAGES),
+                        help="Mért tesztképek vesszővel elválasztva "
+                             f"(lehetséges: {', '.join(SYNTHETIC_IMAGES)})")
+    parser.add_argument("--repeat", type=int, default=5, help="Ismétlések száma mérésenként")
+    parser.add_argument("--workdir", default=DEFAULT_WORKDIR, help="Tesztképek és ideiglenes kimenetek mappája")
+    parser.add_argument("-o", "--output", default=DEFAULT_OUTPUT, help="Eredmény JSON (baseline)")
+    parser.add_argument("--compare", metavar="BASELINE", help="Összehasonlítás egy korábbi eredmény JSON-nal")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Lassulási küszöb a medián időre (0.2 = +20%%)")
+    parser.add_argument("--min-delta-ms", type=float, default=DEFAULT_MIN_DELTA_MS,
+                        help="Ennél kisebb abszolút lassulás (ms) zajnak számít")
+    parser.add_argument("--structural-tiers", action="store_true",
+                        help="A strukturális motorok (full / fast) késleltetésének összevetése")
+    parser.add_argument("--dataset", default=None,
+                        help="Címkézett képmappa (train_dataset szerkezet) a motorok RF pontosságához")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv if argv is not None else sys.argv[1:])
+    names = [n.strip() for n in args.images.split(",") if n.strip()]
+    unknown = [n for n in names if n not in SYNTHETIC_IMAGES]
+    if unknown:
+        print(f"Ismeretlen tesztkép: {', '.join(unknown)}")
+        return 2
+
+    ia.load_rf_model(os.path.join(HERE, ia.MODEL_PATH), verbose=False)
+    paths = generate_images(args.workdir, names)
+
+    timings = {}
+    for name, path in paths.items():
+        print(f" Mérés: {name}")
+        timings[name] = bench_image(path, args.repeat)
+
+    feature_rows = [features.extract_features_for_training(p) for p in paths.values()]
+    if ia.rf_model is not None:
+        timings["rf"] = bench_rf(feature_rows, args.repeat)
+    timings["color_batch"] = bench_color_batch(list(paths.values()), args.repeat)
+    timings["pipeline"] = bench_pipeline(list(paths.values()), args.workdir, max(1, args.repeat // 2))
+
+    tiers = None
+    if args.structural_tiers:
+        tiers = bench_structural_tiers(paths, args.repeat, args.dataset)
+
+    current = {
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "repeat": args.repeat,
+        "timings": timings,
+        "golden_seed": GOLDEN_SEED,
+        "golden": golden_features(paths),
+    }
+    if tiers is not None:
+        current["structural_tiers"] = tiers
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(current, f, ensure_ascii=False, indent=2)
+    print(f"\nEredmények elmentve: {args.output}")
+
+    for group, stages in timings.items():
+        print(f"\n{group}")
+        for stage, value in stages.items():
+            print(f"  {stage:<32} {value['median_ms']:>10.2f} ms")
+
+    if tiers is not None:
+        print("\nStrukturális motorok")
+        for name, engines in tiers["latency"].items():
+            parts = ", ".join(f"{e}={v['median_ms']:.2f} ms" for e, v in engines.items())
+            print(f"  {name:<32} {parts}")
+        for engine, acc in tiers.get("accuracy", {}).items():
+            print(f"  {engine:<32} pontosság={acc['accuracy']:.1%}, "
+                  f"egyezés a full motorral={acc['agreement_with_full']:.1%} ({acc['images']} kép)")
+
+    if not args.compare:
+        return 0
+
+    with open(args.compare, encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressions, mismatches = compare(current, baseline, args.threshold, args.min_delta_ms)
+
+    print(f"\nÖsszehasonlítás: {args.compare} (küszöb: +{args.threshold:.0%})")
+    for group, stage, old, new, ratio in regressions:
+        print(f"  LASSULÁS {group}/{stage}: {old:.2f} ms -> {new:.2f} ms ({ratio:.2f}x)")
+    for name, key, old, new in mismatches:
+        print(f"  ELTÉRÉS {name}/{key}: {old} -> {new}")
+    if not regressions and not mismatches:
+        print("  Nincs lassulás és golden eltérés.")
+
+    return 1 if regressions or mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,280 @@
+import time
+from collections import defaultdict, deque
+
+import numpy as np
+
+from colors import (
+    GRAY_SAT_THR,
+    _HUE_LUT_DEG,
+    _HUE_MASK_GREEN,
+    _HUE_MASK_BLUE,
+    _HUE_MASK_WARM,
+    _cell_index,
+    classify_dynamic_range,
+    estimate_white_balance,
+    hue_stats_from_cells,
+    prepare_image,
+    rgb_to_hsv,
+)
+from features import HUE_RATIO_BINS, TRAINING_GROUPS, image_features
+from instrumentation import image_scope, instrumented
+from prefetch import PREFETCH_DEPTH, PREFETCH_MB, context_bytes, prefetch_contexts
+
+# Kötegelt színstatisztika: N azonos méretű bélyegkép egy (N, H, W, 3) tömbben,
+# a pixelszintű lépések (csatornaátlagok, hue / V hisztogramok, 3×3 cellák,
+# domináns hue maszk) egy-egy NumPy hívással futnak a teljes kötegre, a képenkénti
+# sok kis hívás helyett. Az eredmények megegyeznek a colors.py függvényeiével;
+# kivétel a domináns hue/sat/val átlag, amely itt float64-ben összegződik
+# (a képenkénti float32 átlagtól legfeljebb egy kerekítési határon tér el).
+
+# Egyszerre ennyi kép színstatisztikája számolódik (0 vagy 1 = képenként)
+COLOR_BATCH_SIZE = 32
+color_batch_size = COLOR_BATCH_SIZE
+
+_PCT_LUT = ((np.arange(256, dtype=np.float32) / 255.0) * 100.0).astype(np.float64)
+_DEG_LUT = _HUE_LUT_DEG.astype(np.float64)
+
+
+def _bin_lut(edges):
+    # A 256 lehetséges hue értékhez: melyik np.histogram vödörbe esik (utolsó vödör zárt)
+    return np.array([np.histogram(_HUE_LUT_DEG[i:i + 1], bins=edges)[0].argmax() for i in range(256)])
+
+
+# get_dominant_hsv: 10°-os hue-hisztogram; a maszk félig nyílt (H >= lo & H < hi),
+# így a 360°-os érték egyik vödör maszkjába sem tartozik (-> külön, utolsó index)
+_DOMINANT_EDGES = np.arange(0, 360 + 10, 10)
+_DOMINANT_BINS = len(_DOMINANT_EDGES) - 1
+_DOMINANT_HIST = np.eye(_DOMINANT_BINS, dtype=np.int64)[_bin_lut(_DOMINANT_EDGES)]
+_DOMINANT_MASK_BIN = np.full(256, _DOMINANT_BINS)
+for _b in range(_DOMINANT_BINS):
+    _DOMINANT_MASK_BIN[(_HUE_LUT_DEG >= _DOMINANT_EDGES[_b]) & (_HUE_LUT_DEG < _DOMINANT_EDGES[_b + 1])] = _b
+
+_HUE_RATIO_HIST = np.eye(len(HUE_RATIO_BINS) - 1, dtype=np.int64)[_bin_lut(np.array(HUE_RATIO_BINS))]
+
+# TRAINING_GROUPS csoport -> a képenkénti értékeket (tuple-öket) adó metódus
+_TUPLE_GROUPS = {
+    "average": "average_hsv",
+    "dominant": "dominant_hsv",
+    "white_balance": "white_balance",
+    "dynamic_range": "dynamic_range",
+}
+
+
+def set_color_batch_size(size):
+    # Kötegméret beállítása (a workereknek is továbbadható)
+    global color_batch_size
+    if size is None or size < 0:
+        raise ValueError(f"Érvénytelen színköteg méret: {size}")
+    color_batch_size = int(size)
+
+
+def _hist_percentiles(hists, q):
+    # colors.hist_percentile soronként, a teljes (N, 256) hisztogram-tömbre egyszerre
+    cum = np.cumsum(hists, axis=1)
+    rank = q / 100.0 * (cum[:, -1] - 1)
+    lo = np.floor(rank).astype(np.int64)
+    hi = np.minimum(lo + 1, cum[:, -1] - 1)
+    v_lo = (cum <= lo[:, None]).sum(axis=1)
+    v_hi = (cum <= hi[:, None]).sum(axis=1)
+    return v_lo + (rank - lo) * (v_hi - v_lo)
+
+
+class ColorBatch:
+    # Azonos méretű, prepare_image-dzsel előkészített bélyegképek színstatisztikái.
+    # A képenkénti eredmények listákban (a riport értékei), a tanítási jellemzők
+    # feature_matrix()-szal közvetlenül RF bemenetként érhetők el.
+
+    @instrumented("color_batch")
+    def __init__(self, pres):
+        self.pres = list(pres)
+        n = len(self.pres)
+        h, w = self.pres[0]["hsv_np"].shape[:2]
+        pixels = h * w
+        hsv = np.empty((n, h, w, 3), dtype=np.uint8)
+        for i, pre in enumerate(self.pres):
+            hsv[i] = pre["hsv_np"]
+        hue = hsv[..., 0].reshape(n, pixels).astype(np.intp)
+        sat = hsv[..., 1].reshape(n, pixels)
+        val = hsv[..., 2].reshape(n, pixels)
+
+        # Csatornaátlagok és V hisztogram: ezeket a prepare_image már kiszámolta
+        # (az ImageStat átlaga pontosan egyezik az np.mean-nel: egész összeg / darab)
+        self.rgb_mean = np.array([pre["rgb_mean"] for pre in self.pres], dtype=np.float64)
+        self.v_hist = np.stack([pre["V_hist"] for pre in self.pres])
+
+        # 3×3 cellánkénti hue-hisztogram és szürke darabszám egyetlen bincount-tal
+        # (kulcs: kép, cella, szürke-e, hue)
+        cell = np.arange(n)[:, None] * 9 + _cell_index(h, w).reshape(1, pixels)
+        key = ((cell * 2 + (sat <= GRAY_SAT_THR)) * 256 + hue).ravel()
+        joint = np.bincount(key, minlength=n * 9 * 2 * 256).reshape(n, 9, 2, 256)
+        self.cell_hist = joint.sum(axis=2)
+        self.cell_gray = joint[:, :, 1, :].sum(axis=2)
+        self.hue_hist = self.cell_hist.sum(axis=1)
+
+        # Domináns hue: a legnépesebb 10°-os vödör pixeleinek átlagos H / S / V értéke
+        # (a maszkolt pixelek S és V értékeinek hisztogramja, majd súlyozott összeg)
+        best = (self.hue_hist @ _DOMINANT_HIST).argmax(axis=1)
+        in_best = _DOMINANT_MASK_BIN[None, :] == best[:, None]
+        best_hist = self.hue_hist * in_best
+        rows, cols = np.nonzero(_DOMINANT_MASK_BIN[hue] == best[:, None])
+        sat_hist = np.bincount(rows * 256 + sat[rows, cols], minlength=n * 256).reshape(n, 256)
+        val_hist = np.bincount(rows * 256 + val[rows, cols], minlength=n * 256).reshape(n, 256)
+        self._dominant = (
+            best_hist.sum(axis=1),
+            best_hist @ _DEG_LUT,
+            sat_hist @ _PCT_LUT,
+            val_hist @ _PCT_LUT,
+        )
+
+    def __len__(self):
+        return len(self.pres)
+
+    def average_hsv(self):
+        return [rgb_to_hsv(r, g, b) for r, g, b in self.rgb_mean]
+
+    def dominant_hsv(self):
+        out = []
+        for count, h_sum, s_sum, v_sum in zip(*self._dominant):
+            if not count:
+                out.append((0, 0, 0))
+                continue
+            out.append((round(float(h_sum / count), 1), round(float(s_sum / count), 1),
+                        round(float(v_sum / count), 1)))
+        return out
+
+    def white_balance(self):
+        return [estimate_white_balance(None, pre={"rgb_mean": mean}) for mean in self.rgb_mean.tolist()]
+
+    def dynamic_range(self):
+        v_min = _hist_percentiles(self.v_hist, 5)
+        v_max = _hist_percentiles(self.v_hist, 95)
+        return [classify_dynamic_range(lo, hi) for lo, hi in zip(v_min, v_max)]
+
+    def color_distribution(self):
+        # (N, 36) arányok a TRAINING_GROUPS color_distribution kulcsainak sorrendjében
+        sizes = self.cell_hist.sum(axis=2)
+        sizes = np.where(sizes > 0, sizes, 1)
+        counts = np.stack([
+            self.cell_hist[..., _HUE_MASK_GREEN].sum(axis=2),
+            self.cell_hist[..., _HUE_MASK_BLUE].sum(axis=2),
+            self.cell_hist[..., _HUE_MASK_WARM].sum(axis=2),
+            self.cell_gray,
+        ], axis=2)
+        return (counts / sizes[..., None]).reshape(len(self), 36)
+
+    def hue_ratios(self):
+        # (N, 4): meleg / zöld / kék / egyéb arány
+        hist = self.hue_hist @ _HUE_RATIO_HIST
+        total = hist.sum(axis=1)
+        return hist / np.where(total > 0, total, 1)[:, None]
+
+    def prime(self, columns=None):
+        # A képenkénti ImageFeatures objektumok feltöltése a kötegben számolt értékekkel;
+        # a Top színek és a 3×3 eloszlás a beállított hue statisztikából számolódik.
+        # columns (a modell jellemzőnevei) megadásakor a képek RF jellemzői is a
+        # feature_matrix() soraiból kerülnek a pre["model_feats"]-be (lásd model_features).
+        values = zip(self.average_hsv(), self.dominant_hsv(), self.white_balance(), self.dynamic_range())
+        for i, (pre, (average, dominant, balance, dyn)) in enumerate(zip(self.pres, values)):
+            pre["hue_stats"] = hue_stats_from_cells(self.cell_hist[i], self.cell_gray[i])
+            image_features(pre["context"].path, pre).prime(
+                average_hsv=average, dominant_hsv=dominant, white_balance=balance, dynamic_range=dyn
+            )
+        if columns is not None:
+            X = self.feature_matrix(columns, dtype=np.float64)
+            for pre, row in zip(self.pres, X.tolist()):
+                pre["model_feats"] = dict(zip(columns, row))
+
+    def feature_matrix(self, columns, dtype=np.float32):
+        # Tanítási jellemzők (N, len(columns)) mátrixban, közvetlenül az RF bemenetéhez.
+        # A strukturális jellemzők nem kötegelhetők, ezek képenként számolódnak.
+        groups = {}
+        wanted = set(columns)
+        for name, keys in TRAINING_GROUPS:
+            if wanted.isdisjoint(keys):
+                continue
+            if name in _TUPLE_GROUPS:
+                values = getattr(self, _TUPLE_GROUPS[name])()
+                block = np.array([row[:3] for row in values], dtype=np.float64)
+            elif name == "structural":
+                block = np.array([
+                    [image_features(pre["context"].path, pre).structural[key] for key in keys]
+                    for pre in self.pres
+                ], dtype=np.float64)
+            else:
+                block = getattr(self, name)()
+            for j, key in enumerate(keys):
+                groups[key] = block[:, j]
+
+        X = np.zeros((len(self), len(columns)), dtype=dtype)
+        for j, name in enumerate(columns):
+            if name in groups:
+                X[:, j] = groups[name]
+        return X
+
+
+def _carry(ctx, seconds, stages):
+    # A kötegben a képre eső idő hozzáírása a kontextushoz (lásd ImageContext.carried_seconds)
+    ctx.carried_seconds += seconds
+    for stage, value in stages.items():
+        ctx.carried_stages[stage] = ctx.carried_stages.get(stage, 0.0) + value
+
+
+def prime_contexts(contexts, columns=None):
+    # Előreolvasott ImageContext-ek színstatisztikája kötegben (méret szerint csoportosítva).
+    # columns: a kötegből az RF jellemzők is kiszámolódnak (ColorBatch.prime).
+    # A nem dekódolható képek kimaradnak; azokat a képenkénti elemzés jelzi hibaként.
+    # A képenkénti előkészítés ideje, és a köteg idejéből a képre eső rész a kontextusra
+    # kerül, így a szakaszidők és a lassú képek jelzése a kötegeléstől nem változik.
+    groups = defaultdict(list)
+    for ctx in contexts:
+        t0 = time.perf_counter()
+        with image_scope(ctx.path, report=False) as scope:
+            try:
+                pre = prepare_image(ctx, full_res_dynamic=False)
+            except Exception:
+                pre = None
+        _carry(ctx, time.perf_counter() - t0, scope.breakdown or {})
+        if pre is not None and "features" not in pre:
+            groups[pre["hsv_np"].shape].append(pre)
+    for pres in groups.values():
+        if len(pres) > 1:
+            t0 = time.perf_counter()
+            ColorBatch(pres).prime(columns)
+            share = (time.perf_counter() - t0) / len(pres)
+            for pre in pres:
+                _carry(pre["context"], share, {"color_batch": share})
+
+
+def batched_contexts(contexts, size=None, max_mb=None, chunk=None, columns=None):
+    # ImageContext-ek változatlan sorrendben, size darabonként előre kiszámolt színstatisztikával.
+    # max_mb: a köteg lezárul, ha a gyűjtött képek nyers bájtjai elérik ezt a méretet.
+    # chunk: a gyűjtés alatt álló / még ki nem adott köteg (deque), kívülről figyelhető
+    # (lásd prefetched_batches); a kiadott kontextusokra a köteg már nem tart hivatkozást.
+    # columns: lásd prime_contexts
+    size = color_batch_size if size is None else size
+    contexts = iter(contexts)
+    if size <= 1:
+        yield from contexts
+        return
+    max_bytes = max_mb * (1 << 20) if max_mb else None
+    chunk = deque() if chunk is None else chunk
+    while True:
+        held = 0
+        for ctx in contexts:
+            chunk.append(ctx)
+            held += len(ctx._data or b"")
+            if len(chunk) >= size or (max_bytes is not None and held >= max_bytes):
+                break
+        if not chunk:
+            return
+        prime_contexts(chunk, columns)
+        while chunk:
+            yield chunk.popleft()
+
+
+def prefetched_batches(paths, depth=PREFETCH_DEPTH, max_mb=PREFETCH_MB, root=None, size=None, columns=None):
+    # prefetch_contexts + batched_contexts egy memóriakorláttal: a kötegbe gyűjtött, még
+    # fel nem dolgozott képek bájtjai is a max_mb előreolvasási korlátba számítanak
+    chunk = deque()
+    contexts = prefetch_contexts(paths, depth, max_mb, root=root, held=lambda: context_bytes(chunk))
+    return batched_contexts(contexts, size, max_mb=max_mb, chunk=chunk, columns=columns)
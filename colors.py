@@ -1,12 +1,17 @@
-from PIL import Image, ImageStat
+from PIL import ImageStat
 import colorsys
 import numpy as np
-from collections import Counter
+from functools import lru_cache
+from image_context import as_image_context
+from instrumentation import instrumented
+
+# Teljes felbontású V hisztogram: ennyi pixelenként (sávonként) konvertálunk HSV-be
+V_HIST_STRIP_PIXELS = 1 << 20
 
 
 def load_image(image_path, size=(150, 150)):
-    img = Image.open(image_path).convert('RGB')
-    return img.resize(size)
+    # Elemző bélyegkép útvonalból vagy ImageContext-ből
+    return as_image_context(image_path, thumb_size=size).thumbnail
 
 
 def rgb_to_hsv(r, g, b):
@@ -14,8 +19,37 @@ def rgb_to_hsv(r, g, b):
     return round(h * 360, 1), round(s * 100, 1), round(v * 100, 1)
 
 
+def v_histogram(img, strip_pixels=V_HIST_STRIP_PIXELS):
+    # A V (fényesség) csatorna 256 elemű hisztogramja vízszintes sávonként számolva:
+    # a teljes képről nem készül HSV vagy float másolat, csak egy sávnyi
+    w, h = img.size
+    rows = max(1, strip_pixels // max(1, w))
+    hist = np.zeros(256, dtype=np.int64)
+    for top in range(0, h, rows):
+        strip = img.crop((0, top, w, min(h, top + rows))).convert("HSV")
+        hist += np.bincount(np.asarray(strip)[:, :, 2].ravel(), minlength=256)
+    return hist
+
+
+def hist_percentile(hist, q):
+    # Pontosan az np.percentile (lineáris interpoláció) eredménye a hisztogram
+    # mögötti 8 bites értékekre, rendezés nélkül
+    cum = np.cumsum(hist)
+    rank = q / 100.0 * (cum[-1] - 1)
+    lo = int(np.floor(rank))
+    v_lo = int(np.searchsorted(cum, lo, side="right"))
+    v_hi = int(np.searchsorted(cum, min(lo + 1, cum[-1] - 1), side="right"))
+    return v_lo + (rank - lo) * (v_hi - v_lo)
+
+
+@instrumented("prepare_image")
 def prepare_image(image_path, full_res_dynamic=False):
-    img_small = load_image(image_path)
+    # image_path lehet útvonal vagy ImageContext (a fájl így csak egyszer nyílik meg).
+    # Az eredmény a kontextuson gyorsítótárazódik, így pl. a hisztogram újrahasználja.
+    ctx = as_image_context(image_path)
+    if not full_res_dynamic and ctx.prepared is not None:
+        return ctx.prepared
+    img_small = ctx.thumbnail
 
     hsv_small = img_small.convert("HSV")
     hsv_np = np.array(hsv_small).astype(np.float32)
@@ -30,12 +64,12 @@ def prepare_image(image_path, full_res_dynamic=False):
     rgb_mean = stat.mean
 
     if full_res_dynamic:
-        img_full_hsv = Image.open(image_path).convert("HSV")
-        v_raw = np.array(img_full_hsv)[:, :, 2].astype(np.float32)
+        v_hist = v_histogram(ctx.open_full())
     else:
-        v_raw = hsv_np[:, :, 2].astype(np.float32)
+        v_hist = np.bincount(np.asarray(hsv_small)[:, :, 2].ravel(), minlength=256)
 
-    return {
+    pre = {
+        "context": ctx,
         "img_small": img_small,
         "rgb_np": rgb_np,
         "hsv_np": hsv_np,
@@ -43,8 +77,11 @@ def prepare_image(image_path, full_res_dynamic=False):
         "S_pct": S_pct,
         "V_pct": V_pct,
         "rgb_mean": rgb_mean,
-        "V_raw": v_raw,
+        "V_hist": v_hist,
     }
+    if not full_res_dynamic:
+        ctx.prepared = pre
+    return pre
 
 
 def get_average_hsv(image_path, pre=None):
@@ -103,29 +140,22 @@ def get_dominant_hsv(image_path, bin_deg=10, pre=None):
 def get_dominant_colors_hsv(image_path, top_n=3, pre=None):
     try:
         if pre is None:
-            img = load_image(image_path)
-            hsv = img.convert("HSV")
-            hsv_np = np.array(hsv).astype(np.float32)
-
-            H = hsv_np[:, :, 0]
-            H_deg = (H / 255.0) * 360.0
-        else:
-            H_deg = pre["H_deg"]
+            pre = prepare_image(image_path)
 
-        # színkategória minden pixelre
-        bins = np.array([get_color_name(h) for h in H_deg.flatten()])
-        total = len(bins) if len(bins) else 1
+        stats = hue_bucket_stats(pre)
+        counts = stats["counts"]
+        total = stats["total"] if stats["total"] else 1
 
-        counts = Counter(bins)
-        ranked = counts.most_common(top_n)
+        # Rangsor darabszám szerint; egyezésnél az első előfordulás dönt (mint a Counter-nél)
+        present = np.flatnonzero(counts)
+        first = _first_occurrence(pre, present) if len(np.unique(counts[present])) < len(present) else present
+        ranked = sorted(zip(present, first), key=lambda item: (-counts[item[0]], item[1]))[:top_n]
 
         out = []
-        for color, cnt in ranked:
-            mask = (bins == color)
-            avg_hue = float(H_deg.flatten()[mask].mean()) if mask.any() else 0.0
-            ratio = cnt / total
+        for idx, _ in ranked:
+            ratio = counts[idx] / total
             pct_val = pct(ratio)
-            out.append((color, pct_val, round(avg_hue, 1)))
+            out.append((HUE_BUCKETS[idx], pct_val, round(float(stats["mean_hue"][idx]), 1)))
 
         return out
 
@@ -172,38 +202,40 @@ def estimate_dynamic_range(image_path, pre=None):
     # Kép fényesség dinamikatartományának becslés
     try:
         if pre is None:
-            img = Image.open(image_path).convert("HSV")
-            v_channel = np.array(img)[:, :, 2]
+            v_hist = v_histogram(as_image_context(image_path).open_full())
         else:
-            v_channel = pre["V_raw"]
-
-        # Percentilis-alapú fényességértékek
-        v_min = np.percentile(v_channel, 5)   # alsó 5% (árnyékok kihagyva)
-        v_max = np.percentile(v_channel, 95)  # felső 5% (kiégett részek kihagyva)
+            v_hist = pre["V_hist"]
 
-        dyn_range = v_max - v_min
+        # Percentilis-alapú fényességértékek (a V hisztogramból)
+        v_min = hist_percentile(v_hist, 5)   # alsó 5% (árnyékok kihagyva)
+        v_max = hist_percentile(v_hist, 95)  # felső 5% (kiégett részek kihagyva)
 
-        # Kategorizálás
-        if dyn_range < 60:
-            hdr_text = "Alacsony dinamikatartomány (sötét / árnyékos kép)"
-        elif dyn_range < 120:
-            hdr_text = "Közepes dinamikatartomány"
-        elif dyn_range < 200:
-            hdr_text = "Magas dinamikatartomány"
-        else:
-            hdr_text = "Nagyon magas dinamikatartomány (HDR jellegű)"
-
-        return round(float(v_min), 1), round(float(v_max), 1), round(float(dyn_range), 1), hdr_text
+        return classify_dynamic_range(v_min, v_max)
 
     except Exception as e:
         return 0, 0, 0, f"Hiba a fényesség-elemzésnél: {e}"
 
 
+def classify_dynamic_range(v_min, v_max):
+    dyn_range = v_max - v_min
+
+    # Kategorizálás
+    if dyn_range < 60:
+        hdr_text = "Alacsony dinamikatartomány (sötét / árnyékos kép)"
+    elif dyn_range < 120:
+        hdr_text = "Közepes dinamikatartomány"
+    elif dyn_range < 200:
+        hdr_text = "Magas dinamikatartomány"
+    else:
+        hdr_text = "Nagyon magas dinamikatartomány (HDR jellegű)"
+
+    return round(float(v_min), 1), round(float(v_max), 1), round(float(dyn_range), 1), hdr_text
+
+
 def estimate_color_depth(image_path):
-    # Színmélység becslése
+    # Színmélység becslése (a fejlécből, a pixelek dekódolása nélkül)
     try:
-        img = Image.open(image_path)
-        mode = img.mode
+        mode = as_image_context(image_path).mode
 
         # PIL mód alapján becslés
         if mode == "RGB":
@@ -224,46 +256,28 @@ def get_color_distribution(image_path, pre=None):
     # 3x3 felosztás
     try:
         if pre is None:
-            img = load_image(image_path)
-
-            hsv = img.convert("HSV")
-            hsv_np = np.array(hsv).astype(np.float32)
-
-            H_deg = (hsv_np[:, :, 0] / 255.0) * 360.0
-            S = hsv_np[:, :, 1].astype(np.float32)
-        else:
-            H_deg = pre["H_deg"]
-            S = pre["hsv_np"][:, :, 1].astype(np.float32)
+            pre = prepare_image(image_path)
 
-        h, w = H_deg.shape
-        row_h = h // 3
-        col_w = w // 3
-        gray_thr = 40.0
+        stats = hue_bucket_stats(pre)
+        hist = stats["cell_hist"]
+        sizes = stats["cell_sizes"]
 
-        def ratios(Hd, Sd):
-            total = Hd.size if Hd.size else 1
-
-            green = ((Hd >= 60) & (Hd <= 150)).sum() / total
-            blue = ((Hd >= 180) & (Hd <= 260)).sum() / total
-            warm = (((Hd >= 0) & (Hd <= 60)) | ((Hd >= 300) & (Hd < 360))).sum() / total
-            gray = (Sd <= gray_thr).sum() / total
-
-            return float(green), float(blue), float(warm), float(gray)
+        green = hist[:, _HUE_MASK_GREEN].sum(axis=1)
+        blue = hist[:, _HUE_MASK_BLUE].sum(axis=1)
+        warm = hist[:, _HUE_MASK_WARM].sum(axis=1)
+        gray = stats["cell_gray"]
 
         out = {}
 
-        for r_idx in range(3):
-            for c_idx in range(3):
-                y1, y2 = r_idx * row_h, (r_idx + 1) * row_h if r_idx < 2 else h
-                x1, x2 = c_idx * col_w, (c_idx + 1) * col_w if c_idx < 2 else w
-
-                g, b, w_, gr = ratios(H_deg[y1:y2, x1:x2], S[y1:y2, x1:x2])
+        for cell in range(9):
+            r_idx, c_idx = divmod(cell, 3)
+            total = sizes[cell] if sizes[cell] else 1
 
-                label = f"row{r_idx}_col{c_idx}"
-                out[f"Zold_{label}"] = g
-                out[f"Kek_{label}"] = b
-                out[f"Meleg_{label}"] = w_
-                out[f"Szurke_{label}"] = gr
+            label = f"row{r_idx}_col{c_idx}"
+            out[f"Zold_{label}"] = float(green[cell] / total)
+            out[f"Kek_{label}"] = float(blue[cell] / total)
+            out[f"Meleg_{label}"] = float(warm[cell] / total)
+            out[f"Szurke_{label}"] = float(gray[cell] / total)
         return out
 
     except Exception:
@@ -296,4 +310,88 @@ def pct(x):
     try:
         return round(float(x) * 100, 1)
     except:
-        return 0.0
\ No newline at end of file
+        return 0.0
+
+
+# Vektorizált hue-vödrözés
+# A HSV kép hue csatornája 8 bites, így a pixelenkénti osztályozás helyett
+# elég a 256 lehetséges értékre egyszer kiszámolni a kategóriát (lookup tábla),
+# majd 3×3 cellánként egyetlen bincount-tal megszámolni a pixeleket.
+# Ebből minden hue alapú statisztika (Top színek, 3×3 eloszlás, hue-hisztogram)
+# levezethető, a pixeleket képenként csak egyszer kell végigjárni.
+
+HUE_BUCKETS = ("Piros", "Narancs", "Sárga", "Zöld", "Cián/Türkiz", "Kék", "Lila", "Pink/Magenta")
+GRAY_SAT_THR = 40.0
+
+_HUE_LUT_DEG = (np.arange(256, dtype=np.float32) / 255.0) * 360.0
+_HUE_LUT_BUCKET = np.array([HUE_BUCKETS.index(get_color_name(h)) for h in _HUE_LUT_DEG], dtype=np.intp)
+
+_HUE_MASK_GREEN = (_HUE_LUT_DEG >= 60) & (_HUE_LUT_DEG <= 150)
+_HUE_MASK_BLUE = (_HUE_LUT_DEG >= 180) & (_HUE_LUT_DEG <= 260)
+_HUE_MASK_WARM = ((_HUE_LUT_DEG >= 0) & (_HUE_LUT_DEG <= 60)) | ((_HUE_LUT_DEG >= 300) & (_HUE_LUT_DEG < 360))
+
+
+@lru_cache(maxsize=8)
+def _cell_index(h, w):
+    # Pixelenkénti 3×3 cella azonosító (0..8), a get_color_distribution felosztása szerint
+    row_h = h // 3
+    col_w = w // 3
+    rows = np.minimum(np.arange(h) // row_h, 2) if row_h else np.full(h, 2)
+    cols = np.minimum(np.arange(w) // col_w, 2) if col_w else np.full(w, 2)
+    return (rows[:, None] * 3 + cols[None, :]).astype(np.intp)
+
+
+def hue_bucket_stats(pre):
+    # Egy menetes hue statisztika, az eredmény a pre szótárban gyorsítótárazva
+    stats = pre.get("hue_stats")
+    if stats is not None:
+        return stats
+
+    hsv_np = pre["hsv_np"]
+    hue_idx = hsv_np[:, :, 0].astype(np.intp)
+    h, w = hue_idx.shape
+    cell = _cell_index(h, w)
+
+    cell_hist = np.bincount((cell * 256 + hue_idx).ravel(), minlength=9 * 256).reshape(9, 256)
+    cell_gray = np.bincount(cell.ravel(), weights=(hsv_np[:, :, 1] <= GRAY_SAT_THR).ravel(), minlength=9)
+
+    stats = hue_stats_from_cells(cell_hist, cell_gray)
+    pre["hue_stats"] = stats
+    return stats
+
+
+def hue_stats_from_cells(cell_hist, cell_gray):
+    # A hue statisztika a cellánkénti (9×256) hue-hisztogramból és szürke darabszámból
+    # (a color_batch kötegben számolt hisztogramjai is ezen mennek át)
+    hue_hist = cell_hist.sum(axis=0)
+    counts = np.bincount(_HUE_LUT_BUCKET, weights=hue_hist, minlength=len(HUE_BUCKETS)).astype(np.int64)
+    hue_sum = np.bincount(_HUE_LUT_BUCKET, weights=hue_hist * _HUE_LUT_DEG.astype(np.float64),
+                          minlength=len(HUE_BUCKETS))
+    total = int(hue_hist.sum())
+
+    return {
+        "total": total,
+        "hue_hist": hue_hist,
+        "counts": counts,
+        "pct": np.array([pct(c / total) if total else 0.0 for c in counts]),
+        "mean_hue": np.divide(hue_sum, counts, out=np.zeros(len(HUE_BUCKETS)), where=counts > 0),
+        "cell_hist": cell_hist,
+        "cell_gray": cell_gray,
+        "cell_sizes": cell_hist.sum(axis=1),
+    }
+
+
+def hue_range_ratios(pre, bins):
+    # Hue-hisztogram tetszőleges fok határokkal, np.histogram szemantikával, arányokban
+    stats = hue_bucket_stats(pre)
+    hist, _ = np.histogram(_HUE_LUT_DEG, bins=bins, weights=stats["hue_hist"])
+    total = hist.sum() if hist.sum() > 0 else 1
+    return hist / total
+
+
+def _first_occurrence(pre, buckets):
+    # Vödrök első előfordulási indexe a kilapított képen (csak holtversenynél kell)
+    flat = _HUE_LUT_BUCKET[pre["hsv_np"][:, :, 0].astype(np.intp).ravel()]
+    values, first = np.unique(flat, return_index=True)
+    lookup = dict(zip(values.tolist(), first.tolist()))
+    return [lookup[b] for b in buckets]
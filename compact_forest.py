@@ -0,0 +1,257 @@
+import hashlib
+import json
+import os
+import struct
+
+import numpy as np
+
+# Kompakt Random Forest formátum: a fák csomópontjai lapos NumPy tömbökben
+# (jellemző, küszöb, bal / jobb gyerek, levélértékek), egyetlen fájlban, amely
+# np.memmap-pel közvetlenül memóriába képezhető. A betöltéshez nem kell sklearn
+# vagy joblib, és nincs unpickle; a becslés az összes (kép, fa) párt egyszerre,
+# vektorizáltan járja be. A levelek önmagukra mutatnak (+inf küszöbbel), így a
+# bejárás elágazás nélkül, max_depth lépésben ér minden levélhez.
+#
+# Fájl: FOREST_MAGIC, 8 bájtos fejléchossz, JSON fejléc (osztályok, jellemzőnevek,
+# tömbök típusa / alakja / eltolása, a forrás pickle mérete és hash-e), majd a tömbök
+# _ALIGN bájtra igazítva.
+
+FOREST_MAGIC = b"RFCOMPACT1\n"
+FOREST_SUFFIX = ".forest"
+_ALIGN = 64
+_LEAF = -1
+# Ennyi szintenként ellenőrizzük, hogy minden pár levélhez ért-e (mély fáknál korábban leáll)
+_DONE_CHECK_EVERY = 8
+
+
+def compact_path(model_path):
+    # A pickle modell mellé kerülő kompakt fájl (rf_model.pkl -> rf_model.forest)
+    return os.path.splitext(model_path)[0] + FOREST_SUFFIX
+
+
+def _source_digest(path, chunk_size=1 << 20):
+    # A forrás pickle tartalom-hash-e (blake2b, mint a feature_cache.file_hash)
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def source_info(model_path):
+    # A kompakt fájl fejlécébe kerülő azonosító: a pickle mérete és tartalom-hash-e
+    return {"size": os.path.getsize(model_path), "hash": _source_digest(model_path)}
+
+
+# (pickle útvonal, méret, mtime) -> a hash, hogy a workerek és az ismételt feloldás ne hash-eljen újra
+_digest_memo = {}
+
+
+def _matches_source(source, model_path):
+    if not source:
+        return False
+    stat = os.stat(model_path)
+    if source.get("size") != stat.st_size:
+        return False
+    key = (os.path.abspath(model_path), stat.st_size, stat.st_mtime_ns)
+    if key not in _digest_memo:
+        _digest_memo[key] = _source_digest(model_path)
+    return source.get("hash") == _digest_memo[key]
+
+
+def resolve_model_path(model_path):
+    # A ténylegesen betöltendő modellfájl: a kompakt változat, ha létezik, és a fejlécében
+    # tárolt forrás (méret + hash) egyezik a mostani pickle-lel - vagy nincs pickle.
+    # Eltérés (pl. a pickle-t lecserélték vagy visszamásolták), olvashatatlan fejléc vagy
+    # forrás nélküli kompakt fájl esetén a pickle töltődik be. Az mtime nem számít.
+    compact = compact_path(model_path)
+    if not os.path.exists(compact):
+        return model_path
+    if not os.path.exists(model_path):
+        return compact
+    try:
+        source = read_header(compact).get("source")
+    except (OSError, ValueError):
+        return model_path
+    return compact if _matches_source(source, model_path) else model_path
+
+
+def _threshold_down(threshold):
+    # float64 küszöb -> a legnagyobb float32, amely nem nagyobb nála. A bemenet
+    # float32 (mint az sklearn-nél), így x <= t pontosan akkor igaz, ha x <= t32.
+    t32 = threshold.astype(np.float32)
+    up = t32.astype(np.float64) > threshold
+    t32[up] = np.nextafter(t32[up], np.float32(-np.inf))
+    return t32
+
+
+def _forest_arrays(model):
+    # sklearn RandomForestClassifier -> lapos tömbök (a fák egymás után, globális indexekkel)
+    roots, feature, threshold, left, right, leaf, values = [], [], [], [], [], [], []
+    offset = 0
+    leaf_offset = 0
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        is_leaf = tree.children_left == _LEAF
+        nodes = np.arange(tree.node_count) + offset
+
+        roots.append(offset)
+        feature.append(np.where(is_leaf, 0, tree.feature).astype(np.intp))
+        threshold.append(np.where(is_leaf, np.float32(np.inf), _threshold_down(tree.threshold)))
+        left.append(np.where(is_leaf, nodes, tree.children_left + offset).astype(np.intp))
+        right.append(np.where(is_leaf, nodes, tree.children_right + offset).astype(np.intp))
+        # Csomópont -> levélérték sor (belső csomópontnál -1)
+        leaf.append(np.where(is_leaf, np.cumsum(is_leaf) - 1 + leaf_offset, _LEAF).astype(np.intp))
+
+        # Levelenkénti osztályvalószínűség (mint a DecisionTreeClassifier.predict_proba)
+        value = tree.value[is_leaf, 0, :].astype(np.float64)
+        total = value.sum(axis=1, keepdims=True)
+        values.append(value / np.where(total == 0.0, 1.0, total))
+
+        offset += tree.node_count
+        leaf_offset += int(is_leaf.sum())
+
+    return {
+        "roots": np.array(roots, dtype=np.intp),
+        "feature": np.concatenate(feature),
+        "threshold": np.concatenate(threshold),
+        "left": np.concatenate(left),
+        "right": np.concatenate(right),
+        "leaf": np.concatenate(leaf),
+        "leaf_value": np.concatenate(values),
+    }, max(estimator.tree_.max_depth for estimator in model.estimators_)
+
+
+class CompactForest:
+    # Vektorizált becslő a kompakt tömbökön; a RandomForestClassifier helyett
+    # használható a predict_proba / predict / classes_ felületen keresztül.
+
+    def __init__(self, arrays, classes, feature_names, max_depth, n_trees=None):
+        self.arrays = arrays
+        self.roots = arrays["roots"]
+        self.feature = arrays["feature"]
+        self.threshold = arrays["threshold"]
+        self.left = arrays["left"]
+        self.right = arrays["right"]
+        self.leaf = arrays["leaf"]
+        self.leaf_value = arrays["leaf_value"]
+        self.classes_ = np.array(classes, dtype=object)
+        self.feature_names = list(feature_names)
+        self.max_depth = max_depth
+        self.n_estimators = len(self.roots) if n_trees is None else min(n_trees, len(self.roots))
+
+    @classmethod
+    def from_model(cls, model, feature_names):
+        arrays, max_depth = _forest_arrays(model)
+        return cls(arrays, list(model.classes_), feature_names, max_depth)
+
+    def pruned(self, n_trees):
+        # Az első n_trees fa (a tömbök közösek, nincs másolás)
+        return CompactForest(self.arrays, self.classes_, self.feature_names, self.max_depth, n_trees)
+
+    def leaves(self, X):
+        # (minta, fa) -> levélérték sor; minden (minta, fa) pár egy lépésben egy szinttel lejjebb
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        n, k = X.shape[0], self.n_estimators
+        flat = X.ravel()
+        nodes = np.tile(self.roots[:k].astype(np.intp), n)
+        base = np.repeat(np.arange(n, dtype=np.intp) * X.shape[1], k)
+        for depth in range(1, self.max_depth + 1):
+            go_left = flat[base + self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+            if depth % _DONE_CHECK_EVERY == 0 and (self.leaf[nodes] >= 0).all():
+                break
+        return self.leaf[nodes].reshape(n, k)
+
+    def predict_proba(self, X):
+        if len(X) == 0:
+            return np.zeros((0, len(self.classes_)))
+        proba = self.leaf_value[self.leaves(X)].sum(axis=1)
+        return proba / self.n_estimators
+
+    def predict(self, X):
+        return self.classes_[self.predict_proba(X).argmax(axis=1)]
+
+
+def export_forest(model, feature_names, path, n_trees=None, source_path=None):
+    # A modell mentése kompakt formátumban (n_trees: csak az első n_trees fa).
+    # source_path: a modell pickle fájlja; mérete és hash-e a fejlécbe kerül (lásd resolve_model_path)
+    forest = CompactForest.from_model(model, feature_names)
+    if n_trees is not None:
+        forest = forest.pruned(n_trees)
+    save_forest(forest, path, source=source_info(source_path) if source_path else None)
+    return forest
+
+
+def save_forest(forest, path, source=None):
+    k = forest.n_estimators
+    node_end = int(forest.roots[k]) if k < len(forest.roots) else len(forest.feature)
+    leaf_end = int(forest.leaf[:node_end].max()) + 1 if node_end else 0
+    arrays = {
+        "roots": forest.roots[:k],
+        "feature": forest.feature[:node_end],
+        "threshold": forest.threshold[:node_end],
+        "left": forest.left[:node_end],
+        "right": forest.right[:node_end],
+        "leaf": forest.leaf[:node_end],
+        "leaf_value": forest.leaf_value[:leaf_end],
+    }
+
+    layout = {}
+    position = 0
+    for name, array in arrays.items():
+        position = -(-position // _ALIGN) * _ALIGN
+        layout[name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": position}
+        position += array.nbytes
+    header = json.dumps({
+        "classes": [str(c) for c in forest.classes_],
+        "features": forest.feature_names,
+        "n_trees": k,
+        "max_depth": forest.max_depth,
+        "arrays": layout,
+        "source": source,
+    }, ensure_ascii=False).encode("utf-8")
+    data_start = -(-(len(FOREST_MAGIC) + 8 + len(header)) // _ALIGN) * _ALIGN
+
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(FOREST_MAGIC)
+        f.write(struct.pack("<Q", len(header)))
+        f.write(header)
+        for name, array in arrays.items():
+            f.write(b"\0" * (data_start + layout[name]["offset"] - f.tell()))
+            f.write(np.ascontiguousarray(array).tobytes())
+    os.replace(tmp, path)
+
+
+def _read_header(f, path):
+    if f.read(len(FOREST_MAGIC)) != FOREST_MAGIC:
+        raise ValueError(f"Nem kompakt modellfájl: {path}")
+    (header_len,) = struct.unpack("<Q", f.read(8))
+    return header_len, json.loads(f.read(header_len).decode("utf-8"))
+
+
+def read_header(path):
+    # Csak a JSON fejléc (a tömbök betöltése nélkül)
+    with open(path, "rb") as f:
+        return _read_header(f, path)[1]
+
+
+def load_forest(path, mmap=True):
+    # Kompakt modell betöltése; mmap=True esetén a tömbök a fájlra képezve (nincs beolvasás)
+    with open(path, "rb") as f:
+        header_len, header = _read_header(f, path)
+        data_start = -(-(len(FOREST_MAGIC) + 8 + header_len) // _ALIGN) * _ALIGN
+        if mmap:
+            buffer = np.memmap(path, dtype=np.uint8, mode="r")
+        else:
+            f.seek(0)
+            buffer = np.frombuffer(f.read(), dtype=np.uint8)
+
+    arrays = {}
+    for name, spec in header["arrays"].items():
+        dtype = np.dtype(spec["dtype"])
+        start = data_start + spec["offset"]
+        count = int(np.prod(spec["shape"], dtype=np.int64))
+        arrays[name] = buffer[start:start + count * dtype.itemsize].view(dtype).reshape(spec["shape"])
+    return CompactForest(arrays, header["classes"], header["features"], header["max_depth"], header["n_trees"])
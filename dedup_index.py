@@ -0,0 +1,330 @@
+import hashlib
+import itertools
+import json
+import os
+import sqlite3
+import threading
+
+import numpy as np
+from PIL import Image
+
+from colors import prepare_image
+from feature_cache import model_signature, _to_json
+from features import feature_version
+
+# Duplikátum-index: a már elemzett képek tartalom-hash és perceptuális hash szerint.
+# Az azonos tartalmú fájl (újramásolás, más mappában lévő példány) a tárolt sort
+# (szín, EXIF, RF kategória) kapja elemzés nélkül; a hasonló képek (átméretezett,
+# újratömörített változat) a perceptuális hash Hamming-távolsága alapján jelölhetők.
+#
+# Keresés milliós indexben is indexelt SQLite lekérdezéssel:
+#  - pontos egyezés: a fájl elejéből / végéből képzett gyors kulcs előszűr, csak
+#    kulcsegyezéskor olvassuk be a teljes fájlt a tartalom-hash ellenőrzéséhez
+#  - hasonló kép: a 64 bites hash NEAR_BANDS darab 16 bites sávra bontva; ha két hash
+#    legfeljebb d bitben tér el, valamelyik sávjuk legfeljebb d // NEAR_BANDS bitben
+#    (skatulya-elv), így sávonként egy IN (...) lekérdezés a sáv értékének ennyi bites
+#    változataira minden d-n belüli jelöltet megtalál
+
+DEFAULT_DEDUP_PATH = "kep_duplikatum_index.sqlite"
+# A gyors kulcs a fájl elejéből és végéből ennyi bájtot olvas (a mérettel együtt)
+QUICK_SAMPLE = 64 * 1024
+# Perceptuális hash: a bélyegkép PHASH_SIZE×PHASH_SIZE szürkeárnyalatos változatának
+# DCT-je, a bal felső PHASH_BITS×PHASH_BITS együttható a mediánjukhoz képest (64 bit)
+PHASH_SIZE = 32
+PHASH_BITS = 8
+NEAR_BANDS = 4
+_BAND_BITS = PHASH_BITS * PHASH_BITS // NEAR_BANDS
+DEFAULT_NEAR_DISTANCE = 6
+# E fölött a sávonkénti lekérdezés túl sok változatot tartalmazna
+MAX_NEAR_DISTANCE = 3 * NEAR_BANDS - 1
+# Sávonként legfeljebb ennyi jelöltet vizsgálunk (pl. sok egyszínű kép azonos sávértékkel)
+NEAR_CANDIDATES = 1024
+
+# A riport oszlopai hasonló képek jelölésekor
+DUPLICATE_COLUMN = "Duplikátum"
+DUPLICATE_SOURCE_COLUMN = "Duplikátum forrása"
+
+
+def _dct_matrix(n):
+    # Ortonormált DCT-II mátrix
+    k = np.arange(n)[:, None]
+    x = np.arange(n)[None, :]
+    m = np.cos(np.pi * (2 * x + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    m[0] /= np.sqrt(2.0)
+    return m
+
+
+_DCT = _dct_matrix(PHASH_SIZE)
+
+
+def perceptual_hash(img_small):
+    # 64 bites pHash a prepare_image bélyegképéből (PIL kép)
+    gray = img_small.convert("L").resize((PHASH_SIZE, PHASH_SIZE), Image.BOX)
+    coeffs = (_DCT @ np.asarray(gray, dtype=np.float64) @ _DCT.T)[:PHASH_BITS, :PHASH_BITS].ravel()
+    # A DC együttható (átlagos fényesség) nem számít bele a küszöbbe
+    bits = coeffs > np.median(coeffs[1:])
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+
+def _bands(phash):
+    mask = (1 << _BAND_BITS) - 1
+    return [(phash >> (i * _BAND_BITS)) & mask for i in range(NEAR_BANDS)]
+
+
+def _probes(band, radius):
+    # A sáv értéke és a legfeljebb radius bitben eltérő változatai
+    values = [band]
+    for r in range(1, radius + 1):
+        for bits in itertools.combinations(range(_BAND_BITS), r):
+            values.append(band ^ sum(1 << b for b in bits))
+    return values
+
+
+def _to_sql_int(phash):
+    # SQLite INTEGER előjeles 64 bites
+    return phash - (1 << 64) if phash >= 1 << 63 else phash
+
+
+def _from_sql_int(value):
+    return value + (1 << 64) if value < 0 else value
+
+
+def _quick_key(size, head, tail):
+    h = hashlib.blake2b(digest_size=16)
+    h.update(size.to_bytes(8, "little"))
+    h.update(head)
+    h.update(tail)
+    return h.hexdigest()
+
+
+def quick_key_bytes(data):
+    # Gyors kulcs a memóriában lévő fájltartalomból (ugyanaz, mint quick_key_file)
+    size = len(data)
+    return _quick_key(size, data[:QUICK_SAMPLE], data[max(size - QUICK_SAMPLE, 0):] if size > QUICK_SAMPLE else b"")
+
+
+def quick_key_file(path):
+    # Gyors kulcs legfeljebb 2 × QUICK_SAMPLE bájt beolvasásával
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        head = f.read(QUICK_SAMPLE)
+        tail = b""
+        if size > QUICK_SAMPLE:
+            f.seek(max(size - QUICK_SAMPLE, 0))
+            tail = f.read()
+    return _quick_key(size, head, tail)
+
+
+def content_hash_bytes(data):
+    # Mint a feature_cache.file_hash, a memóriában lévő tartalomra
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def file_content_hash(path, chunk_size=1 << 20):
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def strip_marks(row):
+    # A jelölő oszlopok eltávolítása (pl. jelöléssel tárolt sor jelölés nélküli futásban)
+    row.pop(DUPLICATE_COLUMN, None)
+    row.pop(DUPLICATE_SOURCE_COLUMN, None)
+    return row
+
+
+def image_signature(ctx):
+    # Az elemzett kép (ImageContext) azonosítói: gyors kulcs, tartalom-hash és pHash.
+    # A workerben fut, a már beolvasott bájtokból és a prepare_image bélyegképéből;
+    # None, ha a fájl nem olvasható (pHash None, ha nem dekódolható).
+    try:
+        data = ctx.data
+    except OSError:
+        return None
+    try:
+        phash = perceptual_hash(prepare_image(ctx, full_res_dynamic=False)["img_small"])
+    except Exception:
+        phash = None
+    return {"quick": quick_key_bytes(data), "content": content_hash_bytes(data), "phash": phash}
+
+
+class DedupIndex:
+    # Tartós duplikátum-index SQLite-ban.
+    # Kulcs: tartalom-hash; érték: az elemzett fájl útvonala, a read_exif sora (a hasonló
+    # kép jelölésével együtt) és a nyers RF jellemzővektor. Mint a FeatureCache-nél,
+    # a modell, a FEATURE_VERSION vagy a strukturális motor változásakor a teljes index törlődik.
+    # A lookup előreolvasó szálakból is hívható (a kapcsolatot egy zár védi).
+    # near_distance: None = a hasonló képek nem jelölődnek (a riport oszlopai változatlanok),
+    #                különben a legfeljebb ennyi bitben eltérő pHash-ű kép jelölődik
+
+    def __init__(self, index_path=DEFAULT_DEDUP_PATH, model_path="rf_model.pkl",
+                 near_distance=None, commit_every=500):
+        if near_distance is not None and not 0 <= near_distance <= MAX_NEAR_DISTANCE:
+            raise ValueError(
+                f"Érvénytelen hasonlósági távolság: {near_distance} (0 és {MAX_NEAR_DISTANCE} között)"
+            )
+        self.index_path = index_path
+        self.near_distance = near_distance
+        self.commit_every = commit_every
+        self.exact_hits = 0
+        self.near_hits = 0
+        self._pending = 0
+        self._lock = threading.Lock()
+
+        self.conn = sqlite3.connect(index_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)"
+        )
+        bands = "".join(f" band{i} INTEGER," for i in range(NEAR_BANDS))
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " content_hash TEXT PRIMARY KEY,"
+            " quick_key TEXT NOT NULL,"
+            " phash INTEGER,"
+            f"{bands}"
+            " path TEXT NOT NULL,"
+            " row_json TEXT NOT NULL,"
+            " features_json TEXT)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS entries_quick ON entries (quick_key)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS entries_phash ON entries (phash)")
+        for i in range(NEAR_BANDS):
+            self.conn.execute(f"CREATE INDEX IF NOT EXISTS entries_band{i} ON entries (band{i})")
+        self._check_version(model_signature(model_path))
+
+    def _check_version(self, model_sig):
+        expected = {"feature_version": feature_version(), "model": model_sig}
+        stored = dict(self.conn.execute("SELECT key, value FROM meta"))
+
+        if any(stored.get(k) != v for k, v in expected.items()):
+            self.conn.execute("DELETE FROM entries")
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", expected.items()
+            )
+            self.conn.commit()
+
+    @property
+    def flag_near(self):
+        return self.near_distance is not None
+
+    def lookup(self, path):
+        # (találat, gyors kulcs). Találat: (sor, jellemzők, forrás útvonal) egy azonos
+        # tartalmú, már elemzett képről - a sor Fájlnév mezője már az aktuális fájlé.
+        # A forrás None, ha a tárolt eredmény ugyanehhez a fájlhoz tartozik (újrafuttatás).
+        # OSError-t továbbad, ha a fájl nem olvasható.
+        quick = quick_key_file(path)
+        if not self.has_quick(quick):
+            return None, quick
+
+        content = file_content_hash(path)
+        with self._lock:
+            found = self.conn.execute(
+                "SELECT path, row_json, features_json FROM entries WHERE content_hash = ? AND quick_key = ?",
+                (content, quick),
+            ).fetchone()
+            if found is None:
+                return None, quick
+            source, row_json, features_json = found
+            if source == os.path.abspath(path):
+                source = None
+            else:
+                self.exact_hits += 1
+
+        row = json.loads(row_json)
+        row["Fájlnév"] = os.path.basename(path)
+        feats = json.loads(features_json) if features_json else None
+        return (row, feats, source), quick
+
+    def has_quick(self, quick):
+        # Van-e az indexben (a még nem véglegesített bejegyzésekkel együtt) ilyen gyors kulcsú kép
+        with self._lock:
+            return self.conn.execute(
+                "SELECT 1 FROM entries WHERE quick_key = ? LIMIT 1", (quick,)
+            ).fetchone() is not None
+
+    def near(self, signature):
+        # A leghasonlóbb, más tartalmú kép (forrás útvonal, Hamming-távolság), vagy None
+        if not self.flag_near or signature is None or signature["phash"] is None:
+            return None
+        phash = signature["phash"]
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT content_hash, phash, path FROM entries WHERE phash = ? AND content_hash != ? LIMIT 1",
+                (_to_sql_int(phash), signature["content"]),
+            ).fetchall()
+            if not rows:
+                radius = self.near_distance // NEAR_BANDS
+                for i, band in enumerate(_bands(phash)):
+                    probes = _probes(band, radius)
+                    rows += self.conn.execute(
+                        f"SELECT content_hash, phash, path FROM entries"
+                        f" WHERE band{i} IN ({', '.join('?' * len(probes))}) AND content_hash != ? LIMIT ?",
+                        (*probes, signature["content"], NEAR_CANDIDATES),
+                    ).fetchall()
+                rows = [r for r in rows if hamming(phash, _from_sql_int(r[1])) <= self.near_distance]
+
+        best = min(rows, key=lambda r: hamming(phash, _from_sql_int(r[1])), default=None)
+        if best is None:
+            return None
+        self.near_hits += 1
+        return best[2], hamming(phash, _from_sql_int(best[1]))
+
+    def put(self, signature, path, row, feats=None):
+        phash = signature["phash"]
+        bands = _bands(phash) if phash is not None else [None] * NEAR_BANDS
+        values = (
+            signature["content"], signature["quick"],
+            _to_sql_int(phash) if phash is not None else None,
+            *bands,
+            os.path.abspath(path),
+            json.dumps(row, default=_to_json, ensure_ascii=False),
+            json.dumps(feats, default=_to_json) if feats is not None else None,
+        )
+        with self._lock:
+            self.conn.execute(
+                f"INSERT OR REPLACE INTO entries (content_hash, quick_key, phash,"
+                f" {', '.join(f'band{i}' for i in range(NEAR_BANDS))}, path, row_json, features_json)"
+                f" VALUES ({', '.join('?' * (NEAR_BANDS + 6))})",
+                values,
+            )
+        self._pending += 1
+        if self._pending >= self.commit_every:
+            self.commit()
+
+    def mark(self, row, kind=None, source=""):
+        # Jelölő oszlopok a riport sorában (csak ha a hasonló képek jelölése be van kapcsolva,
+        # különben eltávolítjuk őket). kind=None: a sorban már meglévő jelölés marad (pl. a
+        # cache-ből vagy az indexből jött saját sor), különben üres.
+        if not self.flag_near:
+            return strip_marks(row)
+        if kind is None:
+            row.setdefault(DUPLICATE_COLUMN, "")
+            row.setdefault(DUPLICATE_SOURCE_COLUMN, "")
+        else:
+            row[DUPLICATE_COLUMN] = kind
+            row[DUPLICATE_SOURCE_COLUMN] = source
+        return row
+
+    def commit(self):
+        with self._lock:
+            self.conn.commit()
+        self._pending = 0
+
+    def close(self):
+        self.commit()
+        with self._lock:
+            self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,79 @@
+import os
+import sys
+from fnmatch import fnmatch
+
+# Feldolgozható képformátumok (kisbetűs kiterjesztések, az összevetés kis-nagybetű független)
+IMAGE_EXTENSIONS = frozenset({".jpg", ".jpeg", ".png", ".tif", ".tiff", ".webp"})
+
+
+def _matches(rel_path, name, patterns):
+    # Perjelet tartalmazó minta a gyökérhez képesti útvonalra, a többi a fájl/mappa nevére illeszkedik
+    for pattern in patterns:
+        if fnmatch(rel_path if "/" in pattern else name, pattern):
+            return True
+    return False
+
+
+def relative_name(path, root=None):
+    # A gyökérhez képesti útvonal perjelekkel (a riport Fájlnév oszlopa, a hisztogram neve
+    # és a shard hozzárendelés ebből számol); gyökér nélkül a puszta fájlnév
+    if root is None:
+        return os.path.basename(path)
+    return os.path.relpath(path, root).replace(os.sep, "/")
+
+
+def iter_images(root, recursive=False, include=None, exclude=None, extensions=IMAGE_EXTENSIONS,
+                follow_symlinks=False):
+    # Képfájlok folyamatos felsorolása os.scandir-ral: az első találat azonnal
+    # feldolgozható, a teljes lista sosem jön létre a memóriában.
+    # recursive: almappák bejárása (pl. év/hónap/nap archívum)
+    # include / exclude: glob minták (pl. "*.jpg", "2023/*", "thumbs"); a kizárt mappákba nem lépünk be
+    # extensions: elfogadott kiterjesztések (kis-nagybetű független)
+    # follow_symlinks: szimbolikus linkek követése (körök ellen védett)
+    extensions = frozenset(e.lower() for e in extensions)
+    include = list(include or [])
+    exclude = list(exclude or [])
+    visited = set()
+
+    def walk(directory, rel_dir):
+        try:
+            if follow_symlinks:
+                st = os.stat(directory)
+                key = (st.st_dev, st.st_ino)
+                if key in visited:
+                    return
+                visited.add(key)
+            it = os.scandir(directory)
+        except OSError as e:
+            print(f" Mappa nem olvasható: {directory} ({e})", file=sys.stderr)
+            return
+
+        with it:
+            subdirs = []
+            for entry in it:
+                rel_path = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+                try:
+                    is_dir = entry.is_dir(follow_symlinks=follow_symlinks)
+                    is_file = not is_dir and entry.is_file(follow_symlinks=follow_symlinks)
+                except OSError:
+                    continue
+
+                if exclude and _matches(rel_path, entry.name, exclude):
+                    continue
+                if is_dir:
+                    if recursive:
+                        subdirs.append((entry.path, rel_path))
+                    continue
+                if not is_file:
+                    continue
+                if os.path.splitext(entry.name)[1].lower() not in extensions:
+                    continue
+                if include and not _matches(rel_path, entry.name, include):
+                    continue
+                yield entry.path
+
+        # Az almappákat a mappa bezárása után járjuk be (kevesebb nyitott leíró)
+        for path, rel_path in subdirs:
+            yield from walk(path, rel_path)
+
+    yield from walk(root, "")
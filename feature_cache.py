@@ -0,0 +1,171 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+from features import feature_version
+
+DEFAULT_CACHE_PATH = "kep_szinelemzes_cache.sqlite"
+DEFAULT_MAX_ENTRIES = 1_000_000
+
+
+def _to_json(value):
+    # numpy skalárok (np.float64, np.str_) JSON-kompatibilis alakra
+    if hasattr(value, "item"):
+        return value.item()
+    return str(value)
+
+
+def file_hash(path, chunk_size=1 << 20):
+    # Tartalom-hash (blake2b), ha a méret/mtime egyezés nem elég biztos
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def model_signature(model_path):
+    # A modellfájl tartalmából képzett azonosító; ha a modell változik, a cache érvénytelen
+    if not os.path.exists(model_path):
+        return "nincs-modell"
+    return file_hash(model_path)
+
+
+class FeatureCache:
+    # Tartós jellemző-cache SQLite-ban.
+    # Kulcs: abszolút útvonal + fájlméret + mtime (opcionálisan tartalom-hash).
+    # Érték: a read_exif által előállított teljes sor és a nyers RF jellemzővektor.
+    # A modell, a FEATURE_VERSION vagy a strukturális motor változásakor a teljes cache törlődik,
+    # a max_entries fölötti bejegyzések a legrégebben használtak közül törlődnek.
+
+    def __init__(self, cache_path=DEFAULT_CACHE_PATH, model_path="rf_model.pkl",
+                 max_entries=DEFAULT_MAX_ENTRIES, use_hash=False, commit_every=500):
+        self.cache_path = cache_path
+        self.max_entries = max_entries
+        self.use_hash = use_hash
+        self.commit_every = commit_every
+        self.hits = 0
+        self.misses = 0
+        self._pending = 0
+
+        self.conn = sqlite3.connect(cache_path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " path TEXT PRIMARY KEY,"
+            " size INTEGER NOT NULL,"
+            " mtime_ns INTEGER NOT NULL,"
+            " content_hash TEXT,"
+            " row_json TEXT NOT NULL,"
+            " features_json TEXT,"
+            " last_used REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+        self._check_version(model_signature(model_path))
+
+    def _check_version(self, model_sig):
+        expected = {"feature_version": feature_version(), "model": model_sig}
+        stored = dict(self.conn.execute("SELECT key, value FROM meta"))
+
+        if any(stored.get(k) != v for k, v in expected.items()):
+            # Érvénytelenítés: más modell vagy jellemző-kód verzió
+            self.conn.execute("DELETE FROM entries")
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", expected.items()
+            )
+            self.conn.commit()
+
+    def _key(self, path):
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        return path, st.st_size, st.st_mtime_ns
+
+    def get(self, path):
+        # Visszaadja a (sor, jellemzők) párt, vagy None-t, ha nincs érvényes bejegyzés
+        try:
+            key_path, size, mtime_ns = self._key(path)
+        except OSError:
+            self.misses += 1
+            return None
+
+        found = self.conn.execute(
+            "SELECT size, mtime_ns, content_hash, row_json, features_json FROM entries WHERE path = ?",
+            (key_path,),
+        ).fetchone()
+
+        if found is None or found[0] != size:
+            self.misses += 1
+            return None
+
+        if found[1] != mtime_ns:
+            # Módosult az mtime (pl. másolás): hash-sel még igazolható, hogy a tartalom azonos
+            if not (self.use_hash and found[2] and found[2] == file_hash(key_path)):
+                self.misses += 1
+                return None
+            self.conn.execute("UPDATE entries SET mtime_ns = ? WHERE path = ?", (mtime_ns, key_path))
+
+        self.conn.execute("UPDATE entries SET last_used = ? WHERE path = ?", (time.time(), key_path))
+        self._mark_dirty()
+        self.hits += 1
+
+        row = json.loads(found[3])
+        feats = json.loads(found[4]) if found[4] else None
+        return row, feats
+
+    def put(self, path, row, feats=None):
+        try:
+            key_path, size, mtime_ns = self._key(path)
+        except OSError:
+            return
+
+        content_hash = file_hash(key_path) if self.use_hash else None
+        self.conn.execute(
+            "INSERT OR REPLACE INTO entries"
+            " (path, size, mtime_ns, content_hash, row_json, features_json, last_used)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                key_path, size, mtime_ns, content_hash,
+                json.dumps(row, default=_to_json, ensure_ascii=False),
+                json.dumps(feats, default=_to_json) if feats is not None else None,
+                time.time(),
+            ),
+        )
+        self._mark_dirty()
+
+    def _mark_dirty(self):
+        self._pending += 1
+        if self._pending >= self.commit_every:
+            self.commit()
+
+    def evict(self):
+        # Méretkorlát: a legrégebben használt bejegyzések törlése max_entries fölött
+        count = self.conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        excess = count - self.max_entries
+        if excess > 0:
+            self.conn.execute(
+                "DELETE FROM entries WHERE path IN"
+                " (SELECT path FROM entries ORDER BY last_used ASC LIMIT ?)",
+                (excess,),
+            )
+        return max(excess, 0)
+
+    def commit(self):
+        self.conn.commit()
+        self._pending = 0
+
+    def close(self):
+        self.evict()
+        self.commit()
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,126 @@
+import json
+import os
+import sqlite3
+
+from features import feature_version
+
+DEFAULT_STORE_PATH = "train_features.sqlite"
+
+
+class TrainingFeatureStore:
+    # A tanító képek jellemzőinek tartós tárolója (SQLite).
+    # Kulcs: abszolút útvonal + fájlméret + mtime; érték: címke és jellemzővektor.
+    # Minden commit_every beírás után véglegesít, így megszakadt kinyerés után
+    # csak a hiányzó képeket kell újra feldolgozni. A FEATURE_VERSION vagy a
+    # strukturális motor változásakor a tároló kiürül.
+
+    def __init__(self, store_path=DEFAULT_STORE_PATH, commit_every=200):
+        self.store_path = store_path
+        self.commit_every = commit_every
+        self._pending = 0
+
+        self.conn = sqlite3.connect(store_path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS features ("
+            " path TEXT PRIMARY KEY,"
+            " label TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " mtime_ns INTEGER NOT NULL,"
+            " features_json TEXT NOT NULL)"
+        )
+        self._check_version()
+
+    def _check_version(self):
+        expected = feature_version()
+        found = self.conn.execute("SELECT value FROM meta WHERE key = 'feature_version'").fetchone()
+        if found is None or found[0] != expected:
+            self.conn.execute("DELETE FROM features")
+            self.conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('feature_version', ?)", (expected,)
+            )
+            self.conn.commit()
+
+    @staticmethod
+    def file_key(path):
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        return path, st.st_size, st.st_mtime_ns
+
+    def known(self):
+        # path -> (méret, mtime) az összes tárolt bejegyzésre
+        return {
+            path: (size, mtime_ns)
+            for path, size, mtime_ns in self.conn.execute("SELECT path, size, mtime_ns FROM features")
+        }
+
+    def missing(self, items):
+        # items: (útvonal, címke) párok (lehet folyamatos forrás is); lustán adja vissza
+        # azokat, amelyekhez nincs érvényes bejegyzés
+        known = self.known()
+        for path, label in items:
+            try:
+                key = self.file_key(path)
+            except OSError:
+                continue
+            if known.get(key[0]) != key[1:]:
+                yield path, label
+
+    def put(self, path, label, feats):
+        try:
+            key_path, size, mtime_ns = self.file_key(path)
+        except OSError:
+            return
+        self.conn.execute(
+            "INSERT OR REPLACE INTO features (path, label, size, mtime_ns, features_json)"
+            " VALUES (?, ?, ?, ?, ?)",
+            (key_path, label, size, mtime_ns, json.dumps({k: float(v) for k, v in feats.items()})),
+        )
+        self._pending += 1
+        if self._pending >= self.commit_every:
+            self.commit()
+
+    def load(self, items):
+        # A megadott képek tárolt jellemzői a bemeneti sorrendben ("Kategoria" oszloppal)
+        wanted = [os.path.abspath(path) for path, _ in items]
+        stored = {}
+        for path, label, features_json in self.conn.execute(
+            "SELECT path, label, features_json FROM features"
+        ):
+            stored[path] = (label, features_json)
+
+        rows = []
+        for path, (_, label) in zip(wanted, items):
+            found = stored.get(path)
+            if found is None:
+                continue
+            feat = json.loads(found[1])
+            feat["Kategoria"] = label
+            rows.append(feat)
+        return rows
+
+    def prune(self, items):
+        # A már nem létező (vagy máshova került) képek bejegyzéseinek törlése
+        wanted = {os.path.abspath(path) for path, _ in items}
+        stale = [path for path in self.known() if path not in wanted]
+        self.conn.executemany("DELETE FROM features WHERE path = ?", ((p,) for p in stale))
+        self.commit()
+        return len(stale)
+
+    def commit(self):
+        self.conn.commit()
+        self._pending = 0
+
+    def close(self):
+        self.commit()
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
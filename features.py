@@ -1,84 +1,228 @@
+from functools import cached_property
 from colors import (
     prepare_image,
     get_average_hsv,
     get_dominant_hsv,
+    get_dominant_colors_hsv,
     estimate_white_balance,
     estimate_dynamic_range,
-    get_color_distribution
+    get_color_distribution,
+    hue_range_ratios
 )
 import numpy as np
-from skimage.feature import canny
-from skimage.transform import probabilistic_hough_line
-from skimage.color import rgb2gray
-from skimage.filters import sobel
+from instrumentation import instrumented
 
+# A jellemzők kiszámításának verziója. Növelni kell, ha a jellemzők értéke
+# vagy a riport sorának oszlopai megváltoznak, így a tartós cache (feature_cache.py)
+# érvénytelenné válik.
+# 2: GPS tizedes fok oszlopok a sor végén
+FEATURE_VERSION = 2
 
-def extract_features_for_training(image_path, pre=None):
-    # Random Forest tanításhoz szükséges jellemzők kinyerése
+STRUCTURAL_ENGINES = ("full", "fast")
+structural_engine = "full"
+structural_seed = None
+
+
+# Az RF jellemzők csoportjai: csoport -> az általa előállított jellemzőnevek.
+# Egy csoport csak akkor számolódik, ha valamelyik jellemzőjére szükség van.
+_DISTRIBUTION_KEYS = tuple(
+    f"{prefix}_row{r}_col{c}"
+    for r in range(3) for c in range(3)
+    for prefix in ("Zold", "Kek", "Meleg", "Szurke")
+)
+# A Hue_pct_* jellemzők hue határai (fok)
+HUE_RATIO_BINS = (0, 60, 150, 260, 360)
+TRAINING_GROUPS = (
+    ("average", ("Atlagos_Hue", "Atlagos_Sat", "Atlagos_Val")),
+    ("dominant", ("Dominans_Hue", "Dominans_Sat", "Dominans_Val")),
+    ("white_balance", ("WB_R", "WB_G", "WB_B")),
+    ("dynamic_range", ("Fenyesseg_min", "Fenyesseg_max", "Dinamikatartomany")),
+    ("color_distribution", _DISTRIBUTION_KEYS),
+    ("hue_ratios", ("Hue_pct_warm", "Hue_pct_green", "Hue_pct_blue", "Hue_pct_other")),
+    ("structural", ("Textura_suruseg", "Vonalak_szama")),
+)
+
+
+class ImageFeatures:
+    # Egy kép színstatisztikái, mindegyik legfeljebb egyszer számolva (lustán).
+    # Ugyanebből az objektumból készülnek a riport (magyar feliratú) oszlopai
+    # és a Random Forest jellemzővektora; a pre szótárban tárolódik (image_features).
+
+    def __init__(self, image_path, pre=None):
+        if pre is None:
+            pre = prepare_image(image_path, full_res_dynamic=False)
+        self.image_path = image_path
+        self.pre = pre
+
+    @cached_property
+    def average_hsv(self):
+        return get_average_hsv(self.image_path, pre=self.pre)
+
+    @cached_property
+    def dominant_hsv(self):
+        return get_dominant_hsv(self.image_path, pre=self.pre)
+
+    @cached_property
+    def dominant_colors(self):
+        return get_dominant_colors_hsv(self.image_path, top_n=3, pre=self.pre)
+
+    @cached_property
+    def white_balance(self):
+        return estimate_white_balance(self.image_path, pre=self.pre)
+
+    @cached_property
+    def dynamic_range(self):
+        return estimate_dynamic_range(self.image_path, pre=self.pre)
+
+    @cached_property
+    def color_distribution(self):
+        return get_color_distribution(self.image_path, pre=self.pre)
+
+    @cached_property
+    def hue_ratios(self):
+        # Hue‑hisztogram
+        try:
+            hist = hue_range_ratios(self.pre, bins=list(HUE_RATIO_BINS))
+            return {
+                "Hue_pct_warm": float(hist[0]),   # vörös/sárga – naplemente
+                "Hue_pct_green": float(hist[1]),  # zöld – erdei
+                "Hue_pct_blue": float(hist[2]),   # kék – víz/ég
+                "Hue_pct_other": float(hist[3]),  # egyéb
+            }
+        except Exception:
+            return {"Hue_pct_warm": 0.0, "Hue_pct_green": 0.0, "Hue_pct_blue": 0.0, "Hue_pct_other": 0.0}
+
+    @cached_property
+    def structural(self):
+        try:
+            return get_structural_features(self.pre["img_small"])
+        except Exception:
+            return {"Textura_suruseg": 0.0, "Vonalak_szama": 0}
+
+    def prime(self, **values):
+        # Máshol (pl. color_batch kötegben) kiszámolt értékek beállítása; a lusta
+        # tulajdonságok ezeket adják vissza, és nem számolnak újra
+        for name, value in values.items():
+            if not isinstance(getattr(type(self), name, None), cached_property):
+                raise AttributeError(f"Ismeretlen jellemző: {name}")
+            self.__dict__[name] = value
+
+    def _group(self, name):
+        if name == "average":
+            h, s, v = self.average_hsv
+            return {"Atlagos_Hue": h, "Atlagos_Sat": s, "Atlagos_Val": v}
+        if name == "dominant":
+            dh, ds, dv = self.dominant_hsv
+            return {"Dominans_Hue": dh, "Dominans_Sat": ds, "Dominans_Val": dv}
+        if name == "white_balance":
+            r_ratio, g_ratio, b_ratio, _ = self.white_balance
+            return {"WB_R": r_ratio, "WB_G": g_ratio, "WB_B": b_ratio}
+        if name == "dynamic_range":
+            v_min, v_max, dyn_range, _ = self.dynamic_range
+            return {"Fenyesseg_min": v_min, "Fenyesseg_max": v_max, "Dinamikatartomany": dyn_range}
+        # color_distribution (3×3 színeloszlás), hue_ratios, structural
+        return getattr(self, name)
+
+    def training_features(self, columns=None):
+        # A tanítási jellemzők; columns megadásakor csak az ezekhez szükséges csoportok
+        # számolódnak (a többi kulcs hiányzik a visszaadott szótárból)
+        wanted = set(columns) if columns is not None else None
+        feat = {}
+        for name, keys in TRAINING_GROUPS:
+            if wanted is None or not wanted.isdisjoint(keys):
+                feat.update(self._group(name))
+        return feat
+
+
+def image_features(image_path, pre=None):
+    # A kép közös ImageFeatures objektuma (a pre szótárban egyszer jön létre)
     if pre is None:
         pre = prepare_image(image_path, full_res_dynamic=False)
+    fs = pre.get("features")
+    if fs is None:
+        fs = pre["features"] = ImageFeatures(image_path, pre)
+    return fs
 
-    # Alapszín értékek
-    h, s, v = get_average_hsv(image_path, pre=pre)
-    dh, ds, dv = get_dominant_hsv(image_path, pre=pre)
-    r_ratio, g_ratio, b_ratio, _ = estimate_white_balance(image_path, pre=pre)
-    v_min, v_max, dyn_range, _ = estimate_dynamic_range(image_path, pre=pre)
-
-    feat = {
-        "Atlagos_Hue": h,
-        "Atlagos_Sat": s,
-        "Atlagos_Val": v,
-        "Dominans_Hue": dh,
-        "Dominans_Sat": ds,
-        "Dominans_Val": dv,
-        "WB_R": r_ratio,
-        "WB_G": g_ratio,
-        "WB_B": b_ratio,
-        "Fenyesseg_min": v_min,
-        "Fenyesseg_max": v_max,
-        "Dinamikatartomany": dyn_range,
-    }
 
-    # 3×3 színeloszlás
-    row_stats = get_color_distribution(image_path, pre=pre)
-    feat.update(row_stats)
+@instrumented("extract_features_for_training")
+def extract_features_for_training(image_path, pre=None, columns=None):
+    # Random Forest tanításhoz szükséges jellemzők kinyerése
+    # (columns: csak ezek a jellemzők kellenek, pl. a modell rf_features listája)
+    return image_features(image_path, pre).training_features(columns)
+
 
-    # Hue‑hisztogram
-    try:
-        h_deg = pre["H_deg"]
-        bins = [0, 60, 150, 260, 360]
-        hist, _ = np.histogram(h_deg, bins=bins, density=False)
-        total = hist.sum() if hist.sum() > 0 else 1
-        hist = hist / total
+def configure_structural(engine="full", seed=None):
+    # Strukturális jellemző motor kiválasztása (a workereknek is továbbadható)
+    # seed: a valószínűségi Hough-transzformáció magja (None = nem determinisztikus)
+    global structural_engine, structural_seed
+    if engine not in STRUCTURAL_ENGINES:
+        raise ValueError(f"Ismeretlen strukturális motor: {engine} (lehetséges: {', '.join(STRUCTURAL_ENGINES)})")
+    structural_engine = engine
+    structural_seed = seed
 
-        feat["Hue_pct_warm"] = float(hist[0])   # vörös/sárga – naplemente
-        feat["Hue_pct_green"] = float(hist[1])  # zöld – erdei
-        feat["Hue_pct_blue"] = float(hist[2])   # kék – víz/ég
-        feat["Hue_pct_other"] = float(hist[3])  # egyéb
 
-    except Exception:
-        feat["Hue_pct_warm"] = 0.0
-        feat["Hue_pct_green"] = 0.0
-        feat["Hue_pct_blue"] = 0.0
-        feat["Hue_pct_other"] = 0.0
+def structural_config():
+    return {"engine": structural_engine, "seed": structural_seed}
 
-    try:
-        struct_feats = get_structural_features(pre["img_small"])
-        feat.update(struct_feats)
-    except Exception:
-        feat["Textura_suruseg"] = 0.0
-        feat["Vonalak_szama"] = 0
 
-    return feat
+def feature_version():
+    # A cache kulcsához: a kód verziója + a strukturális motor beállítása
+    return f"{FEATURE_VERSION}-{structural_engine}-{structural_seed}"
 
 
-def get_structural_features(img_small):
+@instrumented("get_structural_features")
+def get_structural_features(img_small, engine=None, seed=None):
+    # engine: "full" (Sobel + Canny + valószínűségi Hough, az eredeti módszer)
+    #         "fast" (olcsóbb becslés, lásd _structural_fast)
+    # None esetén a configure_structural beállítása érvényes
+    engine = engine or structural_engine
+    seed = structural_seed if seed is None else seed
+    if engine == "fast":
+        return _structural_fast(img_small, seed)
+    return _structural_full(img_small, seed)
+
+
+def _structural_full(img_small, seed=None):
+    # A scikit-image importja lassú, ezért csak a strukturális jellemzőknél töltjük be
+    from skimage.feature import canny
+    from skimage.transform import probabilistic_hough_line
+    from skimage.color import rgb2gray
+    from skimage.filters import sobel
+
     img_gray = rgb2gray(np.array(img_small))
     edges = sobel(img_gray)
     edge_mean = np.mean(edges)
 
     canny_edges = canny(img_gray, sigma=2)
-    lines = probabilistic_hough_line(canny_edges, threshold=10, line_length=15, line_gap=3)
+    lines = probabilistic_hough_line(canny_edges, threshold=10, line_length=15, line_gap=3, rng=seed)
+
+    return {
+        "Textura_suruseg": edge_mean,
+        "Vonalak_szama": len(lines)
+    }
+
+
+def _structural_fast(img_small, seed=None):
+    # Gyors becslés:
+    #  - Textura_suruseg: egyetlen Sobel gradiens-pár (scipy.ndimage), ugyanaz az érték,
+    #    mint a skimage.filters.sobel átlaga
+    #  - Vonalak_szama: fél felbontáson (2x2 átlag) Canny sigma=1-gyel (≈ sigma=2 teljes
+    #    felbontáson) és arányosan rövidebb Hough szakaszokkal; 4x kevesebb pixelen fut
+    from scipy import ndimage as ndi
+    from skimage.feature import canny
+    from skimage.transform import probabilistic_hough_line
+    from skimage.color import rgb2gray
+
+    img_gray = rgb2gray(np.array(img_small))
+    gi = ndi.sobel(img_gray, axis=0)
+    gj = ndi.sobel(img_gray, axis=1)
+    # skimage.sobel = sqrt((gi/4)^2 + (gj/4)^2) / sqrt(2)
+    edge_mean = np.mean(np.sqrt((gi * gi + gj * gj) / 32.0))
+
+    h, w = img_gray.shape
+    half = img_gray[:h // 2 * 2, :w // 2 * 2].reshape(h // 2, 2, w // 2, 2).mean(axis=(1, 3))
+    canny_edges = canny(half, sigma=1)
+    lines = probabilistic_hough_line(canny_edges, threshold=10, line_length=8, line_gap=1, rng=seed)
 
     return {
         "Textura_suruseg": edge_mean,
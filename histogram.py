@@ -1,17 +1,207 @@
 import os
+import threading
 import numpy as np
-from PIL import Image
-import matplotlib
-matplotlib.use("Agg")
-import matplotlib.pyplot as plt
+from image_context import as_image_context
+from instrumentation import instrumented
 
 
-def create_hsv_histogram(image_path, output_dir="histograms"):
+def histogram_path(filename, output_dir="histograms"):
+    # Relatív útvonalú névnél (rekurzív bejárás) a hisztogram a megfelelő almappába kerül,
+    # így az azonos nevű fájlok hisztogramjai nem írják felül egymást
+    folder, name = os.path.split(filename)
+    return os.path.join(output_dir, folder, f"hisztogram_{name}.png")
 
-    os.makedirs(output_dir, exist_ok=True)
 
-    image = Image.open(image_path).convert('RGB')
-    image = image.resize((150, 150))
+def _pyplot():
+    # A matplotlib importja lassú, ezért csak az első hisztogramnál töltjük be
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    return plt
+
+
+# Hisztogram rajzoló háttérmodulok:
+#  "fast"       – a bin-értékek NumPy-jal a pre tömbökből, a rajz egy folyamatonként
+#                 egyszer elkészített sablonképre kerül közvetlen raszteres rajzolással
+#                 (nincs képenkénti matplotlib ábra, workerekben is biztonságos)
+#  "matplotlib" – az eredeti, képenként új matplotlib ábrát készítő változat
+HISTOGRAM_BACKENDS = ("fast", "matplotlib")
+DEFAULT_BACKEND = "fast"
+
+SV_BINS = 50
+H_BINS = 60
+PNG_COMPRESS_LEVEL = 3
+
+_S_COLOR = np.array([255, 165, 0], dtype=np.float32)    # orange
+_V_COLOR = np.array([128, 128, 128], dtype=np.float32)  # gray
+_H_COLOR = np.array([0, 0, 255], dtype=np.float32)      # blue
+
+# 8 bites csatornaérték -> bin index (S/V: 0–100% 2%-os, H: 0–360° 6°-os binek)
+_SV_BIN_LUT = np.minimum((np.arange(256) / 255.0 * SV_BINS).astype(np.intp), SV_BINS - 1)
+_H_BIN_LUT = np.minimum((np.arange(256) / 255.0 * H_BINS).astype(np.intp), H_BINS - 1)
+
+_template = None
+_template_lock = threading.Lock()
+
+
+def hsv_histogram_counts(pre):
+    # S, V (50 bin, 0–100%) és H (60 bin, 0–360°) pixelszámok a pre 8 bites HSV tömbjéből
+    hsv = pre["hsv_np"].astype(np.intp)
+
+    def counts(channel, lut, bins):
+        per_value = np.bincount(hsv[:, :, channel].ravel(), minlength=256)
+        return np.bincount(lut, weights=per_value, minlength=bins)
+
+    return (
+        counts(1, _SV_BIN_LUT, SV_BINS),
+        counts(2, _SV_BIN_LUT, SV_BINS),
+        counts(0, _H_BIN_LUT, H_BINS),
+    )
+
+
+def _build_template():
+    # A statikus ábrarészek (tengelyek, feliratok, jelmagyarázat) egyszeri kirajzolása
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.patches import Patch
+    import matplotlib
+
+    fig = Figure(figsize=(12, 6), dpi=100)
+    canvas = FigureCanvasAgg(fig)
+    fig.subplots_adjust(left=0.08, right=0.98, top=0.94, bottom=0.09, hspace=0.4)
+    ax1, ax2 = fig.subplots(2, 1)
+
+    ax1.set_xlim(0, 100)
+    ax1.set_xticks(np.arange(0, 101, 5))
+    ax1.set_xlabel("Érték (%)")
+    ax1.set_title("S és V eloszlása")
+    ax1.legend(handles=[
+        Patch(facecolor="orange", alpha=0.5, label="S – Telítettség"),
+        Patch(facecolor="gray", alpha=0.5, label="V – Fényesség"),
+    ], loc="upper right")
+
+    ax2.set_xlim(0, 360)
+    ax2.set_xticks(np.arange(0, 361, 25))
+    ax2.set_xlabel("Érték (Fok)")
+    ax2.set_title("Hue (H) eloszlása")
+    ax2.legend(handles=[Patch(facecolor="blue", label="H – Színárnyalat")], loc="upper right")
+
+    for ax in (ax1, ax2):
+        # az y tengely skáláját képenként rajzoljuk, ehhez hagyunk helyet a feliratnak
+        ax.set_yticks([])
+        ax.set_ylabel("Pixelek száma", labelpad=48)
+
+    canvas.draw()
+    height = int(fig.bbox.height)
+    pixels = np.asarray(canvas.buffer_rgba())[:, :, :3].copy()
+
+    def box(artist):
+        # megjelenítési koordináták (bal alsó origó) -> kép indexek (bal felső origó)
+        b = artist.get_window_extent()
+        return int(round(b.x0)), int(round(height - b.y1)), int(round(b.x1)), int(round(height - b.y0))
+
+    from PIL import ImageFont
+    font_path = os.path.join(matplotlib.get_data_path(), "fonts", "ttf", "DejaVuSans.ttf")
+    return {
+        "pixels": pixels,
+        "axes": [box(ax1), box(ax2)],
+        "legends": [box(ax1.get_legend()), box(ax2.get_legend())],
+        "font": ImageFont.truetype(font_path, 14),
+    }
+
+
+def _get_template():
+    global _template
+    if _template is None:
+        with _template_lock:
+            if _template is None:
+                _template = _build_template()
+    return _template
+
+
+def _nice_ticks(ymax, target=5):
+    # "Kerek" y-tengely osztások (1, 2, 2.5, 5 × 10^k lépésközzel)
+    if ymax <= 0:
+        return [0]
+    raw = ymax / target
+    mag = 10 ** np.floor(np.log10(raw))
+    step = next(m * mag for m in (1, 2, 2.5, 5, 10) if m * mag >= raw)
+    return list(np.arange(0, ymax + step * 1e-9, step))
+
+
+def _draw_bars(pixels, axes_box, counts, ymax, color, alpha):
+    x0, y0, x1, y1 = axes_box
+    width = (x1 - x0) / len(counts)
+    inner_bottom = y1 - 1
+    for i, c in enumerate(counts):
+        if c <= 0:
+            continue
+        left = x0 + int(round(i * width))
+        right = x0 + int(round((i + 1) * width))
+        top = inner_bottom - int(round(c / ymax * (inner_bottom - y0 - 1)))
+        region = pixels[top:inner_bottom, max(left, x0 + 1):min(right, x1 - 1)]
+        region[:] = region * (1.0 - alpha) + color * alpha
+
+
+def _draw_y_axis(draw, axes_box, ymax, font):
+    x0, y0, x1, y1 = axes_box
+    for tick in _nice_ticks(ymax / 1.05):
+        y = y1 - 1 - int(round(tick / ymax * (y1 - y0 - 2)))
+        draw.line([(x0 - 5, y), (x0, y)], fill=(0, 0, 0), width=1)
+        draw.text((x0 - 8, y), f"{tick:g}", fill=(0, 0, 0), font=font, anchor="rm")
+
+
+def render_fast_histogram(pre, output_path):
+    # Közvetlen raszteres rajzolás a sablonra, új matplotlib ábra nélkül
+    from PIL import Image, ImageDraw
+
+    template = _get_template()
+    s_counts, v_counts, h_counts = hsv_histogram_counts(pre)
+    pixels = template["pixels"].astype(np.float32)
+
+    ax1, ax2 = template["axes"]
+    ymax1 = max(s_counts.max(), v_counts.max(), 1) * 1.05
+    ymax2 = max(h_counts.max(), 1) * 1.05
+    _draw_bars(pixels, ax1, s_counts, ymax1, _S_COLOR, 0.5)
+    _draw_bars(pixels, ax1, v_counts, ymax1, _V_COLOR, 0.5)
+    _draw_bars(pixels, ax2, h_counts, ymax2, _H_COLOR, 1.0)
+
+    # a jelmagyarázat az oszlopok fölé kerül, ahogy a matplotlib-ben
+    for lx0, ly0, lx1, ly1 in template["legends"]:
+        pixels[ly0:ly1, lx0:lx1] = template["pixels"][ly0:ly1, lx0:lx1]
+
+    image = Image.fromarray(pixels.astype(np.uint8), "RGB")
+    draw = ImageDraw.Draw(image)
+    _draw_y_axis(draw, ax1, ymax1, template["font"])
+    _draw_y_axis(draw, ax2, ymax2, template["font"])
+
+    image.save(output_path, "PNG", compress_level=PNG_COMPRESS_LEVEL)
+    return output_path
+
+
+@instrumented("create_hsv_histogram")
+def create_hsv_histogram(image_path, output_dir="histograms", backend=DEFAULT_BACKEND):
+    # image_path lehet útvonal vagy ImageContext; a gyors háttér a prepare_image
+    # (a kontextuson gyorsítótárazott) tömbjeit használja, nem dekódol újra
+    if backend not in HISTOGRAM_BACKENDS:
+        raise ValueError(f"Ismeretlen hisztogram háttér: {backend}")
+
+    ctx = as_image_context(image_path)
+    output_path = histogram_path(ctx.filename, output_dir)
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+
+    if backend == "fast":
+        from colors import prepare_image
+        return render_fast_histogram(prepare_image(ctx), output_path)
+
+    return _matplotlib_histogram(ctx, output_path)
+
+
+def _matplotlib_histogram(ctx, output_path):
+    plt = _pyplot()
+
+    # A read_exif által már elkészített bélyegképet használjuk, ha kontextust kapunk
+    image = ctx.thumbnail
 
     # RGB → HSV átalakítás
     hsv_image = image.convert('HSV')
@@ -40,7 +230,6 @@ def create_hsv_histogram(image_path, output_dir="histograms"):
     ax2.set_title("Hue (H) eloszlása")
     ax2.legend()
 
-    output_path = os.path.join(output_dir, f"hisztogram_{os.path.basename(image_path)}.png")
     fig.savefig(output_path, bbox_inches='tight')
     plt.close(fig)
 
@@ -1,39 +1,99 @@
 import os
-import exifread
-import joblib
-import pandas as pd
-from openpyxl import Workbook
-from histogram import create_hsv_histogram
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
+from histogram import create_hsv_histogram, histogram_path, DEFAULT_BACKEND as DEFAULT_HISTOGRAM_BACKEND
+from feature_cache import FeatureCache
+from dedup_index import DedupIndex, image_signature, strip_marks
+from report_writer import ExcelReportWriter, open_report_writer
+from result_table import ResultTable, RESULT_FLUSH_ROWS
+from prefetch import bounded_map, PREFETCH_DEPTH, PREFETCH_MB, MAX_PREFETCH_THREADS
+from discovery import iter_images, relative_name
+import color_batch
+from compact_forest import CompactForest, load_forest, resolve_model_path, FOREST_SUFFIX
+import sharding
+from image_context import ImageContext, as_image_context
+import image_context
+import instrumentation
+from instrumentation import instrumented, image_scope
 from colors import (
     prepare_image,
-    get_average_hsv,
-    get_dominant_hsv,
-    get_dominant_colors_hsv,
-    estimate_white_balance,
-    estimate_dynamic_range,
     estimate_color_depth,
-    get_color_distribution,
     pct
 )
+from features import image_features
 
 try:
-    from features import extract_features_for_training
+    from features import extract_features_for_training, structural_config, configure_structural
 except Exception:
     extract_features_for_training = None
+    structural_config = None
+    configure_structural = None
 
-# Random Forest modell betöltése
-try:
-    rf_model, rf_features = joblib.load("rf_model.pkl")
-    print("Random Forest modell betöltve.")
-except Exception:
-    rf_model = None
-    rf_features = None
-    print("Random Forest modell nem található, kategorizálás kihagyva.")
+MODEL_PATH = "rf_model.pkl"
+DEFAULT_OUTPUT = "kep_szinelemzes_eredmenyek.xlsx"
+
+rf_model = None
+rf_features = None
+_rf_loaded = False
 
 
+def load_rf_model(model_path=MODEL_PATH, verbose=True):
+    # Random Forest modell betöltése (folyamatonként egyszer).
+    # Ha a pickle mellett belőle készült kompakt változat is van (rf_model.forest; a fejléc
+    # a pickle méretét és hash-ét tárolja, lásd resolve_model_path), azt töltjük be
+    # (memmap, sklearn nélkül); különben a joblib pickle-t. A joblib/sklearn
+    # importja is csak ekkor történik, hogy az indulás gyors maradjon.
+    global rf_model, rf_features, _rf_loaded
+    _rf_loaded = True
+    try:
+        path = resolve_model_path(model_path)
+        if path.endswith(FOREST_SUFFIX):
+            rf_model = load_forest(path)
+            rf_features = rf_model.feature_names
+        else:
+            import joblib
+            rf_model, rf_features = joblib.load(path)
+        if verbose:
+            print("Random Forest modell betöltve.")
+    except Exception:
+        rf_model = None
+        rf_features = None
+        if verbose:
+            print("Random Forest modell nem található, kategorizálás kihagyva.")
+    return rf_model, rf_features
+
+
+def ensure_rf_model():
+    # Lusta betöltés: az első kategorizáláskor töltjük be a modellt
+    if not _rf_loaded:
+        load_rf_model()
+    return rf_model, rf_features
+
+
+def gps_decimal(tags, coord_key, ref_key):
+    # EXIF fok / perc / másodperc (racionális számok) -> előjeles tizedes fok (D = S, W negatív)
+    tag = tags.get(coord_key)
+    if tag is None:
+        return None
+    try:
+        parts = [float(v.num) / float(v.den) if hasattr(v, "den") else float(v) for v in tag.values]
+        parts += [0.0] * (3 - len(parts))
+        value = parts[0] + parts[1] / 60.0 + parts[2] / 3600.0
+    except (ZeroDivisionError, TypeError, ValueError):
+        return None
+    ref = str(tags.get(ref_key, "")).strip().upper()
+    if ref in ("S", "W"):
+        value = -value
+    return round(value, 7)
+
+
+@instrumented("collect_exif_fields")
 def collect_exif_fields(image_path):
+    ctx = as_image_context(image_path)
     data = {
-        "Fájlnév": os.path.basename(image_path),
+        "Fájlnév": ctx.filename,
         "Gyártó": "",
         "Modell": "",
         "Készítés ideje": "",
@@ -65,13 +125,15 @@ def collect_exif_fields(image_path):
         "Dinamikatartomány": 0,
         "HDR jellemző": "",
         "Színmélység (bit)": 0,
+        # Utólag bevezetett oszlopok: az analyze_image_row a sor végére teszi őket
+        "GPS szélesség (fok)": None,
+        "GPS hosszúság (fok)": None,
     }
 
     try:
         # EXIF olvasás
-        if image_path.lower().endswith((".jpg", ".jpeg")):
-            with open(image_path, 'rb') as f:
-                tags = exifread.process_file(f)
+        if ctx.is_jpeg:
+            tags = ctx.exif_tags
 
             if not tags:
                 data["Megjegyzés"] = "Nincsenek EXIF metaadatok"
@@ -86,6 +148,8 @@ def collect_exif_fields(image_path):
                     data["GPS szélesség"] = str(tags["GPS GPSLatitude"])
                 if "GPS GPSLongitude" in tags:
                     data["GPS hosszúság"] = str(tags["GPS GPSLongitude"])
+                data["GPS szélesség (fok)"] = gps_decimal(tags, "GPS GPSLatitude", "GPS GPSLatitudeRef")
+                data["GPS hosszúság (fok)"] = gps_decimal(tags, "GPS GPSLongitude", "GPS GPSLongitudeRef")
 
                 if not any([
                     data["Gyártó"],
@@ -103,22 +167,27 @@ def collect_exif_fields(image_path):
     return data
 
 
+@instrumented("fill_color_features")
 def fill_color_features(image_path, base_data):
+    ctx = as_image_context(image_path)
+    image_path = ctx.path
 
-    pre = prepare_image(image_path, full_res_dynamic=False)
+    pre = prepare_image(ctx, full_res_dynamic=False)
+    # Közös, lusta jellemzőobjektum: az RF jellemzővektor ugyanezeket az értékeket használja
+    fs = image_features(image_path, pre)
 
     # Színelemzés
-    h, s, v = get_average_hsv(image_path, pre=pre)
+    h, s, v = fs.average_hsv
     base_data["Átlagos Hue (°)"] = h
     base_data["Átlagos Sat (%)"] = s
     base_data["Átlagos Val (%)"] = v
 
-    dh, ds, dv = get_dominant_hsv(image_path, pre=pre)
+    dh, ds, dv = fs.dominant_hsv
     base_data["Domináns Hue (Hisztogram °)"] = dh
     base_data["Domináns Sat (%)"] = ds
     base_data["Domináns Val (%)"] = dv
 
-    top = get_dominant_colors_hsv(image_path, top_n=3, pre=pre)
+    top = list(fs.dominant_colors)
     while len(top) < 3:
         top.append(("", 0.0, 0.0))
 
@@ -140,11 +209,11 @@ def fill_color_features(image_path, base_data):
         f"{top[2][0]} ({top[2][1]}% – {top[2][2]}°)"
     )
 
-    r_ratio, g_ratio, b_ratio, wb_text = estimate_white_balance(image_path, pre=pre)
+    r_ratio, g_ratio, b_ratio, wb_text = fs.white_balance
 
-    v_min, v_max, dyn_range, hdr_text = estimate_dynamic_range(image_path, pre=pre)
+    v_min, v_max, dyn_range, hdr_text = fs.dynamic_range
 
-    depth = estimate_color_depth(image_path)
+    depth = estimate_color_depth(ctx)
 
     base_data["Fehéregyensúly R arány (%)"] = r_ratio
     base_data["Fehéregyensúly G arány (%)"] = g_ratio
@@ -156,7 +225,7 @@ def fill_color_features(image_path, base_data):
     base_data["HDR jellemző"] = hdr_text
     base_data["Színmélység (bit)"] = depth
 
-    row_stats = get_color_distribution(image_path, pre=pre)
+    row_stats = fs.color_distribution
 
     def get_row_pct(prefix, r):
         val = (row_stats.get(f"{prefix}_row{r}_col0", 0) +
@@ -184,30 +253,59 @@ def fill_color_features(image_path, base_data):
     return base_data, row_stats, pre
 
 
+UNKNOWN_THR = 0.35
+# A riport sorának végére kerülő, később bevezetett oszlopok (lásd analyze_image_row)
+APPENDED_COLUMNS = ("GPS szélesség (fok)", "GPS hosszúság (fok)")
+RF_BATCH_SIZE = 256
+
+
+def model_features(image_path, data, row_stats, pre=None):
+    # features.py-ből kinyerjük a tanításhoz használt jellemzőket
+    # (kötegelt színstatisztikánál a ColorBatch.feature_matrix sorából, lásd color_batch)
+    if pre is not None and pre.get("model_feats") is not None:
+        return pre["model_feats"]
+    if extract_features_for_training is not None:
+        return extract_features_for_training(image_path, pre=pre, columns=rf_features)
+    # Még se lehetne elérni a featurest -> használjuk a 3×3 színsáv statisztikákat és a jelenlegi adatokat
+    return {**row_stats, **data}
+
+
+def rf_feature_matrix(feature_rows):
+    # Jellemző-szótárak (vagy ResultTable) -> összefüggő float32 mátrix a modell által
+    # várt oszlopsorrendben. A fák belül is float32-vel dolgoznak, így ez nem változtat az eredményen.
+    if isinstance(feature_rows, ResultTable):
+        return feature_rows.matrix(rf_features, dtype=np.float32)
+    X = np.zeros((len(feature_rows), len(rf_features)), dtype=np.float32)
+    for i, feats in enumerate(feature_rows):
+        X[i] = [feats.get(col, 0) for col in rf_features]
+    return X
+
+
+@instrumented("predict_categories")
+def predict_categories(feature_rows):
+    # Egyetlen predict_proba hívás a teljes kötegre, vektorizált "ismeretlen" küszöb
+    ensure_rf_model()
+    X = rf_feature_matrix(feature_rows)
+    if not isinstance(rf_model, CompactForest):
+        import pandas as pd
+        X = pd.DataFrame(X, columns=rf_features)  # az sklearn modell jellemzőnevekkel tanult
+    proba = rf_model.predict_proba(X)
+    labels = rf_model.classes_[proba.argmax(axis=1)].astype(object)
+    labels[proba.max(axis=1) < UNKNOWN_THR] = "ismeretlen"
+    return list(labels)
+
+
+@instrumented("fill_rf_category")
 def fill_rf_category(image_path, data, row_stats, pre=None):
+    ensure_rf_model()
     if rf_model is not None and rf_features is not None:
         try:
-            # features.py-ből kinyerjük a tanításhoz használt jellemzőket
-            if extract_features_for_training is not None:
-                model_feats = extract_features_for_training(image_path, pre=pre)
-            else:
-                # Még se lehetne elérni a featurest -> használjuk a 3×3 színsáv statisztikákat és a jelenlegi adatokat
-                model_feats = {**row_stats, **data}
-
-            # A modell által várt oszlopokat rendezzük a helyes sorrendben
-            row_for_model = {col: model_feats.get(col, 0) for col in rf_features}
-            df_row = pd.DataFrame([row_for_model])
-
-            # Becslés
-            proba = rf_model.predict_proba(df_row)[0]
-            max_proba = proba.max()
+            model_feats = model_features(image_path, data, row_stats, pre=pre)
+            if pre is not None:
+                pre["model_feats"] = model_feats
 
-            UNKNOWN_THR = 0.35
-
-            if max_proba < UNKNOWN_THR:
-                data["Becsült kategoria"] = "ismeretlen"
-            else:
-                data["Becsült kategoria"] = rf_model.classes_[proba.argmax()]
+            # Becslés (egyelemű köteg)
+            data["Becsült kategoria"] = predict_categories([model_feats])[0]
 
         except Exception as e:
             data["Becsült kategoria"] = f"Hiba RF-ben: {e}"
@@ -217,69 +315,566 @@ def fill_rf_category(image_path, data, row_stats, pre=None):
     return data
 
 
+def fill_rf_categories(items):
+    # Kötegelt RF becslés. items: (sor, jellemzők) párok; a jellemzővel
+    # rendelkező, még kategória nélküli sorok egy közös predict_proba hívást kapnak.
+    todo = [(row, feats) for row, feats in items
+            if feats is not None and row.get("Becsült kategoria") is None]
+    if not todo:
+        return
+
+    features = ResultTable(capacity=len(todo))
+    features.extend(feats for _, feats in todo)
+    try:
+        labels = predict_categories(features)
+    except Exception as e:
+        labels = [f"Hiba RF-ben: {e}"] * len(todo)
+
+    for (row, _), label in zip(todo, labels):
+        row["Becsült kategoria"] = label
+
+
 def read_exif(image_path):
+    # image_path lehet útvonal vagy ImageContext; a fájlt egyszer olvassuk be
+    with image_scope(image_path if isinstance(image_path, str) else image_path.path):
+        data, _ = analyze_image_row(image_path)
+    return data
+
+
+@instrumented("read_exif")
+def analyze_image_row(image_path, categorize=True):
+    # Egy kép sora és RF jellemzői. categorize=False esetén a kategória
+    # helye üres (None) marad, és később fill_rf_categories tölti ki kötegben.
+    ctx = as_image_context(image_path)
+    image_path = ctx.path
+
     # EXIF és alapmezők
-    data = collect_exif_fields(image_path)
+    data = collect_exif_fields(ctx)
 
     # Színjellemzők
     try:
-        data, row_stats, pre = fill_color_features(image_path, data)
+        data, row_stats, pre = fill_color_features(ctx, data)
     except Exception as e:
         data["Megjegyzés"] = f"Hiba: {e}"
         row_stats = {}
+        pre = None
 
     # Random Forest kategória
-    data = fill_rf_category(image_path, data, row_stats, pre=pre)
+    if categorize:
+        data = fill_rf_category(image_path, data, row_stats, pre=pre)
+        feats = pre.get("model_feats") if pre is not None else None
+    else:
+        feats = None
+        ensure_rf_model()
+        if rf_features is not None:
+            try:
+                feats = model_features(image_path, data, row_stats, pre=pre)
+                data["Becsült kategoria"] = None
+            except Exception as e:
+                data["Becsült kategoria"] = f"Hiba RF-ben: {e}"
+        else:
+            data["Becsült kategoria"] = "Nincs modell"
+
+    # Az utólag bevezetett oszlopok a kategória után következnek, így a korábbi
+    # riportok (és rájuk épülő feldolgozások) oszlopai nem tolódnak el
+    for key in APPENDED_COLUMNS:
+        data[key] = data.pop(key)
+    return data, feats
+
+
+def _init_worker(model_path, instrumentation_cfg=None, structural_cfg=None, exif_mode=None, color_batch_size=None,
+                 rf_feature_names=None):
+    # Worker folyamat indítása: a modellt itt egyszer töltjük be,
+    # így nem kell minden feladathoz újra átküldeni (pickle).
+    # Ha a hívó a modell jellemzőneveit adja át (a service, ahol a kategorizálás a fő
+    # folyamat kötegelőjében fut), a worker nem tölti be a modellt: a categorize=False
+    # elemzéshez a nevek elegendők.
+    global rf_features, _rf_loaded
+    if rf_feature_names is not None:
+        rf_features = list(rf_feature_names)
+        _rf_loaded = True
+    else:
+        load_rf_model(model_path, verbose=False)
+    instrumentation.configure(instrumentation_cfg)
+    if structural_cfg and configure_structural is not None:
+        configure_structural(**structural_cfg)
+    if exif_mode:
+        image_context.set_exif_mode(exif_mode)
+    if color_batch_size is not None:
+        color_batch.set_color_batch_size(color_batch_size)
+
+
+def _analyze_image(image, generate_histograms, categorize=True, histogram_backend=DEFAULT_HISTOGRAM_BACKEND,
+                   signature=False):
+    # Egy kép (útvonal vagy előreolvasott ImageContext) teljes feldolgozása;
+    # a szakaszidőket (mp) is visszaadja. signature=True esetén a duplikátum-index
+    # azonosítói (dedup_index.image_signature) is, a már beolvasott bájtokból.
+    # A kötegelt színstatisztikára (color_batch) már eltöltött idő az elemzés idejébe számít.
+    t0 = time.perf_counter()
+    ctx = as_image_context(image)
+    with image_scope(ctx.path, carry=(ctx.carried_seconds, ctx.carried_stages)):
+        info, feats = analyze_image_row(ctx, categorize=categorize)
+        sig = image_signature(ctx) if signature else None
+        t1 = time.perf_counter()
+        hist_path = create_hsv_histogram(ctx, backend=histogram_backend) if generate_histograms else None
+    timings = {"elemzes": ctx.carried_seconds + t1 - t0, "hisztogram": time.perf_counter() - t1}
+    return info, hist_path, feats, timings, sig
+
+
+def _timed_iter(items, stats, stage):
+    # Egy (lusta) forrás next() hívásaira fordított idő a stage szakaszhoz
+    items = iter(items)
+    while True:
+        t0 = time.perf_counter()
+        item = next(items, None)
+        _add_time(stats, stage, time.perf_counter() - t0)
+        if item is None:
+            return
+        yield item
+
+
+def _add_time(stats, stage, seconds):
+    if stats is not None:
+        stages = stats.setdefault("stages", {})
+        stages[stage] = stages.get(stage, 0.0) + seconds
+
+
+def is_failed_row(row):
+    # Hibás kép: a színelemzés vagy az RF becslés hibát jelzett
+    return (str(row.get("Megjegyzés", "")).startswith("Hiba")
+            or str(row.get("Becsült kategoria", "")).startswith("Hiba"))
+
+
+def _batch_columns():
+    # A színkötegből számolandó RF jellemzők (a modell oszlopsorrendjében), ha van modell
+    if extract_features_for_training is None:
+        return None
+    return ensure_rf_model()[1]
+
+
+def _analyze_chunk_task(task):
+    # Workerben fut: egy képcsomag feldolgozása a worker saját előreolvasásával
+    # (a fájlok beolvasása átfedi az előző képek elemzését), a színstatisztikák
+    # kötegben (color_batch). A mérések a worker saját összesítőjéből a szülőhöz kerülnek.
+    paths, generate_histograms, categorize, histogram_backend, prefetch, prefetch_mb, signature, root = task
+    results = [
+        _analyze_image(ctx, generate_histograms, categorize, histogram_backend, signature)
+        for ctx in color_batch.prefetched_batches(paths, prefetch, prefetch_mb, root=root, columns=_batch_columns())
+    ]
+    return results, instrumentation.drain() if instrumentation.is_enabled() else None
+
+
+def _chunked(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _iter_extracted(paths, generate_histograms, workers, chunksize, categorize, histogram_backend,
+                    prefetch=PREFETCH_DEPTH, prefetch_mb=PREFETCH_MB, signature=False, root=None):
+    # Képek feldolgozása sorosan vagy folyamatkészlettel.
+    # Az eredmények mindig a bemeneti sorrendben érkeznek vissza.
+    # prefetch / prefetch_mb: előreolvasási mélység és memóriakorlát (folyamatonként)
+    # signature: a duplikátum-index azonosítóinak számítása
+    # root: a Fájlnév és a hisztogram neve az ehhez képesti útvonal (None = fájlnév)
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    if workers <= 1:
+        for ctx in color_batch.prefetched_batches(paths, prefetch, prefetch_mb, root=root,
+                                                  columns=_batch_columns()):
+            yield _analyze_image(ctx, generate_histograms, categorize, histogram_backend, signature)
+        return
 
-    return data
+    chunksize = max(1, chunksize)
+    tasks = (
+        (chunk, generate_histograms, categorize, histogram_backend, prefetch, prefetch_mb, signature, root)
+        for chunk in _chunked(paths, chunksize)
+    )
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(
+            MODEL_PATH,
+            instrumentation.config(),
+            structural_config() if structural_config is not None else None,
+            image_context.exif_mode,
+            color_batch.color_batch_size,
+        ),
+    ) as executor:
+        # A sorrend megmarad; egy feladat chunksize képet tartalmaz (kisebb IPC költség),
+        # és workerenként legfeljebb két feladat vár, így a bemenet lustán olvasható
+        for results, snapshot in bounded_map(executor, _analyze_chunk_task, tasks, window=2 * workers):
+            instrumentation.merge(snapshot)
+            yield from results
+
+
+def _iter_computed(paths, generate_histograms, workers, chunksize, batch_size=RF_BATCH_SIZE, stats=None,
+                   histogram_backend=DEFAULT_HISTOGRAM_BACKEND, prefetch=PREFETCH_DEPTH, prefetch_mb=PREFETCH_MB,
+                   signature=False, root=None):
+    # batch_size > 1: a jellemzőket batch_size képenként gyűjtjük, és egy
+    # predict_proba hívással kategorizáljuk (batch_size <= 1: képenkénti becslés)
+    # (sor, hisztogram, jellemzők, azonosítók) négyesek; az azonosítók None-ok, ha signature=False
+    def timed(items):
+        for info, hist_path, feats, timings, sig in items:
+            for stage, seconds in timings.items():
+                _add_time(stats, stage, seconds)
+            yield info, hist_path, feats, sig
+
+    if batch_size is None or batch_size <= 1:
+        yield from timed(_iter_extracted(paths, generate_histograms, workers, chunksize, True,
+                                         histogram_backend, prefetch, prefetch_mb, signature, root))
+        return
 
+    def categorize(batch):
+        t0 = time.perf_counter()
+        fill_rf_categories([(info, feats) for info, _, feats, _ in batch])
+        _add_time(stats, "rf_koteg", time.perf_counter() - t0)
+
+    batch = []
+    for item in timed(_iter_extracted(paths, generate_histograms, workers, chunksize, False,
+                                      histogram_backend, prefetch, prefetch_mb, signature, root)):
+        batch.append(item)
+        if len(batch) >= batch_size:
+            categorize(batch)
+            yield from batch
+            batch = []
+
+    categorize(batch)
+    yield from batch
+
+
+def iter_analyzed(paths, generate_histograms=True, workers=1, chunksize=16, cache=None,
+                  batch_size=RF_BATCH_SIZE, stats=None, histogram_backend=DEFAULT_HISTOGRAM_BACKEND,
+                  prefetch=PREFETCH_DEPTH, prefetch_mb=PREFETCH_MB, dedup=None, root=None):
+    # (sor, hisztogram útvonal) párok a bemeneti sorrendben.
+    # cache megadásakor a változatlan képek a cache-ből jönnek, csak az új
+    # vagy módosult fájlok kerülnek elemzésre.
+    # batch_size: ennyi kép RF becslése történik egy kötegben
+    # stats: opcionális szótár, ebbe gyűlnek a szakaszonkénti összidők (mp)
+    # histogram_backend: "fast" (sablon + raszteres rajz) vagy "matplotlib"
+    # prefetch: ennyi fájl olvasható előre (0 = nincs), prefetch_mb: az előreolvasott bájtok korlátja
+    # dedup: DedupIndex; egy már elemzett képpel azonos tartalmú fájl a tárolt sort kapja,
+    #        a hasonló képek jelölése a dedup.near_distance szerint
+    # root: a bemeneti mappa; a Fájlnév oszlop és a hisztogram neve az ehhez képesti útvonal
+    #       (rekurzív bejárásnál az azonos nevű fájlok így megkülönböztethetők), None = fájlnév
+    if cache is None and dedup is None:
+        for info, hist_path, _, _ in _iter_computed(paths, generate_histograms, workers, chunksize,
+                                                    batch_size, stats, histogram_backend, prefetch, prefetch_mb,
+                                                    root=root):
+            yield info, hist_path
+        return
 
-def analyze_folder(folder_path, generate_histograms=True):
-    # Mappában lévő képek feldolgozása és mentése Excel-be
+    # A cache- és duplikátum-keresés lustán, a bemenettel együtt halad (folyamatos
+    # forrásnál sem kell előre végigolvasni az összes útvonalat). A queue a már
+    # osztályozott képeket tartja sorrendben: (útvonal, forrás, sor, jellemzők, gyors kulcs),
+    # forrás: "cache" / "dedup" (kész sor), "compute" (elemzendő; a hiányzó képek ugyanebben
+    # a sorrendben jutnak a _iter_computed-hoz), "wait" (egy még elemzés alatt álló, vagy
+    # az előreolvasott keresés óta az indexbe került, azonos gyors kulcsú kép után a
+    # sorra kerülésekor újra keresendő, lásd dedup_index).
+    paths = iter(paths)
+    queue = deque()
+    missing_queue = deque()
+    inflight = Counter()
+
+    def dedup_lookup(path):
+        # (találat, gyors kulcs, idő); előreolvasó szálban is futhat
+        t0 = time.perf_counter()
+        try:
+            found, quick = dedup.lookup(path)
+        except OSError:
+            found, quick = None, None
+        return found, quick, time.perf_counter() - t0
+
+    def dedup_hit(found, quick, seconds):
+        _add_time(stats, "duplikatum", seconds)
+        if found is None:
+            return None, None, quick
+        row, feats, source = found
+        row = dedup.mark(row, "azonos", source) if source is not None else dedup.mark(row)
+        return row, feats, quick
+
+    def record(path, info, feats, sig):
+        # A hasonló kép jelölése, és az elemzett kép az indexbe (ha nem hibás)
+        t0 = time.perf_counter()
+        near = dedup.near(sig)
+        if near is not None:
+            dedup.mark(info, f"hasonló ({near[1]})", near[0])
+        else:
+            dedup.mark(info, "")
+        if sig is not None and not is_failed_row(info):
+            dedup.put(sig, path, info, feats)
+        _add_time(stats, "duplikatum", time.perf_counter() - t0)
+
+    def cached(path):
+        if cache is None:
+            return None
+        t0 = time.perf_counter()
+        hit = cache.get(path)
+        _add_time(stats, "cache", time.perf_counter() - t0)
+        return hit
+
+    def looked_up():
+        # (útvonal, cache találat, duplikátum-keresés) a bemeneti sorrendben. A cache a fő
+        # szálon (stat), a duplikátum-keresés fájlolvasása (gyors kulcs, kulcsegyezéskor
+        # tartalom-hash) előreolvasó szálakban fut, legfeljebb prefetch útvonallal előrébb,
+        # így a fő szál nem vár a fájlrendszerre, mielőtt a kép előreolvasásra kerül
+        items = ((path, cached(path)) for path in paths)
+        if dedup is None:
+            yield from ((path, hit, None) for path, hit in items)
+            return
+
+        def lookup(item):
+            path, hit = item
+            return path, hit, dedup_lookup(path) if hit is None else None
+
+        if not prefetch or prefetch <= 0:
+            yield from map(lookup, items)
+            return
+        with ThreadPoolExecutor(max_workers=min(prefetch, MAX_PREFETCH_THREADS),
+                                thread_name_prefix="dedup") as pool:
+            yield from bounded_map(pool, lookup, items, window=prefetch)
+
+    lookahead = looked_up()
+
+    def classify():
+        item = next(lookahead, None)
+        if item is None:
+            return None
+        path, hit, found = item
+        if hit is not None:
+            row = strip_marks(hit[0]) if dedup is None else dedup.mark(hit[0])
+            queue.append((path, "cache", row, None, None))
+            return ""
+        if dedup is not None:
+            row, feats, quick = dedup_hit(*found)
+            if row is not None:
+                queue.append((path, "dedup", row, feats, quick))
+                return ""
+            if quick is not None and (inflight[quick] or dedup.has_quick(quick)):
+                queue.append((path, "wait", None, None, quick))
+                return ""
+            if quick is not None:
+                inflight[quick] += 1
+            queue.append((path, "compute", None, None, quick))
+            return path
+        queue.append((path, "compute", None, None, None))
+        return path
+
+    def missing():
+        while True:
+            if missing_queue:
+                yield missing_queue.popleft()
+                continue
+            path = classify()
+            if path is None:
+                return
+            if path:
+                yield path
+
+    computed = _iter_computed(missing(), generate_histograms, workers, chunksize, batch_size, stats,
+                              histogram_backend, prefetch, prefetch_mb, signature=dedup is not None, root=root)
+    while True:
+        if not queue:
+            path = classify()
+            if path is None:
+                return
+            if path:
+                missing_queue.append(path)
+
+        path, source, row, feats, quick = queue.popleft()
+        if source == "wait":
+            # A korábbi, azonos gyors kulcsú kép már az indexben van; ha mégsem azonos
+            # tartalmú (vagy hibás volt, így nem került be), itt elemezzük
+            row, feats, _ = dedup_hit(*dedup_lookup(path))
+            source = "dedup" if row is not None else "inline"
+
+        name = relative_name(path, root)
+        if row is not None:
+            # A tárolt sor más gyökérrel (vagy más fájlhoz) készülhetett
+            row["Fájlnév"] = name
+            hist_path = None
+            if generate_histograms:
+                hist_path = histogram_path(name)
+                if not os.path.exists(hist_path):
+                    hist_path = create_hsv_histogram(ImageContext(path, name=name), backend=histogram_backend)
+            if source == "dedup" and cache is not None:
+                cache.put(path, row, feats)
+            yield row, hist_path
+            continue
+
+        if source == "inline":
+            info, hist_path, feats, timings, sig = _analyze_image(
+                ImageContext(path, name=name), generate_histograms, True, histogram_backend, signature=True
+            )
+            for stage, seconds in timings.items():
+                _add_time(stats, stage, seconds)
+        else:
+            info, hist_path, feats, sig = next(computed)
+        if dedup is not None:
+            record(path, info, feats, sig)
+            if quick is not None and source == "compute":
+                inflight[quick] -= 1
+                if not inflight[quick]:
+                    del inflight[quick]
+        # Hibás sor (pl. átmeneti olvasási hiba) nem kerül a cache-be, így a következő futás újrapróbálja
+        if cache is not None and not is_failed_row(info):
+            t0 = time.perf_counter()
+            cache.put(path, info, feats)
+            _add_time(stats, "cache", time.perf_counter() - t0)
+        yield info, hist_path
+
+
+def analyze_folder(folder_path, generate_histograms=True, workers=1, chunksize=16, cache_path=None,
+                   batch_size=RF_BATCH_SIZE, output_path=DEFAULT_OUTPUT, output_format=None, verbose=True,
+                   histogram_backend=DEFAULT_HISTOGRAM_BACKEND, prefetch=PREFETCH_DEPTH, prefetch_mb=PREFETCH_MB,
+                   recursive=False, include=None, exclude=None, follow_symlinks=False, shard=None,
+                   dedup_path=None, near_distance=None, cache_hash=False):
+    # Mappában lévő képek feldolgozása és mentése Excel-be (vagy CSV / Parquet fájlba)
+    # workers: párhuzamos folyamatok száma (1 = soros, None = összes CPU mag)
+    # chunksize: egy workernek egyszerre kiosztott képek száma
+    # cache_path: tartós jellemző-cache (SQLite) útvonala, None = nincs cache
+    # cache_hash: eltérő mtime esetén a cache tartalom-hash-sel ellenőrzi, hogy a fájl változatlan-e
+    # batch_size: RF becslés kötegmérete (1 = képenkénti becslés)
+    # output_path / output_format: kimenet; a formátum alapból a kiterjesztésből jön
+    # histogram_backend: "fast" (alapértelmezés) vagy "matplotlib"
+    # prefetch / prefetch_mb: előreolvasott fájlok száma (0 = kikapcsolva) és memóriakorlátja (MB)
+    # recursive / include / exclude / follow_symlinks: fájlkeresés (lásd discovery.iter_images)
+    # shard: (i, n) esetén csak az i. shard képei, részeredményként (sharding.ShardWriter) az
+    #        output_path fájlba; a végén kész-jelölő készül, a riportot a merge állítja össze
+    # dedup_path: tartós duplikátum-index (SQLite) útvonala, None = nincs; near_distance megadásakor
+    #             a hasonló képek (pHash Hamming-távolság <= near_distance) jelölődnek a riportban
+    # Visszatérési érték: futási összesítő (képszám, hibák, kép/mp, szakaszidők)
     if not os.path.exists(folder_path):
         print(" A megadott mappa nem létezik.")
-        return
+        return None
 
-    results = []
-    for filename in os.listdir(folder_path):
-        if filename.lower().endswith(('.jpg', '.jpeg', '.png')):
-            path = os.path.join(folder_path, filename)
-            info = read_exif(path)
-            results.append(info)
+    start = time.perf_counter()
+    stats = {"stages": {}}
 
-            if generate_histograms:
-                hist_path = create_hsv_histogram(path)
-                print(f" Hisztogram mentve: {hist_path}")
+    # A fájlkeresés folyamatos: az első kép feldolgozása a bejárás befejezése előtt indul
+    paths = _timed_iter(
+        iter_images(folder_path, recursive=recursive, include=include, exclude=exclude,
+                    follow_symlinks=follow_symlinks),
+        stats, "fajlkereses",
+    )
+    selected = deque()
+    if shard is not None:
+        paths = sharding.select_shard(paths, folder_path, shard[0], shard[1], selected)
+
+    t0 = time.perf_counter()
+    ensure_rf_model()
+    _add_time(stats, "modell_betoltes", time.perf_counter() - t0)
+
+    cache = (FeatureCache(cache_path, model_path=resolve_model_path(MODEL_PATH), use_hash=cache_hash)
+             if cache_path else None)
+    dedup = (DedupIndex(dedup_path, model_path=resolve_model_path(MODEL_PATH), near_distance=near_distance)
+             if dedup_path else None)
+
+    # A sorok az oszlopos táblába kerülnek, és RESULT_FLUSH_ROWS soronként
+    # a riportba; a teljes eredménylistát nem tartjuk a memóriában
+    if shard is not None:
+        writer = sharding.ShardWriter(output_path)
+    else:
+        writer = open_report_writer(output_path, output_format)
+    table = ResultTable(capacity=RESULT_FLUSH_ROWS)
+    failed = 0
+    try:
+        for info, hist_path in iter_analyzed(
+            paths, generate_histograms, workers, chunksize, cache=cache,
+            batch_size=batch_size, stats=stats, histogram_backend=histogram_backend,
+            prefetch=prefetch, prefetch_mb=prefetch_mb, dedup=dedup, root=folder_path,
+        ):
+            t0 = time.perf_counter()
+            if shard is not None:
+                position, rel_path = selected.popleft()
+                writer.write_entry(position, rel_path, info)
+            else:
+                table.append(info)
+                if len(table) >= RESULT_FLUSH_ROWS:
+                    table.flush_to(writer)
+            _add_time(stats, "iras", time.perf_counter() - t0)
+
+            if is_failed_row(info):
+                failed += 1
+
+            if verbose:
+                if hist_path is not None:
+                    print(f" Hisztogram mentve: {hist_path}")
+
+                print(f" Feldolgozva: {info.get('Fájlnév')}")
+    finally:
+        t0 = time.perf_counter()
+        if shard is None:
+            table.flush_to(writer)
+        writer.close()
+        _add_time(stats, "iras", time.perf_counter() - t0)
+        if cache is not None:
+            cache.close()
+            if verbose:
+                print(f" Cache: {cache.hits} találat, {cache.misses} újraelemzett kép")
+        if dedup is not None:
+            dedup.close()
+            if verbose:
+                message = f" Duplikátum-index: {dedup.exact_hits} azonos tartalmú kép újrahasználva"
+                if dedup.flag_near:
+                    message += f", {dedup.near_hits} hasonló kép jelölve"
+                print(message)
+
+    elapsed = time.perf_counter() - start
+    images = writer.rows_written
+    summary = {
+        "input": folder_path,
+        "output": output_path if images else None,
+        "images": images,
+        "failed": failed,
+        "cached": cache.hits if cache is not None else 0,
+        "duplicates": dedup.exact_hits if dedup is not None else 0,
+        "near_duplicates": dedup.near_hits if dedup is not None else 0,
+        "workers": workers if workers is not None else (os.cpu_count() or 1),
+        "batch_size": batch_size,
+        "histograms": generate_histograms,
+        "elapsed_s": round(elapsed, 3),
+        "images_per_s": round(images / elapsed, 2) if elapsed > 0 else 0.0,
+        "stages_s": {stage: round(sec, 3) for stage, sec in stats["stages"].items()},
+    }
 
-            print(f" Feldolgozva: {filename}")
+    if shard is not None:
+        summary["output"] = output_path
+        summary["shard"] = f"{shard[0]}/{shard[1]}"
+        sharding.write_manifest(output_path, shard[0], shard[1], summary)
+        if verbose:
+            print(f"\nRészeredmény mentve: {output_path} ({images} kép)")
+        return summary
 
-    if not results:
+    if not images:
         print(" Nincs feldolgozható kép a mappában.")
-        return
-
-    # Excel mentés
-    save_to_excel(results)
-    print(f"\nEredmények sikeresen elmentve: kep_szinelemzes_eredmenyek.xlsx")
-
+        return summary
 
-def save_to_excel(data, output_path="kep_szinelemzes_eredmenyek.xlsx"):
-    # Adatok mentése Excel (XLSX) formátumba
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Kép színelemzés"
+    if verbose:
+        print(f"\nEredmények sikeresen elmentve: {output_path}")
+    return summary
 
-    headers = list(data[0].keys())
-    ws.append(headers)
 
-    for cell in ws[1]:
-        cell.font = cell.font.copy(bold=True)
-        cell.fill = cell.fill.copy(start_color="DDDDDD", end_color="DDDDDD", fill_type="solid")
+def collect_results(paths, generate_histograms=False, **kwargs):
+    # A képek eredményei egy oszlopos ResultTable-ben (pl. további összesítéshez;
+    # table.to_pandas() másolás nélkül ad DataFrame-et). kwargs: lásd iter_analyzed.
+    table = ResultTable()
+    for info, _ in iter_analyzed(paths, generate_histograms, **kwargs):
+        table.append(info)
+    return table
 
-    for row in data:
-        ws.append(list(row.values()))
 
-    for column_cells in ws.columns:
-        max_length = max(len(str(cell.value)) if cell.value else 0 for cell in column_cells)
-        ws.column_dimensions[column_cells[0].column_letter].width = max_length + 2
-
-    wb.save(output_path)
+def save_to_excel(data, output_path=DEFAULT_OUTPUT):
+    # Adatok (sorok listája vagy ResultTable) mentése Excel (XLSX) formátumba
+    # (write-only mód, minta alapú oszlopszélesség)
+    with ExcelReportWriter(output_path) as writer:
+        if isinstance(data, ResultTable):
+            writer.write_table(data)
+        else:
+            writer.write_many(data)
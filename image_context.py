@@ -0,0 +1,146 @@
+import io
+import os
+import exifread
+from PIL import Image
+
+THUMB_SIZE = (150, 150)
+
+# A draft dekódolás legalább ennyiszer nagyobb képet kér a bélyegképnél,
+# hogy a végső átméretezés továbbra is simítson (a 8x8-as DCT skálázás
+# önmagában érezhetően eltérő pixeleket adna a teljes dekódoláshoz képest).
+DRAFT_OVERSAMPLE = 2
+
+# EXIF olvasás módja:
+#  fast - csak az APP1 (Exif) szegmens TIFF adatait dolgozzuk fel, MakerNote és beágyazott
+#         bélyegkép nélkül; a szegmenst a PIL fejlécolvasása már kinyerte (image.info["exif"])
+#  full - exifread a teljes fájlon, alapbeállításokkal
+EXIF_MODES = ("fast", "full")
+exif_mode = "fast"
+
+
+def set_exif_mode(mode):
+    global exif_mode
+    if mode not in EXIF_MODES:
+        raise ValueError(f"Ismeretlen EXIF mód: {mode} (lehetséges: {', '.join(EXIF_MODES)})")
+    exif_mode = mode
+
+
+class ImageContext:
+    # Egy kép egyszeri megnyitása: a fájlt egyszer olvassuk be a memóriába,
+    # és ebből szolgáljuk ki az EXIF-olvasást, a PIL fejlécet (mód, méret)
+    # és az elemzéshez használt bélyegképet. Minden mező lustán számolódik.
+    # name: a riportban és a hisztogram nevében használt név (pl. a bemeneti mappához
+    # képesti útvonal rekurzív bejárásnál); alapból a fájlnév
+
+    def __init__(self, image_path, data=None, thumb_size=THUMB_SIZE, draft=True, name=None):
+        self.path = image_path
+        self.filename = name or os.path.basename(image_path)
+        self.thumb_size = thumb_size
+        self.draft = draft
+
+        self._data = data
+        self._image = None
+        self._mode = None
+        self._format = None
+        self._size = None
+        self._thumbnail = None
+        self._exif_tags = None
+        # colors.prepare_image eredménye (bélyegkép tömbök), hogy minden fogyasztó újrahasználja
+        self.prepared = None
+        # A képre az elemzés előtt (color_batch kötegben) eltöltött idő (mp) és szakaszidői;
+        # a képenkénti elemzés ideje és image_scope-ja ezt is tartalmazza
+        self.carried_seconds = 0.0
+        self.carried_stages = {}
+
+    @property
+    def data(self):
+        # Nyers fájltartalom (egyetlen open() hívás)
+        if self._data is None:
+            with open(self.path, "rb") as f:
+                self._data = f.read()
+        return self._data
+
+    @property
+    def image(self):
+        # PIL kép a fejléc alapján (a pixelek dekódolása még nem történik meg)
+        if self._image is None:
+            self._image = Image.open(io.BytesIO(self.data))
+            self._mode = self._image.mode
+            self._format = self._image.format
+            self._size = self._image.size
+        return self._image
+
+    @property
+    def mode(self):
+        # Az eredeti fájl PIL módja (a draft dekódolás előtt)
+        if self._mode is None:
+            self.image
+        return self._mode
+
+    @property
+    def format(self):
+        if self._format is None:
+            self.image
+        return self._format
+
+    @property
+    def size(self):
+        if self._size is None:
+            self.image
+        return self._size
+
+    @property
+    def is_jpeg(self):
+        return self.path.lower().endswith((".jpg", ".jpeg"))
+
+    @property
+    def exif_tags(self):
+        # exifread a memóriában lévő bájtokból dolgozik, nem nyitja meg újra a fájlt
+        if self._exif_tags is None:
+            payload = self._exif_payload() if exif_mode == "fast" else None
+            if payload is None:
+                self._exif_tags = exifread.process_file(io.BytesIO(self.data))
+            elif not payload:
+                self._exif_tags = {}
+            else:
+                self._exif_tags = exifread.process_file(
+                    io.BytesIO(payload), details=False, extract_thumbnail=False
+                )
+        return self._exif_tags
+
+    def _exif_payload(self):
+        # Az APP1 szegmens TIFF része (b"" = nincs EXIF); None, ha a PIL nem tudta
+        # megnyitni a fájlt, vagy nem JPEG - ekkor a teljes exifread olvasás marad
+        try:
+            if self.format != "JPEG":
+                return None
+            raw = self.image.info.get("exif") or b""
+        except Exception:
+            return None
+        if raw.startswith(b"Exif\x00\x00"):
+            raw = raw[6:]
+        return raw
+
+    @property
+    def thumbnail(self):
+        # Elemző bélyegkép (RGB, thumb_size). JPEG esetén a draft mód csökkentett
+        # méretű (1/2, 1/4, 1/8) DCT dekódolást kér, így a teljes felbontású
+        # pixeleket nem kell kikódolni csak azért, hogy aztán eldobjuk őket.
+        if self._thumbnail is None:
+            img = self.image
+            if self.draft and self.format == "JPEG":
+                w, h = self.thumb_size
+                img.draft("RGB", (w * DRAFT_OVERSAMPLE, h * DRAFT_OVERSAMPLE))
+            self._thumbnail = img.convert("RGB").resize(self.thumb_size)
+        return self._thumbnail
+
+    def open_full(self):
+        # Teljes felbontású kép új példányként (pl. full_res_dynamic módhoz)
+        return Image.open(io.BytesIO(self.data))
+
+
+def as_image_context(image, thumb_size=THUMB_SIZE):
+    # Útvonalat vagy meglévő kontextust fogad, és mindig ImageContext-et ad vissza
+    if isinstance(image, ImageContext):
+        return image
+    return ImageContext(image, thumb_size=thumb_size)
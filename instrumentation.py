@@ -0,0 +1,212 @@
+import sys
+import json
+import time
+import functools
+import threading
+
+# Szakaszonkénti időmérés és számlálók.
+# Kikapcsolt állapotban a dekorált függvények egyetlen globális jelző
+# ellenőrzése után közvetlenül futnak, így a költség elhanyagolható.
+# Az idők befoglalók: a read_exif ideje tartalmazza a benne futó szakaszokat is.
+
+_enabled = False
+_slow_ms = None
+
+_lock = threading.Lock()
+_stages = {}     # név -> [darab, összidő (s), min (s), max (s)]
+_counters = {}   # név -> darab
+_local = threading.local()
+
+
+def enable(slow_ms=None):
+    # slow_ms: e fölötti képenkénti idő esetén részletes figyelmeztetés
+    global _enabled, _slow_ms
+    _enabled = True
+    _slow_ms = slow_ms
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def is_enabled():
+    return _enabled
+
+
+def config():
+    # Worker folyamatoknak továbbadható beállítás
+    return {"enabled": _enabled, "slow_ms": _slow_ms}
+
+
+def configure(cfg):
+    if cfg and cfg.get("enabled"):
+        enable(cfg.get("slow_ms"))
+    else:
+        disable()
+
+
+def reset():
+    with _lock:
+        _stages.clear()
+        _counters.clear()
+
+
+def record(stage, seconds):
+    with _lock:
+        entry = _stages.get(stage)
+        if entry is None:
+            _stages[stage] = [1, seconds, seconds, seconds]
+        else:
+            entry[0] += 1
+            entry[1] += seconds
+            if seconds < entry[2]:
+                entry[2] = seconds
+            if seconds > entry[3]:
+                entry[3] = seconds
+
+    current = getattr(_local, "image", None)
+    if current is not None:
+        current[stage] = current.get(stage, 0.0) + seconds
+
+
+def count(name, n=1):
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+def instrumented(stage):
+    # Függvény dekorátor: bekapcsolt állapotban méri a hívás idejét a stage néven
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            t0 = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(stage, time.perf_counter() - t0)
+        return wrapper
+    return decorator
+
+
+class image_scope:
+    # Egy kép feldolgozásának kerete: gyűjti a képre eső szakaszidőket,
+    # és a küszöb fölötti (lassú) képeket részletezve kiírja a hibakimenetre.
+    # carry: a képre korábban, a kereten kívül (pl. kötegelt előkészítésben) eltöltött
+    #        (idő mp, szakaszidők) pár, amely ennek a képnek az idejébe beszámít.
+    # report=False: csak gyűjt (breakdown), a képet nem számolja és nem jelzi lassúnak.
+
+    def __init__(self, image_path, carry=None, report=True):
+        self.image_path = image_path
+        self.carry = carry
+        self.report = report
+        self.breakdown = None
+
+    def __enter__(self):
+        if _enabled:
+            self._outer = getattr(_local, "image", None)
+            self.breakdown = dict(self.carry[1]) if self.carry else {}
+            _local.image = self.breakdown
+            self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self.breakdown is None:
+            return False
+
+        _local.image = self._outer
+        if not self.report:
+            return False
+        total_ms = (time.perf_counter() - self._t0 + (self.carry[0] if self.carry else 0.0)) * 1000.0
+        count("kepek")
+
+        if _slow_ms is not None and total_ms > _slow_ms:
+            count("lassu_kepek")
+            parts = ", ".join(f"{k}={v * 1000.0:.1f} ms" for k, v in self.breakdown.items())
+            print(f" Lassú kép ({total_ms:.1f} ms): {self.image_path} [{parts}]", file=sys.stderr)
+        return False
+
+
+def drain():
+    # Az eddigi mérések kivétele és nullázása (workerből a szülő folyamatnak)
+    with _lock:
+        snapshot = {
+            "stages": {k: list(v) for k, v in _stages.items()},
+            "counters": dict(_counters),
+        }
+        _stages.clear()
+        _counters.clear()
+    return snapshot
+
+
+def merge(snapshot):
+    # Worker folyamattól kapott mérések hozzáadása az összesítőhöz
+    if not snapshot:
+        return
+    with _lock:
+        for stage, (n, total, lo, hi) in snapshot["stages"].items():
+            entry = _stages.get(stage)
+            if entry is None:
+                _stages[stage] = [n, total, lo, hi]
+            else:
+                entry[0] += n
+                entry[1] += total
+                entry[2] = min(entry[2], lo)
+                entry[3] = max(entry[3], hi)
+        for name, n in snapshot["counters"].items():
+            _counters[name] = _counters.get(name, 0) + n
+
+
+def summary():
+    with _lock:
+        stages = {
+            stage: {
+                "count": n,
+                "total_s": round(total, 6),
+                "mean_ms": round(total / n * 1000.0, 3) if n else 0.0,
+                "min_ms": round(lo * 1000.0, 3),
+                "max_ms": round(hi * 1000.0, 3),
+            }
+            for stage, (n, total, lo, hi) in _stages.items()
+        }
+        counters = dict(_counters)
+    return {"stages": stages, "counters": counters}
+
+
+def to_json():
+    return json.dumps(summary(), ensure_ascii=False, indent=2)
+
+
+def to_prometheus(prefix="image_analyzer"):
+    # Prometheus szöveges exportformátum
+    data = summary()
+    lines = [
+        f"# HELP {prefix}_stage_seconds Szakaszonkénti futásidő (befoglaló).",
+        f"# TYPE {prefix}_stage_seconds summary",
+    ]
+    for stage, s in data["stages"].items():
+        lines.append(f'{prefix}_stage_seconds_count{{stage="{stage}"}} {s["count"]}')
+        lines.append(f'{prefix}_stage_seconds_sum{{stage="{stage}"}} {s["total_s"]}')
+    lines.append(f"# HELP {prefix}_stage_seconds_max Leghosszabb egyedi futásidő szakaszonként.")
+    lines.append(f"# TYPE {prefix}_stage_seconds_max gauge")
+    for stage, s in data["stages"].items():
+        lines.append(f'{prefix}_stage_seconds_max{{stage="{stage}"}} {round(s["max_ms"] / 1000.0, 6)}')
+    lines.append(f"# HELP {prefix}_events_total Eseményszámlálók.")
+    lines.append(f"# TYPE {prefix}_events_total counter")
+    for name, n in data["counters"].items():
+        lines.append(f'{prefix}_events_total{{event="{name}"}} {n}')
+    return "\n".join(lines) + "\n"
+
+
+def dump(path, fmt=None):
+    # fmt: "json" vagy "prometheus" (alapból a kiterjesztésből: .prom / .txt = prometheus)
+    if fmt is None:
+        fmt = "prometheus" if path.lower().endswith((".prom", ".txt")) else "json"
+    text = to_prometheus() if fmt == "prometheus" else to_json()
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+    return path
@@ -1,5 +1,17 @@
 import os
-from image_analyzer import analyze_folder
+import sys
+import json
+import argparse
+import contextlib
+import instrumentation
+from image_analyzer import analyze_folder, DEFAULT_OUTPUT, RF_BATCH_SIZE
+from histogram import HISTOGRAM_BACKENDS, DEFAULT_BACKEND
+from features import STRUCTURAL_ENGINES, configure_structural
+from prefetch import PREFETCH_DEPTH, PREFETCH_MB
+import sharding
+from image_context import EXIF_MODES, set_exif_mode
+from color_batch import COLOR_BATCH_SIZE, set_color_batch_size
+from dedup_index import DEFAULT_DEDUP_PATH, DEFAULT_NEAR_DISTANCE, MAX_NEAR_DISTANCE
 
 
 def clear_screen():
@@ -57,6 +69,254 @@ def run_analysis():
     return True
 
 
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description="Kép színelemző - nem interaktív (batch) futtatás. "
+                    "Argumentumok nélkül az interaktív menü indul."
+    )
+    parser.add_argument("-i", "--input", required=True, help="A képek mappája")
+    parser.add_argument("-o", "--output", default=DEFAULT_OUTPUT,
+                        help=f"Kimeneti fájl (alapértelmezés: {DEFAULT_OUTPUT})")
+    parser.add_argument("-f", "--format", choices=["xlsx", "csv", "parquet"], default=None,
+                        help="Kimeneti formátum (alapból a kiterjesztésből)")
+    parser.add_argument("--histograms", action=argparse.BooleanOptionalAction, default=False,
+                        help="Hisztogramok generálása (alapértelmezés: ki)")
+    parser.add_argument("--histogram-backend", choices=HISTOGRAM_BACKENDS, default=DEFAULT_BACKEND,
+                        help=f"Hisztogram rajzoló (alapértelmezés: {DEFAULT_BACKEND})")
+    parser.add_argument("-w", "--workers", type=int, default=1,
+                        help="Párhuzamos folyamatok száma (0 = összes CPU mag, alapértelmezés: 1)")
+    parser.add_argument("--chunksize", type=int, default=16,
+                        help="Egy workernek egyszerre kiosztott képek száma")
+    parser.add_argument("-b", "--batch-size", type=int, default=RF_BATCH_SIZE,
+                        help=f"RF becslés kötegmérete (alapértelmezés: {RF_BATCH_SIZE})")
+    parser.add_argument("-r", "--recursive", action="store_true",
+                        help="Almappák bejárása (pl. év/hónap/nap szerkezetű archívum)")
+    parser.add_argument("--include", action="append", default=None, metavar="GLOB",
+                        help="Csak az ilyen mintájú fájlok (ismételhető, pl. --include '2023/*')")
+    parser.add_argument("--exclude", action="append", default=None, metavar="GLOB",
+                        help="Kihagyott fájlok / mappák mintája (ismételhető, pl. --exclude thumbs)")
+    parser.add_argument("--follow-symlinks", action="store_true", help="Szimbolikus linkek követése")
+    parser.add_argument("--shard", type=sharding.parse_shard, default=None, metavar="I/N",
+                        help="Csak az I. shard képei (0 <= I < N), részeredményként a --shard-dir mappába; "
+                             "a riportot a 'main.py merge' állítja össze")
+    parser.add_argument("--shard-dir", default=sharding.DEFAULT_SHARD_DIR,
+                        help=f"A részeredmények közös mappája (alapértelmezés: {sharding.DEFAULT_SHARD_DIR})")
+    parser.add_argument("--prefetch", type=int, default=PREFETCH_DEPTH,
+                        help="Előreolvasott fájlok száma folyamatonként (0 = kikapcsolva); hálózati tárolónál érdemes növelni")
+    parser.add_argument("--prefetch-mb", type=int, default=PREFETCH_MB,
+                        help="Az előreolvasott, még fel nem dolgozott fájlok memóriakorlátja folyamatonként (MB)")
+    parser.add_argument("--exif-mode", choices=EXIF_MODES, default="fast",
+                        help="EXIF olvasás: fast (csak az Exif fejléc, MakerNote és bélyegkép nélkül) vagy full")
+    parser.add_argument("--color-batch", type=int, default=COLOR_BATCH_SIZE,
+                        help="Ennyi kép színstatisztikája számolódik egy NumPy kötegben (0 = képenként)")
+    parser.add_argument("--structural-engine", choices=STRUCTURAL_ENGINES, default="full",
+                        help="Strukturális jellemzők: full (Canny + Hough) vagy fast (olcsóbb becslés)")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="A Hough-transzformáció véletlen magja (reprodukálható, cache-elhető eredmény)")
+    parser.add_argument("--cache", default=None, help="Tartós jellemző-cache (SQLite) útvonala")
+    parser.add_argument("--cache-hash", action="store_true",
+                        help="A cache tartalom-hash-t is tárol: másolt / visszaállított (más mtime-ú), "
+                             "de változatlan fájl is találat")
+    parser.add_argument("--dedup", nargs="?", const=DEFAULT_DEDUP_PATH, default=None, metavar="PATH",
+                        help="Duplikátum-index (SQLite): az azonos tartalmú képek a korábbi eredményt kapják "
+                             f"újraelemzés nélkül (alapértelmezett útvonal: {DEFAULT_DEDUP_PATH})")
+    parser.add_argument("--near-duplicates", nargs="?", type=int, const=DEFAULT_NEAR_DISTANCE, default=None,
+                        choices=range(MAX_NEAR_DISTANCE + 1), metavar="D",
+                        help="Hasonló képek jelölése a riportban (perceptuális hash, legfeljebb D bit eltérés, "
+                             f"alapból {DEFAULT_NEAR_DISTANCE}); a --dedup indexet használja")
+    parser.add_argument("--json-summary", default=None, metavar="PATH",
+                        help="Gépi feldolgozásra szánt JSON összesítő ('-' = standard kimenet)")
+    parser.add_argument("--metrics", default=None, metavar="PATH",
+                        help="Szakaszonkénti mérések mentése (.json, vagy .prom = Prometheus szöveg)")
+    parser.add_argument("--slow-ms", type=float, default=None,
+                        help="E fölötti képenkénti idő esetén részletes kiírás (bekapcsolja a mérést)")
+    parser.add_argument("-q", "--quiet", action="store_true", help="Képenkénti kiírás kikapcsolása")
+    return parser.parse_args(argv)
+
+
+def print_summary(summary):
+    print("\nÖsszesítés")
+    print(f"  Képek:        {summary['images']}")
+    print(f"  Hibás képek:  {summary['failed']}")
+    print(f"  Cache-ből:    {summary['cached']}")
+    print(f"  Duplikátum:   {summary['duplicates']}")
+    print(f"  Teljes idő:   {summary['elapsed_s']:.2f} s")
+    print(f"  Áteresztés:   {summary['images_per_s']:.2f} kép/s")
+    print("  Szakaszidők (összesen, worker-időkkel együtt):")
+    for stage, seconds in summary["stages_s"].items():
+        print(f"    {stage:<12} {seconds:.3f} s")
+
+
+def run_batch(argv):
+    # Nem interaktív futtatás ütemezőkből (cron stb.); kilépési kód: 0 = ok, 1 = hiba
+    args = parse_args(argv)
+
+    if not os.path.isdir(args.input):
+        print(f"A megadott mappa nem létezik: {args.input}", file=sys.stderr)
+        return 1
+
+    if args.near_duplicates is not None and not args.dedup:
+        print("A --near-duplicates kapcsolóhoz a --dedup index is szükséges.", file=sys.stderr)
+        return 1
+
+    configure_structural(args.structural_engine, args.seed)
+    set_exif_mode(args.exif_mode)
+    set_color_batch_size(args.color_batch)
+
+    output_path = args.output
+    if args.shard is not None:
+        output_path = sharding.shard_path(args.shard_dir, *args.shard)
+
+    if args.metrics or args.slow_ms is not None:
+        instrumentation.enable(slow_ms=args.slow_ms)
+
+    # JSON a standard kimeneten: a folyamatüzenetek a hibakimenetre kerülnek
+    log_target = sys.stderr if args.json_summary == "-" else sys.stdout
+    with contextlib.redirect_stdout(log_target):
+        summary = analyze_folder(
+            args.input,
+            generate_histograms=args.histograms,
+            histogram_backend=args.histogram_backend,
+            workers=args.workers if args.workers > 0 else None,
+            chunksize=args.chunksize,
+            prefetch=args.prefetch,
+            prefetch_mb=args.prefetch_mb,
+            recursive=args.recursive,
+            include=args.include,
+            exclude=args.exclude,
+            follow_symlinks=args.follow_symlinks,
+            cache_path=args.cache,
+            cache_hash=args.cache_hash,
+            dedup_path=args.dedup,
+            near_distance=args.near_duplicates,
+            batch_size=args.batch_size,
+            output_path=output_path,
+            output_format=args.format,
+            verbose=not args.quiet,
+            shard=args.shard,
+        )
+    if summary is None:
+        return 1
+
+    if args.metrics:
+        instrumentation.dump(args.metrics)
+
+    if args.json_summary == "-":
+        print(json.dumps(summary, ensure_ascii=False, indent=2))
+    else:
+        print_summary(summary)
+        if args.json_summary:
+            with open(args.json_summary, "w", encoding="utf-8") as f:
+                json.dump(summary, f, ensure_ascii=False, indent=2)
+
+    return 0
+
+
+def run_merge(argv):
+    # A shardok részeredményeinek egyesítése egy riportba; kilépési kód: 0 = ok, 1 = hiba
+    parser = argparse.ArgumentParser(
+        prog="main.py merge",
+        description="A --shard futások részeredményeinek egyesítése egy riportba",
+    )
+    parser.add_argument("shard_dir", nargs="?", default=sharding.DEFAULT_SHARD_DIR,
+                        help=f"A részeredmények mappája (alapértelmezés: {sharding.DEFAULT_SHARD_DIR})")
+    parser.add_argument("-o", "--output", default=DEFAULT_OUTPUT,
+                        help=f"Kimeneti fájl (alapértelmezés: {DEFAULT_OUTPUT})")
+    parser.add_argument("-f", "--format", choices=["xlsx", "csv", "parquet"], default=None,
+                        help="Kimeneti formátum (alapból a kiterjesztésből)")
+    parser.add_argument("--allow-missing", action="store_true",
+                        help="Hiányzó / befejezetlen shardok mellett is elkészül a riport")
+    parser.add_argument("--json-summary", default=None, metavar="PATH",
+                        help="Összesítő JSON fájlba ('-' = standard kimenet)")
+    args = parser.parse_args(argv)
+
+    try:
+        summary = sharding.merge_shards(args.shard_dir, args.output, args.format, args.allow_missing)
+    except (OSError, ValueError, RuntimeError) as e:
+        print(f"Egyesítés sikertelen: {e}", file=sys.stderr)
+        return 1
+
+    if args.json_summary == "-":
+        print(json.dumps(summary, ensure_ascii=False, indent=2))
+        return 0
+
+    print(f"Egyesítve: {summary['merged_shards']}/{summary['shards']} shard, {summary['images']} kép"
+          f" ({summary['duplicates']} ismétlődő kihagyva) -> {summary['output']}")
+    if summary["missing_shards"]:
+        print(f"Figyelem: hiányzó shardok: {', '.join(map(str, summary['missing_shards']))}", file=sys.stderr)
+    if args.json_summary:
+        with open(args.json_summary, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+def run_serve(argv):
+    # Hosszan futó helyi elemző szolgáltatás (lásd analysis_server.py); Ctrl+C = leállítás
+    import analysis_server as srv
+
+    parser = argparse.ArgumentParser(
+        prog="main.py serve",
+        description="Helyi elemző szolgáltatás: betöltött modell, képbájtok vagy útvonal -> JSON sor",
+    )
+    parser.add_argument("--host", default=srv.DEFAULT_HOST, help=f"Cím (alapértelmezés: {srv.DEFAULT_HOST})")
+    parser.add_argument("--port", type=int, default=srv.DEFAULT_PORT,
+                        help=f"Port (alapértelmezés: {srv.DEFAULT_PORT}; 0 = szabad port)")
+    parser.add_argument("--unix-socket", default=None, metavar="PATH",
+                        help="Unix socket a TCP port helyett")
+    parser.add_argument("-w", "--workers", type=int, default=1,
+                        help="Elemző worker folyamatok száma (0 = a kérést kiszolgáló szálon, alapértelmezés: 1)")
+    parser.add_argument("--queue-depth", type=int, default=srv.DEFAULT_QUEUE_DEPTH,
+                        help=f"Legfeljebb ennyi befogadott, még nem kész kérés (alapértelmezés: {srv.DEFAULT_QUEUE_DEPTH})")
+    parser.add_argument("--backpressure", choices=srv.BACKPRESSURE_MODES, default="reject",
+                        help="Teli sornál: reject (azonnali 503) vagy wait (várakozás az időkorlátig)")
+    parser.add_argument("--timeout", type=float, default=srv.DEFAULT_TIMEOUT_S,
+                        help=f"Kérésenkénti időkorlát mp-ben (alapértelmezés: {srv.DEFAULT_TIMEOUT_S:g}; túllépéskor 504)")
+    parser.add_argument("--batch-wait-ms", type=float, default=srv.DEFAULT_BATCH_WAIT_MS,
+                        help="Ennyit várhat egy kép az RF köteg feltöltésére, ha más kérés is elemzés alatt áll "
+                             f"(alapértelmezés: {srv.DEFAULT_BATCH_WAIT_MS:g})")
+    parser.add_argument("-b", "--max-batch", type=int, default=RF_BATCH_SIZE,
+                        help=f"RF köteg legnagyobb mérete (alapértelmezés: {RF_BATCH_SIZE})")
+    parser.add_argument("--max-upload-mb", type=int, default=srv.DEFAULT_MAX_UPLOAD_MB,
+                        help=f"Feltöltött kép legnagyobb mérete MB-ban (alapértelmezés: {srv.DEFAULT_MAX_UPLOAD_MB})")
+    parser.add_argument("--no-paths", action="store_true",
+                        help="Csak feltöltött képbájtok; útvonal szerinti elemzés tiltva")
+    parser.add_argument("--exif-mode", choices=EXIF_MODES, default="fast", help="EXIF olvasás: fast vagy full")
+    parser.add_argument("--structural-engine", choices=STRUCTURAL_ENGINES, default="full",
+                        help="Strukturális jellemzők: full vagy fast")
+    parser.add_argument("--seed", type=int, default=None, help="A Hough-transzformáció véletlen magja")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Kérésenkénti naplózás")
+    args = parser.parse_args(argv)
+
+    configure_structural(args.structural_engine, args.seed)
+    set_exif_mode(args.exif_mode)
+    try:
+        srv.serve(
+            host=args.host,
+            port=args.port,
+            unix_socket=args.unix_socket,
+            workers=max(0, args.workers),
+            queue_depth=args.queue_depth,
+            timeout_s=args.timeout,
+            backpressure=args.backpressure,
+            batch_wait_ms=args.batch_wait_ms,
+            max_batch=args.max_batch,
+            max_upload_mb=args.max_upload_mb,
+            allow_paths=not args.no_paths,
+            verbose=args.verbose,
+        )
+    except (OSError, ValueError) as e:
+        print(f"A szolgáltatás nem indult el: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
 if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "merge":
+        sys.exit(run_merge(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == "serve":
+        sys.exit(run_serve(sys.argv[2:]))
+    if len(sys.argv) > 1:
+        sys.exit(run_batch(sys.argv[1:]))
+
     clear_screen()
     main_menu()
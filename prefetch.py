@@ -0,0 +1,89 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from discovery import relative_name
+from image_context import ImageContext
+
+# Előreolvasás: ennyi fájl olvasása lehet folyamatban / várakozhat feldolgozásra
+PREFETCH_DEPTH = 8
+# A beolvasott, még fel nem dolgozott fájlok összmérete (MB) e fölött nem nő tovább
+PREFETCH_MB = 256
+MAX_PREFETCH_THREADS = 16
+
+
+def _load(path, exif, root=None):
+    # Szálban fut: a nyers bájtok (és az EXIF) beolvasása egy ImageContext-be.
+    # Hiba esetén a kontextust így is visszaadjuk; az elemzés ugyanott és ugyanazzal
+    # a hibával áll meg, mint előreolvasás nélkül.
+    ctx = ImageContext(path, name=relative_name(path, root))
+    try:
+        ctx.data
+        if exif and ctx.is_jpeg:  # mint a collect_exif_fields: EXIF-et csak JPEG-ből olvasunk
+            ctx.exif_tags
+    except Exception:
+        pass
+    return ctx
+
+
+def context_bytes(contexts):
+    # A kontextusokban tartott (beolvasott) nyers bájtok összesen
+    return sum(len(ctx._data or b"") for ctx in contexts)
+
+
+def _buffered_bytes(pending):
+    return context_bytes(f.result() for f in pending if f.done())
+
+
+def prefetch_contexts(paths, depth=PREFETCH_DEPTH, max_mb=PREFETCH_MB, exif=True, root=None, held=None):
+    # ImageContext-ek a bemeneti sorrendben. Egy szálkészlet legfeljebb depth fájlt
+    # olvas előre, amíg a korábbi képek dekódolása / elemzése fut; a pufferelt
+    # bájtok max_mb fölött nem indul új olvasás (a folyamatban lévők még befejeződnek).
+    # depth <= 0: nincs előreolvasás, minden kép a feldolgozáskor olvasódik be.
+    # root: a kontextusok neve az ehhez képesti útvonal (lásd discovery.relative_name)
+    # held: függvény, amely a fogyasztónál még feldolgozatlanul tartott (pl. színkötegbe
+    #       gyűjtött) kontextusok bájtjait adja; ezek is a max_mb korlátba számítanak
+    if not depth or depth <= 0:
+        for path in paths:
+            yield ImageContext(path, name=relative_name(path, root))
+        return
+
+    max_bytes = max_mb * (1 << 20) if max_mb else None
+    paths = iter(paths)
+    pending = deque()
+    pool = ThreadPoolExecutor(max_workers=min(depth, MAX_PREFETCH_THREADS), thread_name_prefix="prefetch")
+    try:
+        exhausted = False
+        while True:
+            while not exhausted and len(pending) < depth and (
+                not pending or max_bytes is None
+                or _buffered_bytes(pending) + (held() if held else 0) < max_bytes
+            ):
+                path = next(paths, None)
+                if path is None:
+                    exhausted = True
+                    break
+                pending.append(pool.submit(_load, path, exif, root))
+            if not pending:
+                break
+            yield pending.popleft().result()
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def bounded_map(executor, fn, iterable, window):
+    # Mint az executor.map, de a bemenetet lustán olvassa: egyszerre legfeljebb
+    # window feladat van beküldve, így egy folyamatos (pl. mappabejáró) forrás
+    # feldolgozása azonnal indulhat, és a függő futures száma sem nő korlátlanul.
+    # Az eredmények a bemeneti sorrendben érkeznek.
+    items = iter(iterable)
+    pending = deque()
+    try:
+        for item in items:
+            pending.append(executor.submit(fn, item))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
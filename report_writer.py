@@ -0,0 +1,285 @@
+import csv
+import importlib.util
+import os
+
+from result_table import _is_number
+
+EXCEL_MAX_ROWS = 1_048_576
+SHEET_TITLE = "Kép színelemzés"
+WIDTH_SAMPLE_ROWS = 200
+PARQUET_ROW_GROUP = 10_000
+
+
+def _plain(value):
+    # numpy skalárok -> beépített Python típusok
+    if hasattr(value, "item"):
+        return value.item()
+    return value
+
+
+class ReportWriter:
+    # Folyamatos (streaming) riportíró: a sorokat elkészültükkor írja ki,
+    # nem tartja a teljes eredménylistát a memóriában.
+    # A fejlécet az első sor kulcsai adják, a fájl az első sornál nyílik meg.
+
+    def __init__(self, output_path):
+        self.output_path = output_path
+        self.headers = None
+        self.rows_written = 0
+
+    def write(self, row):
+        if self.headers is None:
+            self.headers = list(row.keys())
+            self._open()
+        self._write_values([_plain(row.get(h)) for h in self.headers])
+        self.rows_written += 1
+
+    def write_many(self, rows):
+        for row in rows:
+            self.write(row)
+
+    def write_table(self, table):
+        # result_table.ResultTable kiírása; az alapértelmezés soronként ír
+        for row in table.iter_rows():
+            self.write(row)
+
+    def close(self):
+        if self.headers is not None:
+            self._close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _open(self):
+        raise NotImplementedError
+
+    def _write_values(self, values):
+        raise NotImplementedError
+
+    def _close(self):
+        raise NotImplementedError
+
+
+class ExcelReportWriter(ReportWriter):
+    # openpyxl write-only mód: a sorok azonnal a (tömörített) munkalapra kerülnek.
+    # Az oszlopszélességeket az első WIDTH_SAMPLE_ROWS sor mintájából becsüljük,
+    # és az Excel sorkorlátjánál új munkalapot kezdünk.
+
+    def __init__(self, output_path, sample_rows=WIDTH_SAMPLE_ROWS, max_rows=EXCEL_MAX_ROWS):
+        super().__init__(output_path)
+        self.sample_rows = sample_rows
+        self.max_rows = max_rows
+        self._sample = []
+        self._widths = None
+        self._ws = None
+        self._ws_rows = 0
+        self._sheets = 0
+
+    def _open(self):
+        from openpyxl import Workbook
+
+        self._wb = Workbook(write_only=True)
+
+    def _write_values(self, values):
+        if self._widths is None:
+            self._sample.append(values)
+            if len(self._sample) >= self.sample_rows:
+                self._flush_sample()
+            return
+        self._append(values)
+
+    def _flush_sample(self):
+        self._widths = [len(str(h)) if h else 0 for h in self.headers]
+        for values in self._sample:
+            for i, value in enumerate(values):
+                if value:
+                    self._widths[i] = max(self._widths[i], len(str(value)))
+
+        sample, self._sample = self._sample, []
+        for values in sample:
+            self._append(values)
+
+    def _new_sheet(self):
+        from openpyxl.cell import WriteOnlyCell
+        from openpyxl.styles import Font, PatternFill
+        from openpyxl.utils import get_column_letter
+
+        self._sheets += 1
+        title = SHEET_TITLE if self._sheets == 1 else f"{SHEET_TITLE} {self._sheets}"
+        ws = self._wb.create_sheet(title=title)
+
+        # write-only módban a szélességet az első sor előtt kell beállítani
+        for i, width in enumerate(self._widths, start=1):
+            ws.column_dimensions[get_column_letter(i)].width = width + 2
+
+        font = Font(bold=True)
+        fill = PatternFill(start_color="DDDDDD", end_color="DDDDDD", fill_type="solid")
+        header_cells = []
+        for h in self.headers:
+            cell = WriteOnlyCell(ws, value=h)
+            cell.font = font
+            cell.fill = fill
+            header_cells.append(cell)
+        ws.append(header_cells)
+
+        self._ws = ws
+        self._ws_rows = 1
+
+    def _append(self, values):
+        if self._ws is None or self._ws_rows >= self.max_rows:
+            self._new_sheet()
+        self._ws.append(values)
+        self._ws_rows += 1
+
+    def _close(self):
+        if self._widths is None:
+            self._flush_sample()
+        self._wb.save(self.output_path)
+
+
+class CsvReportWriter(ReportWriter):
+    # CSV kimenet: soronként íródik és ürül, így megszakadt futás után is
+    # megmarad minden addig elkészült sor. utf-8-sig, hogy az Excel is jól olvassa.
+
+    def __init__(self, output_path, flush_every=100):
+        super().__init__(output_path)
+        self.flush_every = flush_every
+
+    def _open(self):
+        self._file = open(self.output_path, "w", newline="", encoding="utf-8-sig")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(self.headers)
+
+    def _write_values(self, values):
+        self._writer.writerow(values)
+        if (self.rows_written + 1) % self.flush_every == 0:
+            self._file.flush()
+
+    def _close(self):
+        self._file.close()
+
+
+class ParquetReportWriter(ReportWriter):
+    # Parquet kimenet (pyarrow szükséges): PARQUET_ROW_GROUP soronként egy row group.
+    # A séma az oszlopok fajtájából készül (ResultTable.kind, soronkénti írásnál ugyanazzal
+    # a szabállyal): szám -> float64, szöveg -> string; nem az első row group adataiból
+    # következtetünk, így egy ott csupa üres oszlop (pl. GPS) sem kap null típust.
+    # Az egész számú oszlopok is float64-ek, mert hibás sorokban a lebegőpontos
+    # jellemzők helyén is 0 (int) állhat.
+
+    def __init__(self, output_path, row_group_size=PARQUET_ROW_GROUP):
+        super().__init__(output_path)
+        self.row_group_size = row_group_size
+        self._buffer = []
+        self._writer = None
+        self._schema = None
+
+    def _open(self):
+        # A pyarrow hiánya már az első sornál kiderül (az importja az első kiírásig várhat)
+        if importlib.util.find_spec("pyarrow") is None:
+            raise ImportError("Parquet kimenethez a pyarrow csomag szükséges (pip install pyarrow)")
+
+    def _write_values(self, values):
+        self._buffer.append(values)
+        if len(self._buffer) >= self.row_group_size:
+            self._flush()
+
+    def write_table(self, table):
+        # Oszlopos út: a ResultTable tömbjei közvetlenül Arrow tömbökké alakulnak.
+        # Ha egy oszlop nem illeszthető a sémába (pl. vegyes típusú értékek), soronként írunk.
+        import pyarrow as pa
+
+        if self.headers is None:
+            self.headers = list(table.columns)
+            self._open()
+        same_columns = list(table.columns) == self.headers
+        if self._schema is None and same_columns and not self._buffer:
+            self._start([table.kind(name) for name in self.headers])
+        arrays = self._table_arrays(table) if same_columns and self._schema is not None else None
+        if arrays is None:
+            return super().write_table(table)
+
+        self._flush()
+        self._writer.write_table(pa.Table.from_arrays(arrays, schema=self._schema))
+        self.rows_written += len(table)
+
+    def _start(self, kinds):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self._schema = pa.schema([
+            pa.field(name, pa.float64() if kind == "numeric" else pa.string())
+            for name, kind in zip(self.headers, kinds)
+        ])
+        self._writer = pq.ParquetWriter(self.output_path, self._schema)
+
+    def _table_arrays(self, table):
+        import pyarrow as pa
+
+        arrays = []
+        for i, name in enumerate(self.headers):
+            if table.kind(name) == "numeric":
+                arr = pa.array(table.column(name), from_pandas=True)  # NaN -> null
+            else:
+                codes, categories = table.codes(name)
+                if not all(isinstance(c, str) for c in categories):
+                    return None
+                arr = pa.DictionaryArray.from_arrays(
+                    pa.array(codes, mask=codes < 0), pa.array(categories, type=pa.string())
+                ).dictionary_decode()
+            if self._schema is not None:
+                expected = self._schema.field(i).type
+                if arr.type != expected:
+                    if arr.null_count != len(arr):
+                        return None
+                    arr = pa.nulls(len(arr), type=expected)
+            arrays.append(arr)
+        return arrays
+
+    def _flush(self):
+        import pyarrow as pa
+
+        if not self._buffer:
+            return
+
+        columns = list(zip(*self._buffer))
+        if self._schema is None:
+            # A ResultTable szabálya: csak üres és szám értékek -> számoszlop
+            self._start([
+                "numeric" if all(v is None or _is_number(v) for v in col) else "categorical"
+                for col in columns
+            ])
+
+        arrays = []
+        for col, field in zip(columns, self._schema):
+            if pa.types.is_string(field.type):
+                # Szövegoszlopba később érkező szám (a sémát egy korábbi row group adta)
+                col = [v if v is None or isinstance(v, str) else str(v) for v in col]
+            arrays.append(pa.array(col, type=field.type))
+        table = pa.Table.from_arrays(arrays, schema=self._schema)
+        self._writer.write_table(table)
+        self._buffer = []
+
+    def _close(self):
+        self._flush()
+        if self._writer is not None:
+            self._writer.close()
+
+
+WRITERS = {
+    "xlsx": ExcelReportWriter,
+    "csv": CsvReportWriter,
+    "parquet": ParquetReportWriter,
+}
+
+
+def open_report_writer(output_path, fmt=None):
+    # Formátum a kiterjesztésből (xlsx / csv / parquet), vagy fmt paraméterrel
+    if fmt is None:
+        fmt = os.path.splitext(output_path)[1].lstrip(".").lower() or "xlsx"
+    if fmt not in WRITERS:
+        raise ValueError(f"Ismeretlen kimeneti formátum: {fmt} (lehetséges: {', '.join(WRITERS)})")
+    return WRITERS[fmt](output_path)
@@ -0,0 +1,210 @@
+import numpy as np
+
+INITIAL_CAPACITY = 1024
+# Ennyi sor gyűlik az oszlopos eredménytáblában, mielőtt a riportba kerül
+RESULT_FLUSH_ROWS = 256
+
+
+def _is_number(value):
+    return isinstance(value, (int, float, np.integer, np.floating)) and not isinstance(value, (bool, np.bool_))
+
+
+class _NumericColumn:
+    # float64 tömb; a hiányzó (None) érték NaN-ként tárolódik.
+    # Értékenként jelöljük, hogy egész volt-e: visszaolvasáskor ugyanaz a típus (int / float)
+    # jön vissza, amit a sor tartalmazott, így a kimenet nem függ a sorok darabolásától.
+
+    kind = "numeric"
+
+    def __init__(self, capacity):
+        self.data = np.full(capacity, np.nan, dtype=np.float64)
+        self.ints = np.zeros(capacity, dtype=bool)
+
+    def accepts(self, value):
+        return value is None or _is_number(value)
+
+    def set(self, i, value):
+        if value is None:
+            self.data[i] = np.nan
+            self.ints[i] = False
+            return
+        self.ints[i] = isinstance(value, (int, np.integer))
+        self.data[i] = value
+
+    def get(self, i):
+        value = self.data[i]
+        if np.isnan(value):
+            return None
+        return int(value) if self.ints[i] else float(value)
+
+    def grow(self, capacity):
+        data = np.full(capacity, np.nan, dtype=np.float64)
+        data[:len(self.data)] = self.data
+        self.data = data
+        ints = np.zeros(capacity, dtype=bool)
+        ints[:len(self.ints)] = self.ints
+        self.ints = ints
+
+    def values(self, n):
+        # Nézet (nem másolat) az első n értékre
+        return self.data[:n]
+
+
+class _CategoricalColumn:
+    # Szöveges (és vegyes) oszlop kódolva: int32 kódok + a különböző értékek listája.
+    # -1 = hiányzó érték. A kategóriák a clear() után is megmaradnak.
+
+    kind = "categorical"
+
+    def __init__(self, capacity):
+        self.codes = np.full(capacity, -1, dtype=np.int32)
+        self.categories = []
+        self._index = {}
+
+    def accepts(self, value):
+        return True
+
+    def set(self, i, value):
+        if value is None:
+            self.codes[i] = -1
+            return
+        code = self._index.get(value)
+        if code is None:
+            code = self._index[value] = len(self.categories)
+            self.categories.append(value)
+        self.codes[i] = code
+
+    def get(self, i):
+        code = self.codes[i]
+        return None if code < 0 else self.categories[code]
+
+    def grow(self, capacity):
+        codes = np.full(capacity, -1, dtype=np.int32)
+        codes[:len(self.codes)] = self.codes
+        self.codes = codes
+
+    def values(self, n):
+        out = np.empty(n, dtype=object)
+        if self.categories:
+            lookup = np.empty(len(self.categories) + 1, dtype=object)
+            lookup[:-1] = self.categories
+            lookup[-1] = None
+            out[:] = lookup[self.codes[:n]]  # -1 -> utolsó elem (None)
+        return out
+
+
+class ResultTable:
+    # Oszlopos eredménytároló a soronkénti szótárak listája helyett.
+    # A számoszlopok float64 NumPy tömbök, a szövegesek (színnevek, WB típus,
+    # kategóriák) kódolt kategóriák; a sorok append()-del kerülnek be.
+    # Egy oszlop típusa az első nem üres értékből adódik; ha később nem szám
+    # érkezik egy számoszlopba, az oszlop kategória oszlopra vált.
+
+    def __init__(self, capacity=INITIAL_CAPACITY):
+        self.capacity = max(1, capacity)
+        self.columns = []
+        self._cols = {}
+        self._n = 0
+
+    def __len__(self):
+        return self._n
+
+    def _new_column(self, value):
+        if value is None or _is_number(value):
+            return _NumericColumn(self.capacity)
+        return _CategoricalColumn(self.capacity)
+
+    def _promote(self, name):
+        old = self._cols[name]
+        col = _CategoricalColumn(self.capacity)
+        for i in range(self._n):
+            col.set(i, old.get(i))
+        self._cols[name] = col
+        return col
+
+    def append(self, row):
+        if self._n >= self.capacity:
+            self.capacity *= 2
+            for col in self._cols.values():
+                col.grow(self.capacity)
+
+        i = self._n
+        for name, value in row.items():
+            if hasattr(value, "item") and not isinstance(value, np.ndarray):
+                value = value.item()
+            col = self._cols.get(name)
+            if col is None:
+                # Új oszlop: a korábbi sorokban hiányzó értékként szerepel
+                col = self._cols[name] = self._new_column(value)
+                self.columns.append(name)
+            elif not col.accepts(value):
+                col = self._promote(name)
+            col.set(i, value)
+
+        # A sorból hiányzó oszlopok értéke None
+        if len(row) < len(self.columns):
+            for name in self.columns:
+                if name not in row:
+                    self._cols[name].set(i, None)
+        self._n += 1
+
+    def extend(self, rows):
+        for row in rows:
+            self.append(row)
+
+    def clear(self):
+        # A sorok törlése (a lefoglalt tömbök és az oszlopok megmaradnak)
+        self._n = 0
+
+    def kind(self, name):
+        return self._cols[name].kind
+
+    def column(self, name):
+        # Számoszlop: nézet a tárolt tömbre; kategória oszlop: dekódolt object tömb
+        return self._cols[name].values(self._n)
+
+    def codes(self, name):
+        # Kategória oszlop kódjai (nézet) és kategóriái
+        col = self._cols[name]
+        return col.codes[:self._n], col.categories
+
+    def row(self, i):
+        if not 0 <= i < self._n:
+            raise IndexError(i)
+        return {name: self._cols[name].get(i) for name in self.columns}
+
+    def iter_rows(self):
+        cols = [(name, self._cols[name]) for name in self.columns]
+        for i in range(self._n):
+            yield {name: col.get(i) for name, col in cols}
+
+    def matrix(self, names, dtype=np.float32):
+        # Számoszlopokból összefüggő mátrix (pl. RF bemenet); hiányzó oszlop / érték = 0
+        X = np.zeros((self._n, len(names)), dtype=dtype)
+        for j, name in enumerate(names):
+            col = self._cols.get(name)
+            if col is not None and col.kind == "numeric":
+                X[:, j] = np.nan_to_num(col.values(self._n), nan=0.0)
+        return X
+
+    def to_pandas(self):
+        # DataFrame másolás nélkül: a számoszlopok a tárolt tömbök nézetei,
+        # a szövegesek pandas Categorical-ként a meglévő kódokkal
+        import pandas as pd
+
+        data = {}
+        for name in self.columns:
+            col = self._cols[name]
+            if col.kind == "numeric":
+                data[name] = col.values(self._n)
+            else:
+                data[name] = pd.Categorical.from_codes(
+                    col.codes[:self._n], categories=pd.Index(col.categories, dtype=object)
+                )
+        return pd.DataFrame(data, copy=False)
+
+    def flush_to(self, writer):
+        # A tárolt sorok kiírása egy ReportWriter-be, majd a tábla ürítése
+        if self._n:
+            writer.write_table(self)
+        self.clear()
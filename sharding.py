@@ -0,0 +1,168 @@
+import glob
+import hashlib
+import heapq
+import json
+import os
+import re
+import time
+
+from discovery import relative_name
+from report_writer import open_report_writer
+from result_table import ResultTable, RESULT_FLUSH_ROWS
+
+# Több gépes futtatás közös fájlrendszeren: az i. shard (0 <= i < n) a felderített
+# fájlok stabil, hash alapú részhalmazát dolgozza fel, és egy részeredmény fájlt
+# (JSON Lines) ír. A merge ezekből állítja össze a teljes riportot.
+
+DEFAULT_SHARD_DIR = "shards"
+_SHARD_RE = re.compile(r"shard-(\d+)-of-(\d+)\.jsonl$")
+
+
+def parse_shard(text):
+    # "I/N" -> (I, N), 0 <= I < N
+    try:
+        index, count = (int(part) for part in text.split("/"))
+    except ValueError:
+        raise ValueError(f"Érvénytelen shard megadás: {text} (várt alak: I/N, pl. 0/4)")
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Érvénytelen shard: {text} (0 <= I < N szükséges)")
+    return index, count
+
+
+def shard_of(rel_path, count):
+    # Stabil hozzárendelés a gyökérhez képesti útvonal alapján (gépfüggetlen)
+    digest = hashlib.blake2b(rel_path.replace(os.sep, "/").encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % count
+
+
+def shard_path(shard_dir, index, count):
+    width = max(4, len(str(count)))
+    return os.path.join(shard_dir, f"shard-{index:0{width}d}-of-{count:0{width}d}.jsonl")
+
+
+def manifest_path(path):
+    return path[:-len(".jsonl")] + ".done.json"
+
+
+def select_shard(paths, root, index, count, selected):
+    # A felderített útvonalak közül az index. shard részét adja tovább; a selected
+    # listába/sorba kerül minden kiválasztott (felderítési sorszám, relatív útvonal) pár
+    for position, path in enumerate(paths):
+        rel_path = relative_name(path, root)
+        if shard_of(rel_path, count) == index:
+            selected.append((position, rel_path))
+            yield path
+
+
+def _to_json(value):
+    if hasattr(value, "item"):
+        return value.item()
+    return str(value)
+
+
+class ShardWriter:
+    # Részeredmény: soronként egy JSON objektum {"i": felderítési sorszám, "path": relatív
+    # útvonal, "row": a riport sora}. A JSON megőrzi a szám/szöveg típusokat és az
+    # oszlopsorrendet, így a merge ugyanazt a riportot adja, mint egy egygépes futás.
+
+    def __init__(self, output_path):
+        self.output_path = output_path
+        self.rows_written = 0
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        # Egy korábbi futás kész-jelölője törlődik, amíg ez a shard be nem fejeződik
+        if os.path.exists(manifest_path(output_path)):
+            os.remove(manifest_path(output_path))
+        self._file = open(output_path, "w", encoding="utf-8")
+
+    def write_entry(self, position, rel_path, row):
+        self._file.write(json.dumps({"i": position, "path": rel_path, "row": row},
+                                    default=_to_json, ensure_ascii=False))
+        self._file.write("\n")
+        self.rows_written += 1
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def write_manifest(output_path, index, count, summary):
+    # Kész-jelölő: csak a sikeresen befejezett shard kap ilyet (a merge ezt ellenőrzi)
+    manifest = {"shard": index, "of": count, "created": time.strftime("%Y-%m-%d %H:%M:%S"), **summary}
+    tmp = manifest_path(output_path) + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, manifest_path(output_path))
+
+
+def _read_entries(path):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                yield entry["i"], entry["path"], entry["row"]
+
+
+def find_shards(shard_dir):
+    # {shard sorszám: részeredmény fájl}, és a shardok száma (N)
+    found = {}
+    counts = set()
+    for path in glob.glob(os.path.join(shard_dir, "shard-*-of-*.jsonl")):
+        match = _SHARD_RE.search(os.path.basename(path))
+        if match:
+            index, count = int(match.group(1)), int(match.group(2))
+            found[index] = path
+            counts.add(count)
+    if len(counts) > 1:
+        raise ValueError(f"Eltérő shard-számú részeredmények a mappában: {sorted(counts)}")
+    return found, (counts.pop() if counts else 0)
+
+
+def merge_shards(shard_dir, output_path, output_format=None, allow_missing=False,
+                 flush_rows=RESULT_FLUSH_ROWS):
+    # A részeredmények egyesítése egy riportba a felderítési sorrendben
+    # (a shardok rendezett folyamait fésüljük össze, nem töltjük be őket egyszerre).
+    # Ugyanaz az útvonal csak egyszer kerül be. Hiányzó vagy befejezetlen shard
+    # esetén hiba, hacsak allow_missing nincs megadva.
+    # A sorok flush_rows soros ResultTable darabokban íródnak ki (a tábla az értékek
+    # int/float típusát is megőrzi, így a riport a soros futáséval azonos).
+    found, count = find_shards(shard_dir)
+    if not count:
+        raise FileNotFoundError(f"Nincs részeredmény a mappában: {shard_dir}")
+
+    complete = {i: p for i, p in found.items() if os.path.exists(manifest_path(p))}
+    missing = [i for i in range(count) if i not in complete]
+    if missing and not allow_missing:
+        raise RuntimeError(
+            f"Hiányzó vagy befejezetlen shardok ({len(missing)}/{count}): {', '.join(map(str, missing))}"
+        )
+
+    seen = set()
+    duplicates = 0
+    streams = [_read_entries(complete[i]) for i in sorted(complete)]
+    table = ResultTable(capacity=flush_rows)
+    with open_report_writer(output_path, output_format) as writer:
+        for _, rel_path, row in heapq.merge(*streams, key=lambda entry: entry[0]):
+            if rel_path in seen:
+                duplicates += 1
+                continue
+            seen.add(rel_path)
+            table.append(row)
+            if len(table) >= flush_rows:
+                table.flush_to(writer)
+        table.flush_to(writer)
+
+    return {
+        "output": output_path if writer.rows_written else None,
+        "shards": count,
+        "merged_shards": len(complete),
+        "missing_shards": missing,
+        "images": writer.rows_written,
+        "duplicates": duplicates,
+    }
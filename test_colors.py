@@ -0,0 +1,145 @@
+import os
+import shutil
+import tempfile
+import unittest
+from collections import Counter
+
+import numpy as np
+from PIL import Image
+
+import colors
+from features import HUE_RATIO_BINS
+
+
+def _write_images(root):
+    # Bélyegkép méretű (150×150, így nincs átméretezés) tesztképek: zaj, hue-átmenet
+    # változó telítettséggel, szürke kép, és két egyforma darabszámú szín (holtverseny)
+    rng = np.random.default_rng(11)
+    images = {
+        "zaj": rng.integers(0, 256, size=(150, 150, 3), dtype=np.uint8),
+    }
+    hue = np.tile(np.linspace(0, 255, 150, dtype=np.uint8), (150, 1))
+    sat = np.repeat(np.linspace(0, 255, 150, dtype=np.uint8)[:, None], 150, axis=1)
+    images["atmenet"] = np.asarray(Image.fromarray(np.dstack([hue, sat, np.full_like(hue, 200)]), "HSV").convert("RGB"))
+    images["szurke"] = np.full((150, 150, 3), 128, dtype=np.uint8) + rng.integers(0, 8, size=(150, 150, 1), dtype=np.uint8)
+    tie = np.zeros((150, 150, 3), dtype=np.uint8)
+    tie[:75] = (20, 40, 220)
+    tie[75:] = (220, 30, 20)
+    images["holtverseny"] = tie
+
+    paths = {}
+    for name, pixels in images.items():
+        paths[name] = os.path.join(root, f"{name}.png")
+        Image.fromarray(pixels).save(paths[name])
+    return paths
+
+
+# A vektorizált hue-vödrözés előtti, pixelenkénti számítások (referencia)
+
+def _reference_dominant_colors(pre, top_n=3):
+    H_deg = pre["H_deg"]
+    bins = np.array([colors.get_color_name(h) for h in H_deg.flatten()])
+    total = len(bins) if len(bins) else 1
+    out = []
+    for color, cnt in Counter(bins).most_common(top_n):
+        mask = (bins == color)
+        avg_hue = float(H_deg.flatten()[mask].mean()) if mask.any() else 0.0
+        out.append((color, colors.pct(cnt / total), round(avg_hue, 1)))
+    return out
+
+
+def _reference_color_distribution(pre):
+    H_deg = pre["H_deg"]
+    S = pre["hsv_np"][:, :, 1].astype(np.float32)
+    h, w = H_deg.shape
+    row_h, col_w = h // 3, w // 3
+
+    out = {}
+    for r_idx in range(3):
+        for c_idx in range(3):
+            y1, y2 = r_idx * row_h, (r_idx + 1) * row_h if r_idx < 2 else h
+            x1, x2 = c_idx * col_w, (c_idx + 1) * col_w if c_idx < 2 else w
+            Hd, Sd = H_deg[y1:y2, x1:x2], S[y1:y2, x1:x2]
+            total = Hd.size if Hd.size else 1
+            label = f"row{r_idx}_col{c_idx}"
+            out[f"Zold_{label}"] = float(((Hd >= 60) & (Hd <= 150)).sum() / total)
+            out[f"Kek_{label}"] = float(((Hd >= 180) & (Hd <= 260)).sum() / total)
+            out[f"Meleg_{label}"] = float((((Hd >= 0) & (Hd <= 60)) | ((Hd >= 300) & (Hd < 360))).sum() / total)
+            out[f"Szurke_{label}"] = float((Sd <= 40.0).sum() / total)
+    return out
+
+
+def _reference_hue_ratios(pre):
+    hist, _ = np.histogram(pre["H_deg"], bins=list(HUE_RATIO_BINS))
+    total = hist.sum() if hist.sum() > 0 else 1
+    return hist / total
+
+
+class HueBucketTest(unittest.TestCase):
+    # A lookup táblás / bincount-os hue statisztika ugyanazt adja, mint a pixelenkénti számítás
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp()
+        cls.paths = _write_images(cls.tmp)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp)
+
+    def _pres(self):
+        for name, path in self.paths.items():
+            yield name, colors.prepare_image(path)
+
+    def test_dominant_colors(self):
+        for name, pre in self._pres():
+            with self.subTest(image=name):
+                self.assertEqual(colors.get_dominant_colors_hsv(None, pre=pre), _reference_dominant_colors(pre))
+
+    def test_tie_keeps_first_occurrence(self):
+        # Egyforma darabszámnál a képen előbb előforduló szín áll előrébb (Counter sorrend)
+        pre = colors.prepare_image(self.paths["holtverseny"])
+        self.assertEqual([c for c, _, _ in colors.get_dominant_colors_hsv(None, pre=pre)][:2], ["Kék", "Piros"])
+
+    def test_color_distribution(self):
+        for name, pre in self._pres():
+            with self.subTest(image=name):
+                self.assertEqual(colors.get_color_distribution(None, pre=pre), _reference_color_distribution(pre))
+
+    def test_hue_ratios(self):
+        for name, pre in self._pres():
+            with self.subTest(image=name):
+                np.testing.assert_array_equal(
+                    colors.hue_range_ratios(pre, list(HUE_RATIO_BINS)), _reference_hue_ratios(pre)
+                )
+
+
+class VHistogramTest(unittest.TestCase):
+    # A dinamikatartomány a V hisztogramból: ugyanaz, mint az np.percentile a pixelértékeken
+
+    def test_hist_percentile_matches_np_percentile(self):
+        rng = np.random.default_rng(5)
+        samples = [
+            rng.integers(0, 256, size=10_000),
+            rng.normal(200, 30, size=777).clip(0, 255).astype(np.int64),  # sok azonos érték a felső végen
+            np.array([0, 255]),
+            np.full(5, 17),
+            np.array([3]),
+        ]
+        for values in samples:
+            hist = np.bincount(values, minlength=256)
+            for q in (0, 5, 37.5, 50, 95, 100):
+                with self.subTest(n=len(values), q=q):
+                    self.assertEqual(colors.hist_percentile(hist, q), np.percentile(values, q))
+
+    def test_strip_histogram_matches_full_conversion(self):
+        rng = np.random.default_rng(9)
+        img = Image.fromarray(rng.integers(0, 256, size=(101, 64, 3), dtype=np.uint8))
+        expected = np.bincount(np.asarray(img.convert("HSV"))[:, :, 2].ravel(), minlength=256)
+        for strip_pixels in (1, 64 * 7, 64 * 101, colors.V_HIST_STRIP_PIXELS):
+            with self.subTest(strip_pixels=strip_pixels):
+                np.testing.assert_array_equal(colors.v_histogram(img, strip_pixels), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
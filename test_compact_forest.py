@@ -0,0 +1,108 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import joblib
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+
+from compact_forest import CompactForest, compact_path, export_forest, load_forest, resolve_model_path
+
+FEATURES = [f"f{i}" for i in range(6)]
+
+
+def _train(n_estimators=15, seed=0):
+    # Kis erdő véletlen adatokon (három osztály), a becslés bemenetéhez hasonló float32 értékekkel
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(300, len(FEATURES))).astype(np.float32)
+    y = np.where(X[:, 0] + X[:, 1] > 0.5, "erdo", np.where(X[:, 2] < -0.3, "varos", "viz"))
+    model = RandomForestClassifier(n_estimators=n_estimators, random_state=seed, min_samples_leaf=2)
+    model.fit(X, y)
+    return model, X
+
+
+def _samples(model, X):
+    # A tanító sorok, új véletlen sorok, és a fák küszöbértékeire pontosan eső sorok
+    # (a float64 küszöb / float32 bemenet határeset, lásd compact_forest._threshold_down)
+    rng = np.random.default_rng(1)
+    fresh = rng.normal(size=(200, X.shape[1])).astype(np.float32)
+    on_threshold = np.tile(X[:1], (40, 1))
+    tree = model.estimators_[0].tree_
+    inner = np.flatnonzero(tree.children_left != -1)[:40]
+    on_threshold[np.arange(len(inner)), tree.feature[inner]] = tree.threshold[inner].astype(np.float32)
+    return np.vstack([X, fresh, on_threshold[:len(inner)]])
+
+
+class CompactForestTest(unittest.TestCase):
+    # A kompakt, vektorizált becslő ugyanazt adja, mint az sklearn predict_proba
+
+    @classmethod
+    def setUpClass(cls):
+        cls.model, X = _train()
+        cls.X = _samples(cls.model, X)
+        cls.tmp = tempfile.mkdtemp()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp)
+
+    def assert_same_proba(self, forest, expected):
+        np.testing.assert_allclose(forest.predict_proba(self.X), expected, rtol=0, atol=1e-12)
+
+    def test_matches_sklearn(self):
+        forest = CompactForest.from_model(self.model, FEATURES)
+        self.assertEqual(list(forest.classes_), list(self.model.classes_))
+        self.assert_same_proba(forest, self.model.predict_proba(self.X))
+        np.testing.assert_array_equal(forest.predict(self.X), self.model.predict(self.X))
+
+    def test_saved_file_matches_sklearn(self):
+        path = os.path.join(self.tmp, "modell.forest")
+        export_forest(self.model, FEATURES, path)
+        for mmap in (True, False):
+            with self.subTest(mmap=mmap):
+                forest = load_forest(path, mmap=mmap)
+                self.assertEqual(forest.feature_names, FEATURES)
+                self.assert_same_proba(forest, self.model.predict_proba(self.X))
+
+    def test_pruned_matches_first_trees(self):
+        # --compact-trees N: az első N fa átlaga
+        path = os.path.join(self.tmp, "reszleges.forest")
+        export_forest(self.model, FEATURES, path, n_trees=4)
+        expected = np.mean([tree.predict_proba(self.X) for tree in self.model.estimators_[:4]], axis=0)
+        self.assert_same_proba(load_forest(path), expected)
+
+    def test_empty_input(self):
+        forest = CompactForest.from_model(self.model, FEATURES)
+        self.assertEqual(forest.predict_proba(self.X[:0]).shape, (0, len(self.model.classes_)))
+
+
+class ResolveModelPathTest(unittest.TestCase):
+    # A kompakt fájl csak a saját forrás pickle-jével együtt töltődik be
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.pickle = os.path.join(self.tmp, "rf_model.pkl")
+        self.model, _ = _train()
+        joblib.dump((self.model, FEATURES), self.pickle)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_compact_used_for_its_source(self):
+        export_forest(self.model, FEATURES, compact_path(self.pickle), source_path=self.pickle)
+        self.assertEqual(resolve_model_path(self.pickle), compact_path(self.pickle))
+
+    def test_pickle_used_after_replacement(self):
+        export_forest(self.model, FEATURES, compact_path(self.pickle), source_path=self.pickle)
+        other, _ = _train(n_estimators=5, seed=3)
+        joblib.dump((other, FEATURES), self.pickle)
+        self.assertEqual(resolve_model_path(self.pickle), self.pickle)
+
+    def test_pickle_used_without_source(self):
+        export_forest(self.model, FEATURES, compact_path(self.pickle))
+        self.assertEqual(resolve_model_path(self.pickle), self.pickle)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+from PIL import Image
+
+import image_analyzer as ia
+import sharding
+from features import configure_structural, structural_config
+
+MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rf_model.pkl")
+
+
+def _write_images(root):
+    # Néhány véletlen kép almappákban, és egy teljesen fekete kép, amelynek
+    # fehéregyensúly cellái int 0-k (a többi sorban float értékek állnak)
+    rng = np.random.default_rng(7)
+    for i in range(7):
+        folder = os.path.join(root, f"{2020 + i % 3}")
+        os.makedirs(folder, exist_ok=True)
+        pixels = rng.integers(0, 256, size=(48 + i, 64, 3), dtype=np.uint8)
+        Image.fromarray(pixels).save(os.path.join(folder, f"img{i}.png"))
+    Image.new("RGB", (40, 30)).save(os.path.join(root, "2021", "black.png"))
+
+
+class ShardMergeTest(unittest.TestCase):
+    # A shardonként futtatott, majd egyesített riport bájtra azonos a soros futáséval
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.images = os.path.join(self.tmp, "kepek")
+        _write_images(self.images)
+        self._model_path = ia.MODEL_PATH
+        self._flush_rows = ia.RESULT_FLUSH_ROWS
+        self._structural = structural_config()
+        ia.MODEL_PATH = MODEL_PATH
+        configure_structural("full", 0)
+
+    def tearDown(self):
+        ia.MODEL_PATH = self._model_path
+        ia.RESULT_FLUSH_ROWS = self._flush_rows
+        configure_structural(**self._structural)
+        shutil.rmtree(self.tmp)
+
+    def _analyze(self, **kwargs):
+        return ia.analyze_folder(self.images, generate_histograms=False, workers=1, recursive=True,
+                                 verbose=False, **kwargs)
+
+    def _serial_and_merged(self, count, flush_rows=ia.RESULT_FLUSH_ROWS):
+        serial = os.path.join(self.tmp, "soros.csv")
+        self._analyze(output_path=serial)
+
+        shard_dir = os.path.join(self.tmp, "shards")
+        for index in range(count):
+            self._analyze(output_path=sharding.shard_path(shard_dir, index, count), shard=(index, count))
+        merged = os.path.join(self.tmp, "egyesitett.csv")
+        summary = sharding.merge_shards(shard_dir, merged, flush_rows=flush_rows)
+        self.assertEqual(summary["missing_shards"], [])
+
+        with open(serial, "rb") as f1, open(merged, "rb") as f2:
+            return f1.read(), f2.read()
+
+    def test_merge_equals_serial(self):
+        serial, merged = self._serial_and_merged(3)
+        self.assertIn(b"black.png", serial)
+        self.assertEqual(serial, merged)
+
+    def test_merge_equals_serial_across_flushes(self):
+        # Több, eltérő méretű kiírt darab: az értékek int/float típusa nem függ a darabolástól
+        ia.RESULT_FLUSH_ROWS = 3
+        serial, merged = self._serial_and_merged(2, flush_rows=5)
+        self.assertEqual(serial, merged)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,38 +1,352 @@
 import os
+import sys
+import json
+import math
+import time
+import random
+import argparse
+from concurrent.futures import ProcessPoolExecutor
 import joblib
 import numpy as np
 import pandas as pd
 from sklearn.ensemble import RandomForestClassifier
-from sklearn.model_selection import (
-    train_test_split, StratifiedKFold,
-    cross_val_score, GridSearchCV
-)
+from joblib import Parallel, delayed
+from sklearn.model_selection import StratifiedKFold, ParameterGrid
 from sklearn.metrics import classification_report, confusion_matrix
 from sklearn.utils.class_weight import compute_class_weight
-from features import extract_features_for_training
+from features import extract_features_for_training, structural_config, configure_structural
+from feature_store import TrainingFeatureStore, DEFAULT_STORE_PATH
+from discovery import iter_images
+from prefetch import bounded_map
+from compact_forest import CompactForest, compact_path, export_forest
 
 DATASET_DIR = "train_dataset"
 OUT_MODEL = "rf_model.pkl"
+CV_FOLDS = 5
 
+# hyperparaméter-rács
+PARAM_GRID = {
+    'n_estimators': [300, 500, 700],
+    'max_depth': [None, 10, 20],
+    'min_samples_leaf': [1, 2, 4],
+    'max_features': ['sqrt', 'log2']
+}
 
-def collect_training_data():
-    rows = []
-    for label in os.listdir(DATASET_DIR):
-        class_dir = os.path.join(DATASET_DIR, label)
-        if not os.path.isdir(class_dir):
-            continue
-        for fname in os.listdir(class_dir):
-            if fname.lower().endswith((".jpg", ".jpeg", ".png")):
-                full = os.path.join(class_dir, fname)
-                feat = extract_features_for_training(full)
-                feat["Kategoria"] = label
-                rows.append(feat)
+# Keresési stratégiák:
+#  grid    - a teljes rács (az eredeti viselkedés)
+#  random  - véletlen sorrendű jelöltek, amíg az időkeret engedi
+#  halving - successive halving: sok jelölt kevés fával, a legjobb 1/HALVING_FACTOR rész
+#            továbbjut, a fák száma minden körben HALVING_FACTOR-szorosára nő
+SEARCH_STRATEGIES = ("grid", "random", "halving")
+HALVING_FACTOR = 3
+
+# A fák száma / becslési idő összevetés alapértelmezett fa-számai (--tree-tradeoff)
+TRADEOFF_TREES = (25, 50, 100, 200, 300, 500, 700)
+TRADEOFF_LATENCY_ROWS = 256
+
+# Előre beállított profilok (a --search / --time-budget felülírja őket)
+PROFILES = {
+    "full": {"search": "grid", "time_budget": None},
+    "fast": {"search": "halving", "time_budget": 600},
+}
+
+
+def iter_training_images(dataset_dir=DATASET_DIR):
+    # (útvonal, címke) párok folyamatosan a <dataset>/<címke>/... szerkezetből;
+    # a címke mappáin belül az almappák is bejárásra kerülnek
+    with os.scandir(dataset_dir) as entries:
+        labels = sorted(entry.name for entry in entries if entry.is_dir())
+    for label in labels:
+        for path in iter_images(os.path.join(dataset_dir, label), recursive=True):
+            yield path, label
+
+
+def _init_worker(structural_cfg):
+    configure_structural(**structural_cfg)
+
+
+def _extract_task(item):
+    # Worker folyamatban futó kinyerés; a hibás kép nem állítja meg a tanítást
+    path, label = item
+    try:
+        return path, label, extract_features_for_training(path), None
+    except Exception as e:
+        return path, label, None, str(e)
+
+
+def extract_missing(store, items, workers=1, verbose=True):
+    # Csak a tárolóban még nem szereplő (vagy módosult) képek jellemzőit nyeri ki,
+    # és minden eredményt azonnal a tárolóba ír (megszakítás után folytatható).
+    # items lehet folyamatos forrás is: a kinyerés a bejárás közben indul.
+    todo = store.missing(items)
+
+    if workers == 1:
+        results = map(_extract_task, todo)
+        executor = None
+    else:
+        executor = ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(structural_config(),),
+        )
+        results = bounded_map(executor, _extract_task, todo, window=4 * workers)
+
+    done = failed = 0
+    t0 = time.perf_counter()
+    try:
+        for path, label, feat, error in results:
+            if feat is None:
+                failed += 1
+                print(f" Hiba a jellemzők kinyerésekor ({path}): {error}", file=sys.stderr)
+                continue
+            store.put(path, label, feat)
+            done += 1
+            if verbose and done % 500 == 0:
+                rate = done / (time.perf_counter() - t0)
+                print(f"  {done} kép kész ({rate:.1f} kép/s)")
+    finally:
+        store.commit()
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+    return done, failed
+
+
+def collect_training_data(dataset_dir=DATASET_DIR, store_path=DEFAULT_STORE_PATH, workers=1, verbose=True):
+    items = []
+
+    def discovered():
+        for item in iter_training_images(dataset_dir):
+            items.append(item)
+            yield item
+
+    with TrainingFeatureStore(store_path) as store:
+        done, failed = extract_missing(store, discovered(), workers=workers, verbose=verbose)
+        if verbose:
+            print(f" {len(items)} tanító kép: {len(items) - done - failed} a jellemzőtárolóból,"
+                  f" {done} újonnan feldolgozva, {failed} hibás.")
+        removed = store.prune(items)
+        if verbose and removed:
+            print(f" {removed} már nem létező kép törölve a jellemzőtárolóból.")
+        rows = store.load(items)
     return pd.DataFrame(rows)
 
 
-def main():
+def _fit_fold(params, X, y, train_idx, test_idx, class_weight):
+    # Egy jelölt egy foldja; a modell egyszálú, a párhuzamosítás a fold/jelölt szinten történik
+    model = RandomForestClassifier(random_state=42, n_jobs=1, class_weight=class_weight, **params)
+    model.fit(X[train_idx], y[train_idx])
+    return model.predict(X[test_idx])
+
+
+def evaluate_candidates(candidates, X, y, splits, class_weight, n_jobs, deadline=None):
+    # Jelöltek keresztvalidációja kötegekben (egyetlen párhuzamossági szint).
+    # Egy köteg annyi jelölt, amennyi foldja kitölti a magokat; az időkeret lejárta
+    # előtt, ha a következő köteg már nem férne bele, a kiértékelés leáll.
+    # Minden jelölthöz megmaradnak a fold pontosságok és az out-of-fold becslések.
+    cores = n_jobs if n_jobs > 0 else (os.cpu_count() or 1)
+    per_batch = max(1, cores // len(splits))
+    results = []
+    last_batch_s = 0.0
+
+    with Parallel(n_jobs=n_jobs) as parallel:
+        for start in range(0, len(candidates), per_batch):
+            if deadline is not None and results and time.perf_counter() + last_batch_s > deadline:
+                break
+            batch = candidates[start:start + per_batch]
+            t0 = time.perf_counter()
+            preds = parallel(
+                delayed(_fit_fold)(params, X, y, tr, te, class_weight)
+                for params in batch for tr, te in splits
+            )
+            last_batch_s = time.perf_counter() - t0
+
+            for i, params in enumerate(batch):
+                oof = np.empty(len(y), dtype=y.dtype)
+                scores = []
+                for (_, te), pred in zip(splits, preds[i * len(splits):(i + 1) * len(splits)]):
+                    oof[te] = pred
+                    scores.append(float(np.mean(pred == y[te])))
+                results.append({
+                    "params": params,
+                    "scores": scores,
+                    "mean": float(np.mean(scores)),
+                    "std": float(np.std(scores)),
+                    "oof": oof,
+                })
+    return results
+
+
+def search(X, y, class_weight, strategy="grid", time_budget=None, n_jobs=-1, param_grid=PARAM_GRID):
+    # Hyperparaméter-keresés; visszaadja a legjobb jelölt eredményét és a kiértékelt jelöltek számát
+    deadline = time.perf_counter() + time_budget if time_budget else None
+    splits = list(StratifiedKFold(n_splits=CV_FOLDS, shuffle=True, random_state=42).split(X, y))
+    best = lambda results: max(results, key=lambda r: r["mean"])
+
+    if strategy == "halving":
+        # A fák száma az erőforrás: a rács többi paraméterének kombinációi versenyeznek
+        max_trees = max(param_grid["n_estimators"])
+        grid = {k: v for k, v in param_grid.items() if k != "n_estimators"}
+        candidates = list(ParameterGrid(grid))
+        random.Random(42).shuffle(candidates)
+        rungs = max(1, math.ceil(math.log(len(candidates), HALVING_FACTOR)) + 1)
+
+        evaluated = 0
+        survivors = None
+        for rung in range(rungs):
+            trees = max(10, max_trees // HALVING_FACTOR ** (rungs - 1 - rung))
+            todo = [dict(c, n_estimators=trees) for c in candidates]
+            results = evaluate_candidates(todo, X, y, splits, class_weight, n_jobs, deadline)
+            evaluated += len(results)
+            if not results:
+                break
+            survivors = results
+            if len(results) < len(todo) or len(results) == 1:
+                break  # lejárt az időkeret, vagy már csak egy jelölt maradt
+            results.sort(key=lambda r: r["mean"], reverse=True)
+            keep = max(1, len(results) // HALVING_FACTOR)
+            candidates = [{k: v for k, v in r["params"].items() if k != "n_estimators"} for r in results[:keep]]
+        return best(survivors), evaluated
+
+    candidates = list(ParameterGrid(param_grid))
+    if strategy == "random":
+        random.Random(42).shuffle(candidates)
+    results = evaluate_candidates(candidates, X, y, splits, class_weight, n_jobs, deadline)
+    return best(results), len(results)
+
+
+def _fit_fold_forest(params, X, y, train_idx, class_weight, feature_names):
+    # Egy fold teljes erdeje kompakt formában (a fa-szám összevetéshez)
+    model = RandomForestClassifier(random_state=42, n_jobs=1, class_weight=class_weight, **params)
+    model.fit(X[train_idx], y[train_idx])
+    return CompactForest.from_model(model, feature_names)
+
+
+def _median_ms(func, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        times.append((time.perf_counter() - t0) * 1000.0)
+    return float(np.median(times))
+
+
+def tree_count_tradeoff(X, y, params, class_weight, counts, feature_names, n_jobs=-1, repeat=5):
+    # Pontosság és becslési idő a fák számának függvényében. Foldonként egy
+    # max(counts) fás erdő tanul (ugyanaz a CV felosztás, mint a keresésnél), és
+    # ennek első n fája becsül a kihagyott foldon; az erdő fái egymástól függetlenek,
+    # így ez egy n fás erdővel egyenértékű. Az idő a kompakt becslőé.
+    counts = sorted(set(counts))
+    splits = list(StratifiedKFold(n_splits=CV_FOLDS, shuffle=True, random_state=42).split(X, y))
+    params = dict(params, n_estimators=counts[-1])
+    forests = Parallel(n_jobs=n_jobs)(
+        delayed(_fit_fold_forest)(params, X, y, tr, class_weight, feature_names) for tr, _ in splits
+    )
+
+    full = [forest.predict(X[te]) for forest, (_, te) in zip(forests, splits)]
+    batch = X[np.arange(TRADEOFF_LATENCY_ROWS) % len(X)]
+    rows = []
+    for n_trees in counts:
+        correct = agree = 0
+        for forest, (_, te), full_pred in zip(forests, splits, full):
+            pred = forest.pruned(n_trees).predict(X[te])
+            correct += int(np.sum(pred == y[te]))
+            agree += int(np.sum(pred == full_pred))
+        forest = forests[0].pruned(n_trees)
+        nodes = int(forest.roots[n_trees]) if n_trees < len(forest.roots) else len(forest.feature)
+        rows.append({
+            "trees": n_trees,
+            "accuracy": round(correct / len(y), 4),
+            "agreement_with_full": round(agree / len(y), 4),
+            "latency_1_ms": round(_median_ms(lambda: forest.predict_proba(batch[:1]), repeat), 3),
+            f"latency_{TRADEOFF_LATENCY_ROWS}_ms": round(_median_ms(lambda: forest.predict_proba(batch), repeat), 3),
+            "nodes": nodes,
+        })
+    return rows
+
+
+def run_tree_tradeoff(args):
+    # A meglévő modell hiperparamétereivel: pontosság / idő a fák számának függvényében
+    if not os.path.exists(args.output):
+        print(f"A modell nem található: {args.output} (előbb tanítani kell)", file=sys.stderr)
+        return 1
+    model, feature_cols = joblib.load(args.output)
+    params = {k: model.get_params()[k] for k in PARAM_GRID}
+    counts = [int(c) for c in args.tree_tradeoff.split(",") if c.strip()]
+
+    df = collect_training_data(args.dataset, args.store, workers=args.workers or os.cpu_count() or 1)
+    df = df.fillna(0).sample(frac=1.0, random_state=42).reset_index(drop=True)
+    X = df[feature_cols].to_numpy(dtype=np.float32)
+    y = df["Kategoria"].to_numpy()
+    classes = np.array(sorted(np.unique(y)))
+    class_weight = dict(zip(classes, compute_class_weight('balanced', classes=classes, y=y)))
+
+    print(f"\n Fák száma / becslési idő ({CV_FOLDS}-fold CV, {len(y)} kép, paraméterek: {params})")
+    rows = tree_count_tradeoff(X, y, params, class_weight, counts, list(feature_cols), n_jobs=args.jobs)
+    print(f"  {'fák':>5} {'pontosság':>10} {'egyezés':>8} {'1 kép':>9} {TRADEOFF_LATENCY_ROWS:>5} kép {'csomópont':>10}")
+    for row in rows:
+        print(f"  {row['trees']:>5} {row['accuracy']:>10.3f} {row['agreement_with_full']:>8.3f}"
+              f" {row['latency_1_ms']:>7.2f}ms {row[f'latency_{TRADEOFF_LATENCY_ROWS}_ms']:>7.2f}ms {row['nodes']:>10}")
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump({"params": params, "images": len(y), "tradeoff": rows}, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+def run_export(args):
+    # Kompakt modell a meglévő pickle-ből (--compact-trees: csak az első N fa)
+    model, feature_cols = joblib.load(args.output)
+    path = compact_path(args.output)
+    forest = export_forest(model, list(feature_cols), path, n_trees=args.compact_trees, source_path=args.output)
+    print(f" Kompakt modell elmentve: {path} ({forest.n_estimators} fa, {os.path.getsize(path) / 1024:.0f} kB)")
+    return 0
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Random Forest modell tanítása a tanító képekből")
+    parser.add_argument("--dataset", default=DATASET_DIR, help="Tanító képek mappája (<címke>/<kép>)")
+    parser.add_argument("--store", default=DEFAULT_STORE_PATH,
+                        help="Jellemzőtároló (SQLite); újratanításkor csak az új képek kerülnek feldolgozásra")
+    parser.add_argument("-w", "--workers", type=int, default=0,
+                        help="Párhuzamos kinyerő folyamatok száma (0 = összes CPU mag)")
+    parser.add_argument("-o", "--output", default=OUT_MODEL, help="A mentett modell fájlja")
+    parser.add_argument("--profile", choices=PROFILES, default="full",
+                        help="full = teljes rács időkorlát nélkül, fast = successive halving 10 perces kerettel")
+    parser.add_argument("--search", choices=SEARCH_STRATEGIES, default=None,
+                        help="Keresési stratégia (felülírja a profilt)")
+    parser.add_argument("--time-budget", type=float, default=None,
+                        help="A hyperparaméter-keresés időkerete másodpercben (felülírja a profilt)")
+    parser.add_argument("-j", "--jobs", type=int, default=-1,
+                        help="Párhuzamos tanítások száma a keresésben (-1 = összes CPU mag)")
+    parser.add_argument("--report", default=None,
+                        help="Tanítási összesítő (idő, pontosság, paraméterek) JSON fájlba")
+    parser.add_argument("--compact-trees", type=int, default=None,
+                        help="A kompakt modellbe (rf_model.forest) csak az első N fa kerül (alapból mind)")
+    parser.add_argument("--export-compact", action="store_true",
+                        help="Csak a kompakt modell elkészítése a meglévő -o modellből (tanítás nélkül)")
+    parser.add_argument("--tree-tradeoff", nargs="?", const=",".join(map(str, TRADEOFF_TREES)), default=None,
+                        metavar="N1,N2,...",
+                        help="Tanítás helyett: CV pontosság és becslési idő a fák számának függvényében "
+                             "a meglévő modell hiperparamétereivel")
+    args = parser.parse_args(argv)
+    profile = PROFILES[args.profile]
+    if args.search is None:
+        args.search = profile["search"]
+    if args.time_budget is None:
+        args.time_budget = profile["time_budget"]
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv if argv is not None else sys.argv[1:])
+    if args.export_compact:
+        return run_export(args)
+    if args.tree_tradeoff:
+        return run_tree_tradeoff(args)
+    workers = args.workers or os.cpu_count() or 1
+    t_start = time.perf_counter()
+
     print("Tanító képek beolvasása...")
-    df = collect_training_data()
+    df = collect_training_data(args.dataset, args.store, workers=workers)
 
     print("\nTanító adatok előnézete:")
     print(df.head())
@@ -56,47 +370,34 @@ def main():
     class_weights = compute_class_weight('balanced', classes=classes, y=y)
     class_weight_dict = {c: w for c, w in zip(classes, class_weights)}
 
-    # hyperparaméter-rács
-    param_grid = {
-        'n_estimators': [300, 500, 700],
-        'max_depth': [None, 10, 20],
-        'min_samples_leaf': [1, 2, 4],
-        'max_features': ['sqrt', 'log2']
-    }
-    base_rf = RandomForestClassifier(
-        random_state=42, n_jobs=-1, class_weight=class_weight_dict
-    )
-    grid_search = GridSearchCV(
-        estimator=base_rf,
-        param_grid=param_grid,
-        cv=StratifiedKFold(n_splits=5, shuffle=True, random_state=42),
-        scoring='accuracy',
-        n_jobs=-1
+    # hyperparaméter-keresés (a fák egyszálúak, a foldok/jelöltek futnak párhuzamosan)
+    budget = f", időkeret: {args.time_budget:.0f} s" if args.time_budget else ""
+    print(f"\n Keresés: {args.search}{budget}")
+    t_search = time.perf_counter()
+    result, evaluated = search(
+        X.to_numpy(), y.to_numpy(), class_weight_dict,
+        strategy=args.search, time_budget=args.time_budget, n_jobs=args.jobs,
     )
-    grid_search.fit(X, y)
-    rf_best = grid_search.best_estimator_
-    print("\nLegjobb hiperparaméterek:", grid_search.best_params_)
+    search_s = time.perf_counter() - t_search
+    best_params = result["params"]
+    print(f"\nLegjobb hiperparaméterek ({evaluated} kiértékelt jelölt, {search_s:.1f} s):", best_params)
 
-    # hold‑out validáció
-    X_tr, X_te, y_tr, y_te = train_test_split(
-        X, y, test_size=0.2, random_state=42, stratify=y
-    )
-    rf_hold = rf_best.fit(X_tr, y_tr)
-    print("\nHold-out pontosság (20% teszt):", f"{rf_hold.score(X_te, y_te):.3f}")
-    y_pred = rf_hold.predict(X_te)
-    print("\nRészletes jelentés:")
-    print(classification_report(y_te, y_pred, digits=3))
+    # a keresés out-of-fold becsléseiből (nincs külön hold-out újratanítás)
+    y_pred = result["oof"]
+    print("\nRészletes jelentés (out-of-fold):")
+    print(classification_report(y, y_pred, digits=3))
     print("Konfúziós mátrix:")
-    print(confusion_matrix(y_te, y_pred))
+    print(confusion_matrix(y, y_pred, labels=classes))
 
-    # 5-fold CV a legjobb modellel
-    cv = StratifiedKFold(n_splits=5, shuffle=True, random_state=42)
-    cv_scores = cross_val_score(rf_best, X, y, cv=cv, n_jobs=-1)
-    print("\n 5-fold CV pontosságok:", [f"{s:.3f}" for s in cv_scores])
-    print("Átlag ± szórás:", f"{cv_scores.mean():.3f} ± {cv_scores.std():.3f}")
+    print(f"\n {CV_FOLDS}-fold CV pontosságok:", [f"{s:.3f}" for s in result["scores"]])
+    print("Átlag ± szórás:", f"{result['mean']:.3f} ± {result['std']:.3f}")
 
-    # végső modell
-    rf_final = rf_best.fit(X, y)
+    # végső modell: egyetlen tanítás a teljes adaton
+    t_fit = time.perf_counter()
+    rf_final = RandomForestClassifier(
+        random_state=42, n_jobs=-1, class_weight=class_weight_dict, **best_params
+    ).fit(X, y)
+    fit_s = time.perf_counter() - t_fit
     # jellemzőfontosságok
     fi = rf_final.feature_importances_
     feature_cols = X.columns
@@ -105,9 +406,34 @@ def main():
     for name, val in top:
         print(f"  {name}: {val:.3f}")
 
-    joblib.dump((rf_final, list(feature_cols)), OUT_MODEL)
-    print(f"\n Modell elmentve: {OUT_MODEL}")
+    joblib.dump((rf_final, list(feature_cols)), args.output)
+    print(f"\n Modell elmentve: {args.output}")
+    forest = export_forest(rf_final, list(feature_cols), compact_path(args.output), n_trees=args.compact_trees,
+                           source_path=args.output)
+    print(f" Kompakt modell elmentve: {compact_path(args.output)} ({forest.n_estimators} fa)")
+
+    time_to_model = time.perf_counter() - t_start
+    print(f" Modellig eltelt idő: {time_to_model:.1f} s (keresés: {search_s:.1f} s, végső tanítás: {fit_s:.1f} s),"
+          f" CV pontosság: {result['mean']:.3f}")
+
+    if args.report:
+        report = {
+            "profile": args.profile,
+            "search": args.search,
+            "time_budget_s": args.time_budget,
+            "images": len(df),
+            "candidates_evaluated": evaluated,
+            "best_params": best_params,
+            "cv_accuracy_mean": round(result["mean"], 4),
+            "cv_accuracy_std": round(result["std"], 4),
+            "cv_scores": [round(s, 4) for s in result["scores"]],
+            "search_s": round(search_s, 3),
+            "final_fit_s": round(fit_s, 3),
+            "time_to_model_s": round(time_to_model, 3),
+        }
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2, default=str)
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())